@@ -5,6 +5,8 @@ from . import sale_workflow_process
 from . import sale_order
 from . import product_product
 from . import stock_quant
+from . import stock_move
+from . import stock_change_journal_ept
 from . import stock_quant_package
 from . import stock_picking
 from . import product_pricelist
@@ -1,10 +1,46 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 import base64
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+_logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = ["image/jpeg", "image/png", "image/tiff", "image/vnd.microsoft.icon", "image/x-icon",
+               "image/vnd.djvu", "image/svg+xml", "image/gif", "image/webp"]
+
+# One keep-alive session per thread, requests.Session is not guaranteed to be thread safe.
+_image_session = threading.local()
+
+
+def get_image_session():
+    """
+    Returns the persistent requests session of the current thread.
+    """
+    session = getattr(_image_session, "session", None)
+    if session is None:
+        session = _image_session.session = requests.Session()
+    return session
+
+
+def fetch_image(url, verify=False):
+    """
+    Downloads an image with the persistent session of the current thread.
+    :param url: Image URL.
+    :param verify: True/False
+    :return: Base64 encoded image, False when the URL is not a valid image.
+    """
+    response = get_image_session().get(url, verify=verify, timeout=10)
+    if response.status_code == 200 and response.headers.get("Content-Type") in IMAGE_TYPES and response.content:
+        return base64.b64encode(response.content)
+    return False
+
 
 class ProductImageEpt(models.Model):
     _name = 'common.product.image.ept'
@@ -17,6 +53,16 @@ class ProductImageEpt(models.Model):
     image = fields.Image()
     url = fields.Char(string="Image URL", help="External URL of image")
     sequence = fields.Integer(help="Sequence of images.", index=True, default=10)
+    image_hash = fields.Char(compute="_compute_image_hash", store=True, index=True,
+                             help="MD5 checksum of the image, used to find an existing image without reading it.")
+
+    @api.depends("image")
+    def _compute_image_hash(self):
+        """
+        Computes the checksum of the base64 image, the same way the connectors compare the downloaded images.
+        """
+        for record in self:
+            record.image_hash = hashlib.md5(record.image).hexdigest() if record.image else False
 
     @api.model
     def get_image_ept(self, url, verify=False):
@@ -26,16 +72,38 @@ class ProductImageEpt(models.Model):
         :param: verify: True/False
         :return: image
         """
-        image_types = ["image/jpeg", "image/png", "image/tiff",
-                       "image/vnd.microsoft.icon", "image/x-icon",
-                       "image/vnd.djvu", "image/svg+xml", "image/gif"]
-        response = requests.get(url, stream=True, verify=verify, timeout=10)
-        if response.status_code == 200 and response.headers["Content-Type"] in image_types:
-            image = base64.b64encode(response.content)
-            if image:
-                return image
+        image = fetch_image(url, verify=verify)
+        if image:
+            return image
         raise UserError(_("Can't find image.\nPlease provide valid Image URL."))
 
+    @api.model
+    def get_images_ept(self, urls, verify=False):
+        """
+        Define this method for download the images of many URLs concurrently. Every URL is downloaded only once,
+        by a bounded pool of threads which reuse their keep-alive session.
+        :param: urls: list of image urls
+        :param: verify: True/False
+        :return: dict {url: image}, the image is False when it could not be downloaded.
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        if not urls:
+            return {}
+        max_workers = int(self.env["ir.config_parameter"].sudo().get_param(
+            "common_connector_library.image_fetch_workers", 8) or 8)
+
+        def _fetch(url):
+            try:
+                return fetch_image(url, verify=verify)
+            except Exception as error:
+                _logger.warning("Image %s is not downloaded: %s", url, error)
+                return False
+
+        if max_workers <= 1 or len(urls) == 1:
+            return {url: _fetch(url) for url in urls}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+            return dict(zip(urls, executor.map(_fetch, urls)))
+
     # @api.model
     # def default_get(self, fields):
     #     """
@@ -52,12 +120,14 @@ class ProductImageEpt(models.Model):
         :param: vals_list: list of values
         :return: common.product.image.ept()
         """
+        verify = 'ssl_verify' in list(self.env.context.keys())
+        images = self.get_images_ept([vals.get("url") for vals in vals_list if not vals.get("image", False)],
+                                     verify=verify)
         for vals in vals_list:
-            verify = False
             if not vals.get("image", False) and vals.get("url", ""):
-                if 'ssl_verify' in list(self.env.context.keys()):
-                    verify = True
-                image = self.get_image_ept(vals.get("url"), verify=verify)
+                image = images.get(vals.get("url"))
+                if not image:
+                    raise UserError(_("Can't find image.\nPlease provide valid Image URL."))
                 vals.update({"image": image})
         records = super(ProductImageEpt, self).create(vals_list)
         ir_config_parameter_obj = self.env['ir.config_parameter']
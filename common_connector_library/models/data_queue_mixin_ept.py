@@ -95,3 +95,21 @@ class DataQueueMixinEpt(models.AbstractModel):
                     self._cr.execute(query, params)
                 self._cr.execute(query1, params1)
         return True
+
+    def get_queue_line_state_count_ept(self, line_model, queue_field, queues):
+        """
+        Define this method for count the queue lines of the queues by state, with one grouped query for all the
+        queues instead of loading and filtering their lines.
+        :param line_model: name of the queue line model, like shopify.order.data.queue.line.ept
+        :param queue_field: name of the many2one field of the queue line to its queue
+        :param queues: records of the queues
+        :return: dictionary like {queue_id: {state: count}}
+        """
+        counts = {}
+        queue_ids = [queue_id for queue_id in queues.ids if isinstance(queue_id, int)]
+        if not queue_ids:
+            return counts
+        for queue, state, count in self.env[line_model]._read_group([(queue_field, "in", queue_ids)],
+                                                                    [queue_field, "state"], ["__count"]):
+            counts.setdefault(queue.id, {})[state] = count
+        return counts
@@ -135,6 +135,23 @@ class ProductProduct(models.Model):
         params = (date, company.id)
         self._cr.execute(mrp_qry, params)
 
+    def get_bom_products_of_components_ept(self, product_ids):
+        """
+        Define this method for get the BOM type of products having one of the
+        given products as component, as get_product_movement_of_bom_product does
+        for the moved components.
+        :param: product_ids: list of product.product() ids
+        :return: list of product.product() ids
+        """
+        if not product_ids or not self.search_installed_module_ept('mrp'):
+            return []
+        qry = """select distinct p.id from product_product as p
+                    inner join mrp_bom as mb on mb.product_tmpl_id=p.product_tmpl_id
+                    inner join mrp_bom_line as ml on ml.bom_id=mb.id
+                    where ml.product_id in %s"""
+        self._cr.execute(qry, (tuple(product_ids),))
+        return [row[0] for row in self._cr.fetchall()]
+
     def prepare_location_and_product_ids(self, warehouse, product_list):
         """
         This method prepares location and product ids from warehouse and list of product id.
@@ -329,6 +346,117 @@ class ProductProduct(models.Model):
                 onhand_qty.update({i.get('product_id'): i.get('stock')})
         return onhand_qty
 
+    def get_qty_matrix_ept(self, location_products, qty_type="free_qty"):
+        """
+        Define this method for get the stock of many (warehouses, products) pairs from one grouped query, instead of
+        one get_free_qty_ept, get_forecasted_qty_ept or get_onhand_qty_ept call per pair. The stock locations are
+        matched on the parent_path prefix of the stock location of the warehouses and the kit products are computed
+        from their components in the same pass.
+        :param: location_products: list of tuple (key, stock.warehouse(), list of product.product() ids), the key
+        identifies the pair in the result, e.g. the id of the marketplace location.
+        :param: qty_type: 'free_qty', 'qty_available' or 'virtual_available'
+        :return: dict {key: {product id: qty}}
+        """
+        kit_boms = {}
+        if self.search_installed_module_ept('mrp'):
+            product_ids = {product_id for _key, _warehouses, products in location_products for product_id in products}
+            kit_boms = self.get_kit_bom_lines_ept(self.browse(list(product_ids)))
+
+        keys, root_keys, root_paths, product_keys, product_ids = [], [], [], [], []
+        for index, (key, warehouses, products) in enumerate(location_products):
+            keys.append(key)
+            for location in warehouses.lot_stock_id:
+                root_keys.append(index)
+                root_paths.append(location.parent_path)
+            needed_products = set()
+            for product_id in products:
+                if product_id in kit_boms:
+                    needed_products.update(component.id for component, _qty in kit_boms[product_id])
+                else:
+                    needed_products.add(product_id)
+            product_keys.extend([index] * len(needed_products))
+            product_ids.extend(needed_products)
+
+        stock = {}
+        if root_keys and product_ids:
+            self.env['stock.quant'].flush_model(['product_id', 'location_id', 'quantity', 'reserved_quantity'])
+            self.env['stock.move'].flush_model(['product_id', 'location_dest_id', 'product_qty', 'state'])
+            self._cr.execute(self.prepare_qty_matrix_query(qty_type), {
+                'root_keys': root_keys, 'root_paths': root_paths, 'product_keys': product_keys,
+                'product_ids': product_ids})
+            for index, product_id, qty in self._cr.fetchall():
+                stock[(index, product_id)] = qty
+
+        result = {}
+        for index, (key, _warehouses, products) in enumerate(location_products):
+            qty_by_product = result.setdefault(key, {})
+            for product_id in products:
+                if product_id in kit_boms:
+                    ratios = [stock.get((index, component.id), 0.0) / qty_per_kit for component, qty_per_kit in
+                              kit_boms[product_id]]
+                    qty_by_product[product_id] = max(min(ratios) // 1, 0) if ratios else 0
+                else:
+                    qty_by_product[product_id] = stock.get((index, product_id), 0.0)
+        return result
+
+    def prepare_qty_matrix_query(self, qty_type):
+        """
+        Define this method for prepare the grouped query of the stock matrix.
+        :param: qty_type: 'free_qty', 'qty_available' or 'virtual_available'
+        :return: Prepared query in string.
+        """
+        quant_qty = "sq.quantity" if qty_type == "qty_available" else "sq.quantity - sq.reserved_quantity"
+        query = """
+            WITH roots AS (SELECT * FROM unnest(%%(root_keys)s::int[], %%(root_paths)s::varchar[])
+                           AS root(key_index, parent_path)),
+                 requested AS (SELECT * FROM unnest(%%(product_keys)s::int[], %%(product_ids)s::int[])
+                               AS requested(key_index, product_id)),
+                 locations AS (SELECT DISTINCT roots.key_index, sl.id AS location_id
+                               FROM roots
+                               INNER JOIN stock_location sl ON sl.parent_path LIKE roots.parent_path || '%%%%'),
+                 stock AS (SELECT locations.key_index, sq.product_id, %s AS qty
+                           FROM locations
+                           INNER JOIN stock_quant sq ON sq.location_id = locations.location_id""" % quant_qty
+        if qty_type == "virtual_available":
+            query += """
+                           UNION ALL
+                           SELECT locations.key_index, sm.product_id, sm.product_qty AS qty
+                           FROM locations
+                           INNER JOIN stock_move sm ON sm.location_dest_id = locations.location_id
+                           AND sm.state = 'assigned'"""
+        query += """)
+            SELECT requested.key_index, requested.product_id, SUM(stock.qty)
+            FROM stock
+            INNER JOIN requested ON requested.key_index = stock.key_index AND requested.product_id = stock.product_id
+            GROUP BY requested.key_index, requested.product_id"""
+        return query
+
+    def get_kit_bom_lines_ept(self, products):
+        """
+        Define this method for get the storable components of the kit products with their quantity per kit, in
+        the unit of measure of the component.
+        :param: products: product.product()
+        :return: dict {kit product id: [(product.product(), qty per kit)]}
+        """
+        kit_boms = {}
+        boms = self.env['mrp.bom'].sudo()._bom_find(products, bom_type='phantom')
+        for product, bom in boms.items():
+            if not bom:
+                continue
+            _boms, bom_lines = bom.explode(product, 1)
+            components = []
+            for bom_line, bom_line_data in bom_lines:
+                component = bom_line.product_id
+                if not component.is_storable or not bom_line_data['qty']:
+                    continue
+                qty_per_kit = bom_line.product_uom_id._compute_quantity(
+                    bom_line_data['qty'] / bom_line_data['original_qty'], component.uom_id, round=False,
+                    raise_if_failure=False)
+                if qty_per_kit:
+                    components.append((component, qty_per_kit))
+            kit_boms[product.id] = components
+        return kit_boms
+
     def _prepare_out_svl_vals(self, quantity, company):
         """
         This method is used if MRP installed, BOM type is Manufacturing
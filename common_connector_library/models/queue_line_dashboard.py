@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
-from odoo import models
-from psycopg2 import sql
+from datetime import datetime, time, timedelta
+
+from odoo import models, fields
+from odoo.tools import SQL
 
 ALL_QUEUE_TABLES = [
     # All connector Queues
@@ -30,43 +32,71 @@ class QueueLineDashboard(models.AbstractModel):
 
     def get_data(self, **kwargs):
         """
-        This method is use to prepare data for the queue line dashboard.
+        This method is use to prepare data for the queue line dashboard. All the counts of a table are computed
+        with one grouped query, the records of a tile are searched by its domain only when the tile is clicked.
         :param: kwargs: dict {}
-        :return: dashboard_data: It will return the list of data like
-        [{'state': {'duration': [len of record, [queue_line_ids]]}},]
+        :return: dashboard_data: It will return the dict of data like
+        {'duration_state': [count of records, domain of records], 'duration': [count of records, domain of records]}
         """
-        table = kwargs.get('table', '').replace('.', '_')
+        model_name = kwargs.get('table', '')
+        table = model_name.replace('.', '_')
+        today = datetime.combine(fields.Date.today(), time.min)
+        yesterday = today - timedelta(days=1)
+        duration_domains = {
+            'all': [],
+            'today': [('create_date', '>=', fields.Datetime.to_string(today))],
+            'yesterday': [('create_date', '>=', fields.Datetime.to_string(yesterday)),
+                          ('create_date', '<', fields.Datetime.to_string(today))],
+        }
+        domain = self._prepare_dashboard_domain(table)
+        counts = self._get_dashboard_counts(model_name, table, domain, today, yesterday)
+
         data = dict()
-        for duration in ['all', 'today', 'yesterday']:
-            count, all_ids = 0, list()
+        for duration, duration_domain in duration_domains.items():
+            count = 0
             for state in ['draft', 'done', 'failed', 'cancel']:
-                key = f"{duration}_{state}"
-                line_ids = self._prepare_query(duration, state, table)
-                count += len(line_ids)
-                all_ids += line_ids
-                data.update({key: [len(line_ids), line_ids]})
-            data.update({duration: [count, all_ids]})
-        data.update({'model': kwargs.get('table')})
+                state_count = counts.get(state, {}).get(duration, 0)
+                count += state_count
+                data.update({f"{duration}_{state}": [state_count,
+                                                     domain + duration_domain + [('state', '=', state)]]})
+            data.update({duration: [count, domain + duration_domain + [('state', 'in', ['draft', 'done', 'failed',
+                                                                                        'cancel'])]]})
+        data.update({'model': model_name})
         return data
 
-    def _prepare_query(self, duration, state, table):
+    def _prepare_dashboard_domain(self, table):
         """
-        Define this method for prepare query for get respective table data.
-        :param: duration: selected record duration
-        :param: state: record state
+        Define this method for prepare the domain of the queue lines shown in the dashboard of the table. The
+        connectors override it to filter the lines of a queue type.
         :param: table: table name
-        :return: list of record ids
+        :return: domain
         """
-        if table not in ALL_QUEUE_TABLES:
-            return []
+        return []
 
-        qry = sql.SQL("SELECT id FROM {} WHERE state = %s").format(sql.Identifier(table))
-        if duration == 'today':
-            qry += sql.SQL(" AND create_date >= CURRENT_DATE")
-        elif duration == 'yesterday':
-            qry += sql.SQL(" AND create_date BETWEEN CURRENT_DATE - INTERVAL '1' DAY AND CURRENT_DATE")
-        self._cr.execute(qry, (state,))
+    def _get_dashboard_counts(self, model_name, table, domain, today, yesterday):
+        """
+        Define this method for count the queue lines of the table by state, for all the durations at once.
+        :param: model_name: queue line model name
+        :param: table: table name
+        :param: domain: domain of the queue lines shown in the dashboard
+        :param: today: start of today
+        :param: yesterday: start of yesterday
+        :return: dict like {state: {duration: count}}
+        """
+        if table not in ALL_QUEUE_TABLES or model_name not in self.env:
+            return {}
 
-        # Fetch the results and return the list of ids
-        line_ids = self._cr.dictfetchall()
-        return [line_id.get('id') for line_id in line_ids]
\ No newline at end of file
+        query = self.env[model_name]._search(domain)
+        create_date = SQL.identifier(query.table, 'create_date')
+        self._cr.execute(SQL("""
+            SELECT %(state)s,
+                   COUNT(*),
+                   COUNT(*) FILTER (WHERE %(create_date)s >= %(today)s),
+                   COUNT(*) FILTER (WHERE %(create_date)s >= %(yesterday)s AND %(create_date)s < %(today)s)
+            FROM %(from_clause)s
+            WHERE %(where_clause)s
+            GROUP BY 1
+        """, state=SQL.identifier(query.table, 'state'), create_date=create_date, today=today, yesterday=yesterday,
+                             from_clause=query.from_clause, where_clause=query.where_clause or SQL("TRUE")))
+        return {state: {'all': all_count, 'today': today_count, 'yesterday': yesterday_count}
+                for state, all_count, today_count, yesterday_count in self._cr.fetchall()}
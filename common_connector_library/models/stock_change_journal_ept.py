@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from datetime import timedelta
+from odoo import models, fields, api
+
+
+class StockChangeJournalEpt(models.Model):
+    _name = "stock.change.journal.ept"
+    _description = "Stock Change Journal"
+    _log_access = False
+    _order = "id"
+
+    product_id = fields.Many2one("product.product", required=True, ondelete="cascade", readonly=True)
+    warehouse_id = fields.Many2one("stock.warehouse", required=True, ondelete="cascade", readonly=True)
+    company_id = fields.Many2one("res.company", readonly=True)
+    change_date = fields.Datetime(required=True, index=True, readonly=True)
+
+    # Entries are consumed from a cursor which is a transaction id watermark, not an entry id: a transaction which
+    # started earlier can commit an entry with a lower id at any time later, while every transaction with an id
+    # lower than the xmin of a snapshot has ended and its entries are visible in that snapshot.
+    _retention = timedelta(days=7)
+
+    def init(self):
+        """
+        Creates the bigint column of the id of the transaction which wrote the entry, it is out of the ORM as
+        the integer fields are 32 bits.
+        """
+        self._cr.execute("""
+            ALTER TABLE stock_change_journal_ept ADD COLUMN IF NOT EXISTS transaction_id bigint;
+            CREATE INDEX IF NOT EXISTS stock_change_journal_ept_transaction_id_index
+                ON stock_change_journal_ept (transaction_id);
+        """)
+
+    @api.model
+    def record_stock_change_ept(self, changes):
+        """
+        Define this method for append the changed product and warehouse pairs to the journal.
+        :param: changes: iterable of tuple (product id, warehouse id, company id)
+        :return: True
+        """
+        changes = {change for change in changes if change[0] and change[1]}
+        if not changes:
+            return True
+        product_ids, warehouse_ids, company_ids = zip(*changes)
+        self._cr.execute("""
+            INSERT INTO stock_change_journal_ept (product_id, warehouse_id, company_id, change_date, transaction_id)
+            SELECT product_id, warehouse_id, company_id, NOW() AT TIME ZONE 'UTC', txid_current()
+            FROM unnest(%s::int[], %s::int[], %s::int[]) AS change(product_id, warehouse_id, company_id)
+        """, (list(product_ids), list(warehouse_ids), [company_id or None for company_id in company_ids]))
+        return True
+
+    @api.model
+    def get_changed_products_ept(self, cursor, warehouses):
+        """
+        Define this method for get the products changed in the warehouses since the cursor. The BOM type of
+        products of the changed components are included, as their stock depends on the components.
+        The entries of the transactions still running at the previous call are read again, so the entries they
+        committed since then are not lost and a product can be returned by two calls in a row.
+        :param: cursor: int, transaction watermark returned by the previous call or get_last_journal_cursor_ept
+        :param: warehouses: stock.warehouse()
+        :return: tuple (list of product.product() ids, new cursor)
+        """
+        cursor = int(cursor)
+        if not warehouses:
+            return [], cursor
+        # Both values are read from the same snapshot, so the entries of every transaction below the new
+        # watermark are part of the products.
+        self._cr.execute("""
+            SELECT (SELECT array_agg(DISTINCT product_id)
+                    FROM stock_change_journal_ept
+                    WHERE transaction_id >= %s AND warehouse_id IN %s),
+                   txid_snapshot_xmin(txid_current_snapshot())
+        """, (cursor, tuple(warehouses.ids)))
+        product_ids, new_cursor = self._cr.fetchone()
+        product_ids = product_ids or []
+        bom_product_ids = self.env['product.product'].get_bom_products_of_components_ept(product_ids)
+        return list(set(product_ids + bom_product_ids)), new_cursor
+
+    @api.model
+    def get_last_journal_cursor_ept(self):
+        """
+        Define this method for get the cursor which skips the journal entries of all the ended transactions. It
+        is never 0, so a consumer seeded with it reads the journal from its next call even if it is empty.
+        :return: int
+        """
+        self._cr.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return self._cr.fetchone()[0]
+
+    @api.autovacuum
+    def _gc_stock_change_journal_ept(self):
+        """
+        Define this method for delete the journal entries older than the retention period.
+        """
+        self._cr.execute("DELETE FROM stock_change_journal_ept WHERE change_date < NOW() AT TIME ZONE 'UTC' - %s",
+                         (self._retention,))
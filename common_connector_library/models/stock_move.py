@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models
+
+
+class StockMove(models.Model):
+    _inherit = "stock.move"
+
+    def write(self, vals):
+        """
+        Inherited this method for journal the products of the moves which state changes, as it changes the
+        forecasted quantity of the warehouses.
+        :param: dict {}
+        :return: True/False
+        """
+        res = super(StockMove, self).write(vals)
+        if 'state' in vals and self:
+            changes = []
+            for move in self:
+                for location in (move.location_id, move.location_dest_id):
+                    if location.warehouse_id:
+                        changes.append((move.product_id.id, location.warehouse_id.id, move.company_id.id))
+            self.env['stock.change.journal.ept'].sudo().record_stock_change_ept(changes)
+        return res
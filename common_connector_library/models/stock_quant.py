@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 import logging
-from odoo import models
+from odoo import models, api
 
 logger = logging.getLogger(__name__)
 
@@ -9,6 +9,38 @@ logger = logging.getLogger(__name__)
 class StockQuant(models.Model):
     _inherit = "stock.quant"
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Inherited this method for journal the product and warehouse of the new quants.
+        :param: list of dict {}
+        :return: stock.quant()
+        """
+        quants = super(StockQuant, self).create(vals_list)
+        quants.journal_stock_change_ept()
+        return quants
+
+    def write(self, vals):
+        """
+        Inherited this method for journal the product and warehouse of the quants which quantities change.
+        :param: dict {}
+        :return: True/False
+        """
+        res = super(StockQuant, self).write(vals)
+        if 'quantity' in vals or 'reserved_quantity' in vals:
+            self.journal_stock_change_ept()
+        return res
+
+    def journal_stock_change_ept(self):
+        """
+        Define this method for record the quants of the warehouse locations in the stock change journal, which
+        the connectors consume instead of scanning the stock moves.
+        """
+        changes = [(quant.product_id.id, quant.location_id.warehouse_id.id, quant.company_id.id) for quant in self
+                   if quant.location_id.warehouse_id]
+        self.env['stock.change.journal.ept'].sudo().record_stock_change_ept(changes)
+        return True
+
     def create_inventory_adjustment_ept(self, product_qty_data, location_id, auto_apply=False, name=""):
         """
         Define this method for create or update product inventory.
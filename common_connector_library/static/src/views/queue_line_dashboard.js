@@ -76,7 +76,7 @@ export class QueueLineEptDashBoard extends Component {
         model && this.values && this.action.doAction({
             name: $action.attr('title'),
             res_model: model,
-            domain: [['id', 'in', this.values[context['action']][1]]],
+            domain: this.values[context['action']][1],
             context: context,
             views: [[false, 'list'], [false, 'form']],
             type: 'ir.actions.act_window',
@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+# Benchmark harness of the connector, it is not loaded with the module. See run.py for its usage.
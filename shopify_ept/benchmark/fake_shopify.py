@@ -0,0 +1,657 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""Local HTTP server speaking the parts of the Shopify Admin API used by the connector.
+
+The server serves a synthetic store generated from a seed, so the same sizes
+always give the same data. It answers the REST endpoints of orders, products,
+locations, inventory levels, fulfillment orders, order transactions and
+Shopify Payments payouts, and the GraphQL queries and mutations of the
+fulfillment engine and of the bulk stock export. It runs the bulk operations
+of the order and product imports and serves their JSONL result files, built
+from the store or replayed from a fixture. Latency and 429 responses can be
+injected to reproduce a busy shop.
+
+It does not need Odoo and can be started alone:
+
+    python3 fake_shopify.py --port 8765 --orders 10000 --products 2000
+
+An instance then uses it with the host http://127.0.0.1:8765 and any API key
+and password.
+"""
+
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ORDER_ID_BASE = 5000000000000
+PRODUCT_ID_BASE = 7000000000000
+VARIANT_ID_BASE = 4000000000000
+INVENTORY_ITEM_ID_BASE = 4400000000000
+LINE_ITEM_ID_BASE = 1300000000000
+FULFILLMENT_ORDER_ID_BASE = 6000000000000
+CUSTOMER_ID_BASE = 6600000000000
+LOCATION_ID_BASE = 60000000000
+PAYOUT_ID_BASE = 80000000
+BALANCE_TRANSACTION_ID_BASE = 900000000
+CALL_LIMIT = 40
+
+GID_PATTERN = re.compile(r"gid://shopify/(\w+)/(\d+)")
+
+
+def _timestamp(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S-00:00")
+
+
+def _gid_id(gid):
+    match = GID_PATTERN.match(gid or "")
+    return int(match.group(2)) if match else None
+
+
+def _money_bag(amount, currency):
+    money = {"amount": amount, "currencyCode": currency}
+    return {"shopMoney": money, "presentmentMoney": dict(money)}
+
+
+def _bulk_address(address):
+    return {"firstName": address["first_name"], "lastName": address["last_name"], "name": address["name"],
+            "company": address["company"], "address1": address["address1"], "address2": address["address2"],
+            "city": address["city"], "province": address["province"], "provinceCode": address["province_code"],
+            "zip": address["zip"], "country": address["country"], "countryCodeV2": address["country_code"],
+            "phone": address["phone"]}
+
+
+class FakeShopifyStore(object):
+    """Synthetic store data, generated from a seed.
+
+    Args:
+        orders: Number of orders.
+        products: Number of products.
+        variants_per_product: Number of variants of every product.
+        locations: Number of locations.
+        payouts: Number of paid payouts.
+        payout_transactions: Number of balance transactions of every payout.
+        seed: Seed of the random generator.
+        currency: Currency of the shop.
+    """
+
+    def __init__(self, orders=1000, products=200, variants_per_product=3, locations=2, payouts=1,
+                 payout_transactions=3000, seed=1, currency="USD"):
+        self.random = random.Random(seed)
+        self.currency = currency
+        self.now = datetime.utcnow().replace(microsecond=0)
+        self.lock = threading.Lock()
+        self.locations = [self._location(index) for index in range(locations)]
+        self.products = [self._product(index, variants_per_product) for index in range(products)]
+        self.variants = [variant for product in self.products for variant in product["variants"]]
+        self.inventory_levels = {(variant["inventory_item_id"], location["id"]): self.random.randint(0, 100)
+                                 for variant in self.variants for location in self.locations}
+        # About three orders per customer, so the customer matching finds existing partners too.
+        self.customer_count = max(orders // 3, 1)
+        self.orders = [self._order(index) for index in range(orders)]
+        self.orders_by_id = {order["id"]: order for order in self.orders}
+        self.products_by_id = {product["id"]: product for product in self.products}
+        self.fulfillment_orders = {order["id"]: [self._fulfillment_order(order)] for order in self.orders}
+        self.payouts = []
+        self.balance_transactions = {}
+        for index in range(payouts):
+            self._payout(index, payout_transactions)
+        self.fulfillments = []
+
+    def _location(self, index):
+        return {"id": LOCATION_ID_BASE + index, "name": "Warehouse %s" % (index + 1), "active": True,
+                "legacy": False, "address1": "%s Main Street" % (index + 1), "city": "Springfield",
+                "zip": "10001", "country_code": "US", "province_code": "NY", "phone": "",
+                "created_at": _timestamp(self.now - timedelta(days=365)),
+                "updated_at": _timestamp(self.now - timedelta(days=365))}
+
+    def _product(self, index, variants_per_product):
+        product_id = PRODUCT_ID_BASE + index
+        updated_at = _timestamp(self.now - timedelta(minutes=self.random.randint(1, 60 * 24 * 30)))
+        sizes = ["Size %s" % (size + 1) for size in range(variants_per_product)]
+        variants = []
+        for position, size in enumerate(sizes):
+            variant_index = index * variants_per_product + position
+            variants.append({
+                "id": VARIANT_ID_BASE + variant_index, "product_id": product_id,
+                "title": size, "option1": size, "option2": None, "option3": None,
+                "sku": "BENCH-%06d" % variant_index, "barcode": "%013d" % (2000000000000 + variant_index),
+                "price": "%.2f" % self.random.uniform(5, 200), "compare_at_price": None,
+                "inventory_item_id": INVENTORY_ITEM_ID_BASE + variant_index,
+                "inventory_management": "shopify", "inventory_policy": "deny", "fulfillment_service": "manual",
+                "taxable": True, "requires_shipping": True, "weight": 0.5, "weight_unit": "kg",
+                "grams": 500, "position": position + 1, "created_at": updated_at, "updated_at": updated_at})
+        return {"id": product_id, "title": "Benchmark Product %s" % (index + 1),
+                "body_html": "<p>Synthetic product %s</p>" % (index + 1), "vendor": "Benchmark",
+                "product_type": "Bench", "handle": "benchmark-product-%s" % (index + 1), "tags": "bench",
+                "status": "active", "published_scope": "web", "published_at": updated_at,
+                "created_at": updated_at, "updated_at": updated_at,
+                "options": [{"id": product_id, "product_id": product_id, "name": "Size", "position": 1,
+                             "values": sizes}],
+                "variants": variants, "images": [], "image": None}
+
+    def _address(self, customer_index):
+        return {"first_name": "Customer", "last_name": str(customer_index), "name": "Customer %s" % customer_index,
+                "address1": "%s Market Street" % customer_index, "address2": "", "city": "Springfield",
+                "zip": "10001", "province": "New York", "province_code": "NY", "country": "United States",
+                "country_code": "US", "phone": "", "company": None}
+
+    def _order(self, index):
+        order_id = ORDER_ID_BASE + index
+        customer_index = self.random.randint(1, self.customer_count)
+        created_at = self.now - timedelta(minutes=self.random.randint(1, 60 * 24 * 10))
+        line_items = []
+        for line_index, variant in enumerate(self.random.sample(self.variants, min(self.random.randint(1, 3),
+                                                                                  len(self.variants)))):
+            quantity = self.random.randint(1, 3)
+            line_items.append({
+                "id": LINE_ITEM_ID_BASE + index * 10 + line_index, "variant_id": variant["id"],
+                "product_id": variant["product_id"], "sku": variant["sku"], "title": "Benchmark Product",
+                "name": "Benchmark Product - %s" % variant["title"], "variant_title": variant["title"],
+                "quantity": quantity, "fulfillable_quantity": quantity, "price": variant["price"],
+                "total_discount": "0.00", "fulfillment_status": None, "requires_shipping": True, "taxable": True,
+                "gift_card": False, "product_exists": True, "tax_lines": [], "discount_allocations": [],
+                "properties": []})
+        subtotal = sum(float(line["price"]) * line["quantity"] for line in line_items)
+        address = self._address(customer_index)
+        return {
+            "id": order_id, "name": "#B%s" % (1000 + index), "order_number": 1000 + index,
+            "email": "customer%s@example.com" % customer_index, "currency": self.currency,
+            "presentment_currency": self.currency, "financial_status": "paid", "fulfillment_status": None,
+            "gateway": "manual", "payment_gateway_names": ["manual"], "source_name": "web", "tags": "",
+            "note": None, "taxes_included": False, "total_discounts": "0.00", "discount_codes": [],
+            "subtotal_price": "%.2f" % subtotal, "total_tax": "0.00", "total_price": "%.2f" % subtotal,
+            "created_at": _timestamp(created_at), "updated_at": _timestamp(created_at),
+            "processed_at": _timestamp(created_at), "cancelled_at": None, "cancel_reason": None,
+            "closed_at": None, "location_id": None, "tax_lines": [], "shipping_lines": [],
+            "line_items": line_items, "fulfillments": [], "refunds": [],
+            "billing_address": address, "shipping_address": address,
+            "customer": {"id": CUSTOMER_ID_BASE + customer_index, "email": "customer%s@example.com" % customer_index,
+                         "first_name": "Customer", "last_name": str(customer_index), "phone": None, "tags": "",
+                         "currency": self.currency, "created_at": _timestamp(created_at),
+                         "updated_at": _timestamp(created_at),
+                         "default_address": dict(address, id=CUSTOMER_ID_BASE + customer_index, default=True)}}
+
+    def _fulfillment_order(self, order):
+        fulfillment_order_id = FULFILLMENT_ORDER_ID_BASE + order["id"] - ORDER_ID_BASE
+        location = self.locations[(order["id"] - ORDER_ID_BASE) % len(self.locations)] if self.locations else {}
+        return {"id": fulfillment_order_id, "order_id": order["id"], "status": "open",
+                "request_status": "unsubmitted", "assigned_location_id": location.get("id"),
+                "delivery_method": {"method_type": "shipping"},
+                "line_items": [{"id": line["id"] + FULFILLMENT_ORDER_ID_BASE, "shop_id": 1,
+                                "fulfillment_order_id": fulfillment_order_id, "line_item_id": line["id"],
+                                "quantity": line["quantity"], "fulfillable_quantity": line["quantity"],
+                                "variant_id": line["variant_id"]} for line in order["line_items"]]}
+
+    def _payout(self, index, transaction_count):
+        payout_id = PAYOUT_ID_BASE + index
+        transactions = []
+        for transaction_index in range(transaction_count):
+            order = self.orders[transaction_index % len(self.orders)] if self.orders else None
+            is_refund = order and transaction_index % 20 == 19
+            amount = float(order["total_price"]) if order else 10.0
+            fee = round(amount * 0.029 + 0.3, 2)
+            transactions.append({
+                "id": BALANCE_TRANSACTION_ID_BASE + index * transaction_count + transaction_index,
+                "type": "refund" if is_refund else "charge", "test": False, "payout_id": payout_id,
+                "payout_status": "paid", "currency": self.currency,
+                "amount": "%.2f" % (-amount if is_refund else amount),
+                "fee": "%.2f" % (0.0 if is_refund else fee),
+                "net": "%.2f" % (-amount if is_refund else amount - fee),
+                "source_id": order["id"] if order else None, "source_type": "refund" if is_refund else "charge",
+                "source_order_id": order["id"] if order else None,
+                "source_order_transaction_id": order["id"] if order else None,
+                "processed_at": _timestamp(self.now - timedelta(days=1))})
+        self.balance_transactions[payout_id] = transactions
+        fee_total = sum(float(transaction["fee"]) for transaction in transactions)
+        self.payouts.append({
+            "id": payout_id, "status": "paid", "date": (self.now - timedelta(days=index)).strftime("%Y-%m-%d"),
+            "currency": self.currency,
+            "amount": "%.2f" % sum(float(transaction["net"]) for transaction in transactions),
+            "summary": {"charges_fee_amount": "%.2f" % fee_total, "refunds_fee_amount": "0.00",
+                        "adjustments_fee_amount": "0.00", "charges_gross_amount": "0.00",
+                        "refunds_gross_amount": "0.00", "adjustments_gross_amount": "0.00",
+                        "reserved_funds_fee_amount": "0.00", "reserved_funds_gross_amount": "0.00",
+                        "retried_payouts_fee_amount": "0.00", "retried_payouts_gross_amount": "0.00"}})
+
+    def bulk_order_records(self):
+        """Yield the records of the JSONL result of a bulk export of the orders, nested connections included."""
+        for order in self.orders:
+            order_gid = "gid://shopify/Order/%s" % order["id"]
+            currency = order["currency"]
+            address = _bulk_address(order["shipping_address"])
+            customer = order["customer"]
+            yield {
+                "id": order_gid, "legacyResourceId": str(order["id"]), "name": order["name"],
+                "email": order["email"], "phone": None, "note": order["note"],
+                "tags": [tag for tag in order["tags"].split(", ") if tag],
+                "createdAt": order["created_at"], "updatedAt": order["updated_at"],
+                "processedAt": order["processed_at"], "cancelledAt": None, "cancelReason": None, "closedAt": None,
+                "displayFinancialStatus": order["financial_status"].upper(),
+                "displayFulfillmentStatus": "FULFILLED" if order["fulfillment_status"] == "fulfilled" else
+                "UNFULFILLED",
+                "currencyCode": currency, "presentmentCurrencyCode": order["presentment_currency"],
+                "taxesIncluded": order["taxes_included"], "sourceName": order["source_name"],
+                "paymentGatewayNames": order["payment_gateway_names"], "discountCodes": [],
+                "totalDiscountsSet": _money_bag(order["total_discounts"], currency),
+                "subtotalPriceSet": _money_bag(order["subtotal_price"], currency),
+                "totalTaxSet": _money_bag(order["total_tax"], currency),
+                "totalPriceSet": _money_bag(order["total_price"], currency),
+                "taxLines": [], "physicalLocation": None, "fulfillments": [],
+                "customer": {"legacyResourceId": str(customer["id"]), "email": customer["email"],
+                             "firstName": customer["first_name"], "lastName": customer["last_name"],
+                             "phone": customer["phone"], "tags": [], "createdAt": customer["created_at"],
+                             "updatedAt": customer["updated_at"],
+                             "defaultAddress": dict(address, id="gid://shopify/MailingAddress/%s" % customer["id"])},
+                "billingAddress": address, "shippingAddress": address,
+                "transactions": [{"id": "gid://shopify/OrderTransaction/%s" % transaction["id"],
+                                  "kind": transaction["kind"].upper(), "status": transaction["status"].upper(),
+                                  "gateway": transaction["gateway"], "test": transaction["test"],
+                                  "createdAt": transaction["created_at"], "processedAt": transaction["processed_at"],
+                                  "amountSet": _money_bag(transaction["amount"], currency),
+                                  "parentTransaction": None} for transaction in self.order_transactions(order)]}
+            for line in order["line_items"]:
+                yield {"id": "gid://shopify/LineItem/%s" % line["id"], "name": line["name"], "title": line["title"],
+                       "variantTitle": line["variant_title"], "sku": line["sku"], "quantity": line["quantity"],
+                       "unfulfilledQuantity": line["fulfillable_quantity"],
+                       "requiresShipping": line["requires_shipping"], "taxable": line["taxable"],
+                       "isGiftCard": line["gift_card"],
+                       "product": {"legacyResourceId": str(line["product_id"])},
+                       "variant": {"legacyResourceId": str(line["variant_id"])},
+                       "originalUnitPriceSet": _money_bag(line["price"], currency),
+                       "totalDiscountSet": _money_bag(line["total_discount"], currency),
+                       "discountAllocations": [], "taxLines": [], "duties": [], "customAttributes": [],
+                       "__parentId": order_gid}
+            for fulfillment_order in self.fulfillment_orders.get(order["id"], []):
+                fulfillment_order_gid = "gid://shopify/FulfillmentOrder/%s" % fulfillment_order["id"]
+                yield {"id": fulfillment_order_gid, "status": fulfillment_order["status"].upper(),
+                       "assignedLocation": {"location": {
+                           "legacyResourceId": str(fulfillment_order["assigned_location_id"])}},
+                       "deliveryMethod": {"methodType": fulfillment_order["delivery_method"]["method_type"].upper()},
+                       "__parentId": order_gid}
+                for line in fulfillment_order["line_items"]:
+                    yield {"id": "gid://shopify/FulfillmentOrderLineItem/%s" % line["id"],
+                           "totalQuantity": line["quantity"], "remainingQuantity": line["fulfillable_quantity"],
+                           "lineItem": {"id": "gid://shopify/LineItem/%s" % line["line_item_id"]},
+                           "__parentId": fulfillment_order_gid}
+
+    def bulk_product_records(self):
+        """Yield the records of the JSONL result of a bulk export of the products."""
+        for product in self.products:
+            yield {"id": "gid://shopify/Product/%s" % product["id"], "legacyResourceId": str(product["id"]),
+                   "title": product["title"]}
+
+    def order_transactions(self, order):
+        return [{"id": order["id"] + 1, "order_id": order["id"], "kind": "sale", "gateway": "manual",
+                 "status": "success", "amount": order["total_price"], "currency": self.currency,
+                 "created_at": order["created_at"], "processed_at": order["created_at"], "parent_id": None,
+                 "test": False}]
+
+
+class FakeShopifyServer(object):
+    """Threaded HTTP server of a FakeShopifyStore.
+
+    Args:
+        store: FakeShopifyStore to serve.
+        host: Interface to listen on.
+        port: Port to listen on, 0 to take a free one.
+        latency: Seconds added to every response.
+        throttle_every: Answer one request in this many with a 429, 0 to never throttle.
+        retry_after: Seconds of the Retry-After header of the 429 responses.
+        bulk_result: Records served as the result of every bulk operation, e.g. a JSONL fixture, None to build
+            the result from the store.
+    """
+
+    def __init__(self, store, host="127.0.0.1", port=0, latency=0.0, throttle_every=0, retry_after=1.0,
+                 bulk_result=None):
+        self.store = store
+        self.bulk_result = bulk_result
+        self.bulk_operations = {}
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self._counter_lock = threading.Lock()
+        self.calls = {}
+        self.request_count = 0
+        self.throttled = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def snapshot(self):
+        """Return a copy of the call counters: total, throttled and per endpoint."""
+        with self._counter_lock:
+            return {"requests": self.request_count, "throttled": self.throttled, "endpoints": dict(self.calls)}
+
+    def reset(self):
+        with self._counter_lock:
+            self.calls.clear()
+            self.request_count = 0
+            self.throttled = 0
+
+    def _count(self, endpoint):
+        """Count a request and tell whether it has to be throttled."""
+        with self._counter_lock:
+            self.request_count += 1
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            throttle = bool(self.throttle_every) and self.request_count % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+            return throttle
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def _dispatch(self, method):
+                parts = urlparse(self.path)
+                path = re.sub(r"^/admin(/api/[^/]+)?", "", parts.path)
+                query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                endpoint = "%s %s" % (method, re.sub(r"\d+", ":id", path))
+                if server.latency:
+                    time.sleep(server.latency)
+                if server._count(endpoint):
+                    return self._respond(429, {"errors": "Exceeded 2 calls per second for api client."},
+                                         {"Retry-After": "%s" % server.retry_after})
+                try:
+                    status, payload, headers = server.route(method, path, query, body)
+                except Exception as error:
+                    status, payload, headers = 500, {"errors": str(error)}, {}
+                self._respond(status, payload, headers)
+
+            def _respond(self, status, payload, headers):
+                # The result files of the bulk operations are served as they are, the other payloads as JSON.
+                is_text = isinstance(payload, str)
+                data = (payload if is_text else json.dumps(payload)).encode("utf-8")
+                self.send_response(status, {429: "Too Many Requests", 422: "Unprocessable Entity"}.get(status))
+                self.send_header("Content-Type", "application/jsonl; charset=utf-8" if is_text else
+                                 "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("X-Shopify-Shop-Api-Call-Limit", "1/%s" % CALL_LIMIT)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def route(self, method, path, query, body):
+        """Answer a request, path is relative to /admin/api/<version>.
+
+        Returns:
+            A tuple of the status, the JSON payload and the extra headers.
+        """
+        store = self.store
+        match = re.match(r"^/orders/(\d+)(?:/(\w+))?\.json$", path)
+        if match:
+            order = store.orders_by_id.get(int(match.group(1)))
+            if not order:
+                return 404, {"errors": "Not Found"}, {}
+            sub_resource = match.group(2)
+            if sub_resource is None:
+                return 200, {"order": order}, {}
+            if sub_resource == "fulfillment_orders":
+                return 200, {"fulfillment_orders": store.fulfillment_orders.get(order["id"], [])}, {}
+            if sub_resource == "transactions":
+                return 200, {"transactions": store.order_transactions(order)}, {}
+            if sub_resource == "risks":
+                return 200, {"risks": []}, {}
+            if sub_resource == "fulfillments" and method == "POST":
+                return 201, {"fulfillment": self._create_fulfillment(order)}, {}
+            return 200, {sub_resource: []}, {}
+        if path == "/orders.json":
+            return self._paginate("orders", self._filter_orders(query), query)
+        if path == "/orders/count.json":
+            return 200, {"count": len(self._filter_orders(query))}, {}
+        match = re.match(r"^/products/(\d+)(?:/(\w+))?\.json$", path)
+        if match:
+            product = store.products_by_id.get(int(match.group(1)))
+            if not product:
+                return 404, {"errors": "Not Found"}, {}
+            if match.group(2) == "images":
+                return 200, {"images": product["images"]}, {}
+            return 200, {"product": product}, {}
+        if path == "/products.json":
+            products = store.products
+            if query.get("ids"):
+                ids = {int(product_id) for product_id in query["ids"].split(",") if product_id}
+                products = [product for product in products if product["id"] in ids]
+            return self._paginate("products", products, query)
+        if path == "/products/count.json":
+            return 200, {"count": len(store.products)}, {}
+        if path == "/locations.json":
+            return 200, {"locations": store.locations}, {}
+        if path == "/inventory_levels.json":
+            return self._paginate("inventory_levels", self._filter_inventory_levels(query), query)
+        if path == "/inventory_levels/set.json" and method == "POST":
+            key = (int(body.get("inventory_item_id")), int(body.get("location_id")))
+            with store.lock:
+                store.inventory_levels[key] = int(body.get("available") or 0)
+            return 200, {"inventory_level": self._inventory_level(key)}, {}
+        if path == "/shopify_payments/payouts.json":
+            return self._paginate("payouts", [payout for payout in store.payouts if
+                                              not query.get("status") or payout["status"] == query["status"]],
+                                  query)
+        if path == "/shopify_payments/balance/transactions.json":
+            payout_id = int(query["payout_id"]) if query.get("payout_id") else None
+            transactions = store.balance_transactions.get(payout_id, []) if payout_id else \
+                [transaction for values in store.balance_transactions.values() for transaction in values]
+            return self._paginate("transactions", transactions, query)
+        if path == "/fulfillments.json" and method == "POST":
+            order_id = None
+            for request in (body.get("fulfillment") or {}).get("line_items_by_fulfillment_order") or []:
+                order_id = (int(request["fulfillment_order_id"]) - FULFILLMENT_ORDER_ID_BASE) + ORDER_ID_BASE
+            order = store.orders_by_id.get(order_id)
+            if not order:
+                return 422, {"errors": ["Fulfillment order does not exist."]}, {}
+            return 201, {"fulfillment": self._create_fulfillment(order)}, {}
+        match = re.match(r"^/bulk/(\d+)\.jsonl$", path)
+        if match:
+            records = self.bulk_operations.get(int(match.group(1)))
+            if records is None:
+                return 404, {"errors": "Not Found"}, {}
+            return 200, "".join(json.dumps(record) + "\n" for record in records), {}
+        if path == "/graphql.json" and method == "POST":
+            return 200, self._graphql(body.get("query") or "", body.get("variables") or {}), {}
+        return 404, {"errors": "Not Found"}, {}
+
+    def _filter_orders(self, query):
+        orders = self.store.orders
+        if query.get("ids"):
+            ids = {int(order_id) for order_id in query["ids"].split(",") if order_id}
+            orders = [order for order in orders if order["id"] in ids]
+        fulfillment_status = query.get("fulfillment_status")
+        if fulfillment_status == "shipped":
+            orders = [order for order in orders if order["fulfillment_status"] == "fulfilled"]
+        elif fulfillment_status == "unshipped":
+            orders = [order for order in orders if not order["fulfillment_status"]]
+        return orders
+
+    def _filter_inventory_levels(self, query):
+        location_ids = {int(value) for value in (query.get("location_ids") or "").split(",") if value}
+        item_ids = {int(value) for value in (query.get("inventory_item_ids") or "").split(",") if value}
+        return [self._inventory_level(key) for key in self.store.inventory_levels
+                if (not location_ids or key[1] in location_ids) and (not item_ids or key[0] in item_ids)]
+
+    def _inventory_level(self, key):
+        return {"inventory_item_id": key[0], "location_id": key[1], "available": self.store.inventory_levels[key],
+                "updated_at": _timestamp(self.store.now)}
+
+    def _paginate(self, root, records, query):
+        """Cut a page of the records with the cursor pagination of Shopify, a page_info holds the offset."""
+        limit = min(int(query.get("limit") or 50), 250)
+        offset = 0
+        if query.get("page_info"):
+            offset = json.loads(base64.urlsafe_b64decode(query["page_info"].encode()).decode()).get("offset", 0)
+        page = records[offset:offset + limit]
+        headers = {}
+        if offset + limit < len(records):
+            page_info = base64.urlsafe_b64encode(json.dumps({"offset": offset + limit}).encode()).decode()
+            headers["Link"] = '<%s/admin/api/2024-01/%s.json?limit=%s&page_info=%s>; rel="next"' % (
+                self.url, self._root_path(root), limit, page_info)
+        return 200, {root: page}, headers
+
+    @staticmethod
+    def _root_path(root):
+        return {"payouts": "shopify_payments/payouts",
+                "transactions": "shopify_payments/balance/transactions"}.get(root, root)
+
+    def _create_fulfillment(self, order):
+        with self.store.lock:
+            fulfillment_id = len(self.store.fulfillments) + 1
+            fulfillment = {"id": fulfillment_id, "order_id": order["id"], "status": "success",
+                           "line_items": order["line_items"]}
+            self.store.fulfillments.append(fulfillment)
+            order["fulfillment_status"] = "fulfilled"
+            for fulfillment_order in self.store.fulfillment_orders.get(order["id"], []):
+                fulfillment_order["status"] = "closed"
+        return fulfillment
+
+    def _graphql(self, query, variables):
+        """Answer the GraphQL documents of the connector, with the cost extension of Shopify."""
+        cost = {"requestedQueryCost": 10, "actualQueryCost": 10,
+                "throttleStatus": {"maximumAvailable": 2000.0, "currentlyAvailable": 1990.0, "restoreRate": 100.0}}
+        if "fulfillmentCreateV2" in query:
+            fulfillment_order_ids = [_gid_id(request.get("fulfillmentOrderId")) for request in
+                                     (variables.get("fulfillment") or {}).get("lineItemsByFulfillmentOrder") or []]
+            order = self.store.orders_by_id.get((fulfillment_order_ids[0] or 0) - FULFILLMENT_ORDER_ID_BASE +
+                                                ORDER_ID_BASE) if fulfillment_order_ids else None
+            if not order:
+                return {"data": {"fulfillmentCreateV2": {"fulfillment": None, "userErrors": [
+                    {"field": ["fulfillment"], "message": "Fulfillment order does not exist."}]}},
+                        "extensions": {"cost": cost}}
+            fulfillment = self._create_fulfillment(order)
+            return {"data": {"fulfillmentCreateV2": {"fulfillment": {
+                "id": "gid://shopify/Fulfillment/%s" % fulfillment["id"], "status": "SUCCESS",
+                "fulfillmentLineItems": {"nodes": [{"lineItem": {"id": "gid://shopify/LineItem/%s" % line["id"]}}
+                                                   for line in order["line_items"]]}}, "userErrors": []}},
+                    "extensions": {"cost": cost}}
+        if "inventorySetQuantities" in query:
+            quantities = (variables.get("input") or {}).get("quantities") or []
+            with self.store.lock:
+                for quantity in quantities:
+                    key = (_gid_id(quantity.get("inventoryItemId")), _gid_id(quantity.get("locationId")))
+                    self.store.inventory_levels[key] = int(quantity.get("quantity") or 0)
+            return {"data": {"inventorySetQuantities": {"userErrors": []}}, "extensions": {"cost": cost}}
+        if "bulkOperationRunQuery" in query:
+            bulk_query = variables.get("query") or ""
+            if self.bulk_result is not None:
+                records = list(self.bulk_result)
+            elif "orders(" in bulk_query:
+                records = list(self.store.bulk_order_records())
+            else:
+                records = list(self.store.bulk_product_records())
+            with self.store.lock:
+                operation_id = len(self.bulk_operations) + 1
+                self.bulk_operations[operation_id] = records
+            return {"data": {"bulkOperationRunQuery": {"bulkOperation": {
+                "id": "gid://shopify/BulkOperation/%s" % operation_id, "status": "CREATED"}, "userErrors": []}},
+                    "extensions": {"cost": cost}}
+        if "BulkOperation" in query:
+            operation_id = _gid_id(variables.get("id"))
+            records = self.bulk_operations.get(operation_id)
+            if records is None:
+                return {"data": {"node": None}, "extensions": {"cost": cost}}
+            return {"data": {"node": {
+                "id": variables.get("id"), "status": "COMPLETED", "errorCode": None,
+                "objectCount": str(len(records)), "url": "%s/bulk/%s.jsonl" % (self.url, operation_id)}},
+                    "extensions": {"cost": cost}}
+        if "nodes(" in query:
+            return {"data": {"nodes": [self._order_node(_gid_id(gid), query) for gid in variables.get("ids", [])]},
+                    "extensions": {"cost": cost}}
+        return {"data": {}, "extensions": {"cost": cost}}
+
+    def _order_node(self, order_id, query):
+        order = self.store.orders_by_id.get(order_id)
+        if not order:
+            return None
+        node = {"legacyResourceId": str(order["id"]),
+                "displayFulfillmentStatus": "FULFILLED" if order["fulfillment_status"] == "fulfilled" else
+                "UNFULFILLED", "cancelledAt": None, "cancelReason": None}
+        if "fulfillmentOrders" in query:
+            node["fulfillmentOrders"] = {"nodes": [{
+                "id": "gid://shopify/FulfillmentOrder/%s" % fulfillment_order["id"],
+                "status": fulfillment_order["status"].upper(),
+                "assignedLocation": {"location": {"legacyResourceId": str(fulfillment_order["assigned_location_id"])}},
+                "deliveryMethod": {"methodType": fulfillment_order["delivery_method"]["method_type"].upper()},
+                "lineItems": {"nodes": [{"id": "gid://shopify/FulfillmentOrderLineItem/%s" % line["id"],
+                                         "totalQuantity": line["quantity"],
+                                         "lineItem": {"id": "gid://shopify/LineItem/%s" % line["line_item_id"]}}
+                                        for line in fulfillment_order["line_items"]]}}
+                for fulfillment_order in self.store.fulfillment_orders.get(order["id"], [])]}
+        return node
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic Shopify store.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--variants-per-product", type=int, default=3)
+    parser.add_argument("--locations", type=int, default=2)
+    parser.add_argument("--payouts", type=int, default=1)
+    parser.add_argument("--payout-transactions", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer one request in N with a 429.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    store = FakeShopifyStore(orders=args.orders, products=args.products,
+                             variants_per_product=args.variants_per_product, locations=args.locations,
+                             payouts=args.payouts, payout_transactions=args.payout_transactions, seed=args.seed)
+    server = FakeShopifyServer(store, host=args.host, port=args.port, latency=args.latency,
+                               throttle_every=args.throttle_every)
+    print("Serving a fake Shopify store on %s" % server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""Run the benchmark scenarios of the connector against a local fake Shopify store.
+
+The database must be a copy dedicated to the benchmark, with shopify_ept
+installed and a configured Shopify instance; the scenarios commit their data.
+
+    python3 run.py -c /etc/odoo/odoo.conf -d shopify_bench --instance-id 1 \\
+        --orders 10000 --products 5000 --variants-per-product 4 --locations 2 \\
+        --payout-transactions 3000 import_products import_orders export_stock process_payout
+
+Every scenario prints its wall time, SQL statement count and API call count,
+and --json writes them to a file to compare releases.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_shopify import FakeShopifyServer, FakeShopifyStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Shopify connector with a fake store.")
+    parser.add_argument("scenarios", nargs="+", help="Scenarios to run in order: import_products, import_orders, "
+                                                     "export_stock, process_payout.")
+    parser.add_argument("-c", "--config", help="Odoo configuration file.")
+    parser.add_argument("-d", "--database", required=True)
+    parser.add_argument("--instance-id", type=int, required=True, help="Shopify instance used by the scenarios.")
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--variants-per-product", type=int, default=3)
+    parser.add_argument("--locations", type=int, default=2)
+    parser.add_argument("--payouts", type=int, default=1)
+    parser.add_argument("--payout-transactions", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API response.")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer one API request in N with a 429.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="File to write the results to.")
+    args = parser.parse_args()
+
+    import odoo
+    from odoo import api, SUPERUSER_ID
+    from odoo.modules.registry import Registry
+
+    odoo.tools.config.parse_config((["-c", args.config] if args.config else []) + ["-d", args.database])
+    from odoo.addons.shopify_ept.benchmark.scenarios import SCENARIOS, format_results, run_scenarios
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error("Unknown scenarios: %s" % ", ".join(unknown))
+
+    store = FakeShopifyStore(orders=args.orders, products=args.products,
+                             variants_per_product=args.variants_per_product, locations=args.locations,
+                             payouts=args.payouts, payout_transactions=args.payout_transactions, seed=args.seed)
+    with FakeShopifyServer(store, latency=args.latency, throttle_every=args.throttle_every) as server:
+        with Registry(args.database).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            instance = env["shopify.instance.ept"].browse(args.instance_id)
+            results = run_scenarios(env, instance, server, args.scenarios)
+
+    print(format_results(results))
+    if args.json:
+        with open(args.json, "w") as result_file:
+            json.dump({"store": vars(args), "results": results}, result_file, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+"""Benchmark scenarios of the connector against a FakeShopifyServer.
+
+Every scenario runs the same methods as the scheduled actions, on an instance
+which points at the fake server while it runs, and returns its wall time, the
+number of SQL statements of the cursor and the number of API calls received by
+the server. The scenarios commit like the real processes do, so they must run
+on a database dedicated to the benchmark.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from odoo import models
+
+_logger = logging.getLogger("Shopify Benchmark")
+
+
+def _as_records(model, value):
+    """Return the queues returned by a process as records, whether it gives ids or records."""
+    if isinstance(value, models.BaseModel):
+        return value
+    return model.browse(value or [])
+
+
+@contextmanager
+def pointed_instance(instance, server):
+    """Point the instance at the fake server for the time of the block, then restore its host. The fake server
+    accepts any API key and password."""
+    original_host = instance.shopify_host
+    instance.write({"shopify_host": server.url})
+    instance.env.cr.commit()
+    try:
+        yield instance
+    finally:
+        instance.env.cr.rollback()
+        instance.write({"shopify_host": original_host})
+        instance.env.cr.commit()
+
+
+@contextmanager
+def measure(env, server, name, results):
+    """Append the wall time, SQL statements and API calls of the block to results."""
+    server.reset()
+    start_count = env.cr.sql_log_count
+    start = time.time()
+    result = {"scenario": name}
+    try:
+        yield result
+    finally:
+        api_calls = server.snapshot()
+        result.update({"seconds": round(time.time() - start, 2),
+                       "sql_queries": env.cr.sql_log_count - start_count,
+                       "api_calls": api_calls["requests"],
+                       "throttled": api_calls["throttled"],
+                       "endpoints": api_calls["endpoints"]})
+        results.append(result)
+        _logger.info("Benchmark %s: %s", name, result)
+
+
+def import_products(env, instance, server, results):
+    """Import all the products of the fake store, as the product import does."""
+    product_queue_obj = env["shopify.product.data.queue.ept"]
+    with measure(env, server, "import_products", results) as result:
+        queues = _as_records(product_queue_obj, product_queue_obj.shopify_create_product_data_queue(
+            instance, import_based_on="update_date", from_date=datetime.now() - timedelta(days=365),
+            to_date=datetime.now()))
+        for queue in queues:
+            queue.product_data_queue_lines.filtered(lambda line: line.state == "draft").\
+                process_product_queue_line_data()
+        result["records"] = len(queues.product_data_queue_lines)
+    return results
+
+
+def import_orders(env, instance, server, results):
+    """Import all the unshipped orders of the fake store in queues and process the queues."""
+    order_queue_obj = env["shopify.order.data.queue.ept"]
+    with measure(env, server, "import_orders", results) as result:
+        queues = _as_records(order_queue_obj, order_queue_obj.shopify_create_order_data_queues(
+            instance, datetime.now() - timedelta(days=30), datetime.now()))
+        for queue in queues:
+            queue.order_data_queue_line_ids.filtered(lambda line: line.state == "draft").\
+                process_import_order_queue_data()
+        result["records"] = len(queues.order_data_queue_line_ids)
+    result["stages"] = [json.loads(queue.profile_summary or "{}").get("stages", {}) for queue in queues]
+    return results
+
+
+def export_stock(env, instance, server, results):
+    """Export the stock of all the imported variants to all the locations of the fake store."""
+    shopify_product_obj = env["shopify.product.product.ept"]
+    location_obj = env["shopify.location.ept"]
+    location_obj.import_shopify_locations(instance)
+    locations = location_obj.search([("instance_id", "=", instance.id), ("legacy", "=", False)])
+    locations.filtered(lambda location: not location.export_stock_warehouse_ids).write(
+        {"export_stock_warehouse_ids": [(6, 0, instance.shopify_warehouse_id.ids)]})
+    env.cr.commit()
+    products = shopify_product_obj.search([("shopify_instance_id", "=", instance.id),
+                                           ("exported_in_shopify", "=", True)]).product_id
+    with measure(env, server, "export_stock", results) as result:
+        queue = shopify_product_obj.with_context(is_process_from_selected_product=True).export_stock_queue(
+            instance, products.ids)
+        queue_lines = queue.export_stock_queue_line_ids if queue else env["shopify.export.stock.queue.line.ept"]
+        queue_lines.process_export_stock_queue_data()
+        result["records"] = len(queue_lines)
+    return results
+
+
+def process_payout(env, instance, server, results):
+    """Import the payouts of the fake store, generate their statement lines and reconcile them."""
+    payout_obj = env["shopify.payout.report.ept"]
+    with measure(env, server, "process_payout", results) as result:
+        payout_obj.get_payout_report(datetime.now() - timedelta(days=30), datetime.now(), instance)
+        payouts = payout_obj.search([("instance_id", "=", instance.id),
+                                     ("state", "in", ["generated", "partially_processed"])])
+        for payout in payouts:
+            payout.with_context(cron_process=True).process_bank_statement()
+            env.cr.commit()
+        result["records"] = len(payouts.payout_transaction_ids)
+    return results
+
+
+SCENARIOS = {
+    "import_products": import_products,
+    "import_orders": import_orders,
+    "export_stock": export_stock,
+    "process_payout": process_payout,
+}
+
+
+def run_scenarios(env, instance, server, names):
+    """
+    This method is used to run the scenarios in the given order on the instance pointed at the server.
+    @return: List of the results of the scenarios.
+    """
+    results = []
+    with pointed_instance(instance, server):
+        for name in names:
+            SCENARIOS[name](env, instance, server, results)
+            env.cr.commit()
+    return results
+
+
+def format_results(results):
+    """Return the results as a text table, one line per scenario."""
+    lines = ["%-16s %8s %10s %12s %10s %10s" % ("scenario", "records", "seconds", "sql_queries", "api_calls",
+                                                 "throttled")]
+    for result in results:
+        lines.append("%-16s %8s %10s %12s %10s %10s" % (result["scenario"], result.get("records", ""),
+                                                         result["seconds"], result["sql_queries"],
+                                                         result["api_calls"], result["throttled"]))
+    return "\n".join(lines)
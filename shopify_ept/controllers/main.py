@@ -29,17 +29,10 @@ class Main(http.Controller):
             return
 
         _logger.info("%s call for product: %s", webhook_route, res.get("title"))
+        if self.store_webhook_event(webhook_route, instance):
+            return
 
-        shopify_template = request.env["shopify.product.template.ept"].sudo().with_context(active_test=False).search(
-            [("shopify_tmpl_id", "=", res.get("id")), ("shopify_instance_id", "=", instance.id)], limit=1)
-
-        if webhook_route in ['shopify_odoo_webhook_for_product_update',
-                             'shopify_odoo_webhook_for_product_create'] and shopify_template or res.get("published_at"):
-            request.env["shopify.product.data.queue.ept"].sudo().create_shopify_product_queue_from_webhook(res,
-                                                                                                           instance)
-
-        if webhook_route == 'shopify_odoo_webhook_for_product_delete' and shopify_template:
-            shopify_template.write({"active": False})
+        request.env["shopify.product.data.queue.ept"].sudo().process_product_webhook_ept(res, instance, webhook_route)
         return
 
     @http.route(['/shopify_odoo_webhook_for_customer_create', '/shopify_odoo_webhook_for_customer_update'], csrf=False,
@@ -59,7 +52,9 @@ class Main(http.Controller):
             return
         if res.get("first_name") or res.get("last_name"):
             _logger.info("%s call for Customer: %s", webhook_route,
-                         (res.get("first_name") + " " + res.get("last_name")))
+                         ("%s %s" % (res.get("first_name") or "", res.get("last_name") or "")))
+            if self.store_webhook_event(webhook_route, instance):
+                return
             self.customer_webhook_process(res, instance)
         return
 
@@ -79,26 +74,48 @@ class Main(http.Controller):
         or update in the Shopify store.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 13-Jan-2020.
         """
-        res, instance = self.get_basic_info("shopify_odoo_webhook_for_orders_partially_updated")
-        sale_order = request.env["sale.order"]
+        webhook_route = "shopify_odoo_webhook_for_orders_partially_updated"
+        res, instance = self.get_basic_info(webhook_route)
         if not res:
             return
 
         _logger.info("UPDATE ORDER WEBHOOK call for order: %s", res.get("name"))
+        if self.store_webhook_event(webhook_route, instance):
+            return
+
+        request.env["sale.order"].sudo().process_order_webhook_ept(res, instance)
+        return
+
+    @http.route("/shopify_odoo_webhook_for_fulfillment_orders", csrf=False, auth="public", type="json")
+    def fulfillment_order_webhook(self):
+        """
+        Route for handling the fulfillment_orders/* webhooks of Shopify. The cached fulfillment orders of the order
+        are removed at once, without the webhook inbox, so they are never used after a change in Shopify.
+        """
+        webhook_route = "shopify_odoo_webhook_for_fulfillment_orders"
+        res, instance = self.get_basic_info(webhook_route)
+        if not res:
+            return
 
-        fulfillment_status = res.get("fulfillment_status") or "unfulfilled"
-        if sale_order.sudo().search_read([("shopify_instance_id", "=", instance.id),
-                                          ("shopify_order_id", "=", res.get("id")),
-                                          ("shopify_order_number", "=",
-                                           res.get("order_number"))],
-                                         ["id"]):
-            sale_order.sudo().process_shopify_order_via_webhook(res, instance, True)
-        elif fulfillment_status in ["fulfilled", "unfulfilled", "partial"]:
-            res["fulfillment_status"] = fulfillment_status
-            sale_order.sudo().with_context({'is_new_order': True}).process_shopify_order_via_webhook(res,
-                                                                                                     instance)
+        _logger.info("%s WEBHOOK call for fulfillment order.", request.httprequest.headers.get("X-Shopify-Topic"))
+        request.env["shopify.fulfillment.order.cache"].sudo().process_fulfillment_order_webhook_ept(res, instance)
         return
 
+    def store_webhook_event(self, route, instance):
+        """
+        This method is used to save the event in the webhook inbox, which is processed by a scheduled action, so
+        Shopify gets its response without waiting for the import.
+        @return: True if the event is saved in the inbox, False if it has to be processed synchronously.
+        """
+        ir_config_parameter_obj = request.env["ir.config_parameter"].sudo()
+        if ir_config_parameter_obj.get_param("shopify_ept.webhook_inbox", "True") in ("False", "0"):
+            return False
+        headers = request.httprequest.headers
+        request.env["shopify.webhook.inbox.ept"].sudo().store_webhook_event_ept(
+            instance, route, headers.get("X-Shopify-Webhook-Id"), headers.get("X-Shopify-Topic"),
+            request.httprequest.get_data(as_text=True))
+        return True
+
     def get_basic_info(self, route):
         """
         This method is used to check that instance and webhook are active or not. If yes then return response and
@@ -107,14 +124,11 @@ class Main(http.Controller):
         """
         res = request.get_json_data()
         host = request.httprequest.headers.get("X-Shopify-Shop-Domain")
-        instance = request.env["shopify.instance.ept"].sudo().with_context(active_test=False).search(
-            [("shopify_host", "ilike", host)], limit=1)
-
-        webhook = request.env["shopify.webhook.ept"].sudo().search([("delivery_url", "ilike", route),
-                                                                    ("instance_id", "=", instance.id)], limit=1)
+        instance_id, is_active = request.env["shopify.webhook.ept"].sudo().resolve_webhook_instance(host, route)
+        instance = request.env["shopify.instance.ept"].sudo().browse(instance_id)
 
-        if not instance.active or not webhook.state == "active":
-            _logger.info("The method is skipped. It appears the instance:%s is not active or that "
-                         "the webhook %s is not active.", instance.name, webhook.webhook_name)
+        if not is_active:
+            _logger.info("The method is skipped. It appears the instance of %s is not active or that "
+                         "the webhook %s is not active.", host, route)
             res = False
         return res, instance
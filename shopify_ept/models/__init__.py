@@ -40,3 +40,12 @@ from . import export_stock_queue_ept
 from . import export_stock_queue_line_ept
 from . import onboarding_onboarding
 from . import onboarding_onboarding_step
+from . import shopify_rate_limit_ept
+from . import shopify_stock_snapshot_ept
+from . import shopify_bulk_operation_ept
+from . import shopify_webhook_inbox_ept
+from . import shopify_order_kpi_ept
+from . import shopify_cron_scheduler_ept
+from . import shopify_fulfillment_engine_ept
+from . import shopify_fulfillment_order_cache
+from . import shopify_payout_reconcile_engine_ept
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 
-from odoo import models, fields, _
+from odoo import models, fields, api, _
 
 
 class AccountMove(models.Model):
@@ -18,6 +18,37 @@ class AccountMove(models.Model):
     is_shopify_multi_payment = fields.Boolean("Multi Payments?", default=False, copy=False,
                                               help="It is used to identify that order has multi-payment gateway or not")
 
+    REFUND_KPI_FIELDS = {"invoice_date", "move_type", "shopify_instance_id"}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Inherited method for marking the KPI days of the created Shopify refunds to refresh.
+        """
+        moves = super(AccountMove, self).create(vals_list)
+        self.env["shopify.order.kpi.ept"].mark_refunds_kpi_dirty_ept(moves)
+        return moves
+
+    def write(self, vals):
+        """
+        Inherited method for marking the KPI days of the Shopify refunds to refresh, before and after the change of
+        their day, type or instance.
+        """
+        kpi_changed = self.REFUND_KPI_FIELDS.intersection(vals)
+        if kpi_changed:
+            self.env["shopify.order.kpi.ept"].mark_refunds_kpi_dirty_ept(self)
+        res = super(AccountMove, self).write(vals)
+        if kpi_changed:
+            self.env["shopify.order.kpi.ept"].mark_refunds_kpi_dirty_ept(self)
+        return res
+
+    def unlink(self):
+        """
+        Inherited method for marking the KPI days of the deleted Shopify refunds to refresh.
+        """
+        self.env["shopify.order.kpi.ept"].mark_refunds_kpi_dirty_ept(self)
+        return super(AccountMove, self).unlink()
+
     def action_open_refund_wizard(self):
         """This method used to open a wizard for Refund order in Shopify.
             @param : self
@@ -42,13 +42,15 @@ class ShopifyCustomerDataQueueEpt(models.Model):
         :author: Angel Patel @Emipro Technologies Pvt.Ltd on date 02/11/2019.
         :Task ID: 157065
         """
+        state_counts = self.env["data.queue.mixin.ept"].get_queue_line_state_count_ept(
+            "shopify.customer.data.queue.line.ept", "synced_customer_queue_id", self)
         for record in self:
-            queue_lines = record.synced_customer_queue_line_ids
-            record.total_record_count = len(queue_lines)
-            record.draft_state_count = len(queue_lines.filtered(lambda x: x.state == "draft"))
-            record.done_state_count = len(queue_lines.filtered(lambda x: x.state == "done"))
-            record.fail_state_count = len(queue_lines.filtered(lambda x: x.state == "failed"))
-            record.cancel_state_count = len(queue_lines.filtered(lambda x: x.state == "cancel"))
+            state_count = state_counts.get(record.id, {})
+            record.total_record_count = sum(state_count.values())
+            record.draft_state_count = state_count.get("draft", 0)
+            record.done_state_count = state_count.get("done", 0)
+            record.fail_state_count = state_count.get("failed", 0)
+            record.cancel_state_count = state_count.get("cancel", 0)
 
     @api.depends("synced_customer_queue_line_ids.state")
     def _compute_queue_state(self):
@@ -52,13 +52,15 @@ class ShopifyExportStockQueueEpt(models.Model):
         @author: Nilam Kubavat @Emipro Technologies Pvt.Ltd on date 31-Aug-2022.
         Task Id : 199065
         """
+        state_counts = self.env["data.queue.mixin.ept"].get_queue_line_state_count_ept(
+            "shopify.export.stock.queue.line.ept", "export_stock_queue_id", self)
         for export_stock_queue in self:
-            queue_lines = export_stock_queue.export_stock_queue_line_ids
-            export_stock_queue.queue_line_total_records = len(queue_lines)
-            export_stock_queue.queue_line_draft_records = len(queue_lines.filtered(lambda x: x.state == "draft"))
-            export_stock_queue.queue_line_fail_records = len(queue_lines.filtered(lambda x: x.state == "failed"))
-            export_stock_queue.queue_line_done_records = len(queue_lines.filtered(lambda x: x.state == "done"))
-            export_stock_queue.queue_line_cancel_records = len(queue_lines.filtered(lambda x: x.state == "cancel"))
+            state_count = state_counts.get(export_stock_queue.id, {})
+            export_stock_queue.queue_line_total_records = sum(state_count.values())
+            export_stock_queue.queue_line_draft_records = state_count.get("draft", 0)
+            export_stock_queue.queue_line_fail_records = state_count.get("failed", 0)
+            export_stock_queue.queue_line_done_records = state_count.get("done", 0)
+            export_stock_queue.queue_line_cancel_records = state_count.get("cancel", 0)
 
     @api.depends("export_stock_queue_line_ids.state")
     def _compute_queue_state(self):
@@ -89,6 +89,7 @@ class ShopifyExportStockQueueLineEpt(models.Model):
         export_stock_queue_process_cron_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
             "shopify_ept.process_shopify_export_stock_queue")
 
+        bulk_queue_lines = {}
         for queue in queues:
             export_stock_queue_line_ids = queue.export_stock_queue_line_ids.filtered(lambda x: x.state == "draft")
 
@@ -105,10 +106,20 @@ class ShopifyExportStockQueueLineEpt(models.Model):
                 continue
 
             self._cr.commit()
+            if queue.shopify_instance_id.shopify_bulk_export_stock:
+                # Lines of the bulk instances are collected across the queues to fill the 250 items mutations.
+                instance = queue.shopify_instance_id
+                bulk_queue_lines[instance] = bulk_queue_lines.get(instance, self) | export_stock_queue_line_ids
+                continue
             export_stock_queue_line_ids.process_export_stock_queue_data()
             if time.time() - start > export_stock_queue_process_cron_time - 60:
                 return True
 
+        for instance, export_stock_queue_line_ids in bulk_queue_lines.items():
+            deadline = start + export_stock_queue_process_cron_time - 60
+            if not export_stock_queue_line_ids.process_export_stock_queue_data_in_bulk(instance, deadline):
+                return True
+
     def process_export_stock_queue_data(self):
         """
         This method is used to processes export stock queue lines.
@@ -116,10 +127,14 @@ class ShopifyExportStockQueueLineEpt(models.Model):
         Task Id : 199065
         """
         common_log_line_obj = self.env['common.log.lines.ept']
+        stock_snapshot_obj = self.env['shopify.stock.snapshot.ept']
         model = "shopify.export.stock.queue.ept"
         queue_id = self.export_stock_queue_id if len(self.export_stock_queue_id) == 1 else False
         if queue_id:
             instance = queue_id.shopify_instance_id
+            if instance.shopify_bulk_export_stock:
+                self.process_export_stock_queue_data_in_bulk(instance)
+                return True
             instance.connect_in_shopify()
             query = """
                 UPDATE shopify_export_stock_queue_ept
@@ -137,14 +152,6 @@ class ShopifyExportStockQueueLineEpt(models.Model):
                     shopify.InventoryLevel.set(queue_line.location_id, queue_line.inventory_item_id,
                                                queue_line.quantity)
                 except ClientError as error:
-                    if hasattr(error,
-                               "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                        time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                        shopify.InventoryLevel.set(queue_line.location_id,
-                                                   queue_line.inventory_item_id,
-                                                   queue_line.quantity)
-                        queue_line.write({"state": "done"})
-                        continue
                     if hasattr(error, "response") and error.response.code == 422 and error.response.msg == "Unprocessable Entity":
                         if json.loads(error.response.body.decode()).get("errors")[
                             0] == 'Inventory item does not have inventory tracking enabled':
@@ -175,7 +182,59 @@ class ShopifyExportStockQueueLineEpt(models.Model):
                 if not log_line:
                     queue_id.is_process_queue = True
                     queue_line.write({"state": "done"})
+                    stock_snapshot_obj.update_stock_snapshot(queue_line)
                 else:
                     queue_line.write({"state": "failed"})
             self._cr.commit()
         return True
+
+    def process_export_stock_queue_data_in_bulk(self, instance, deadline=False):
+        """
+        This method is used to process the export stock queue lines of one instance with batched GraphQL
+        inventorySetQuantities mutations. The errors of the items are mapped back to their queue lines.
+        :param instance: Record of the Shopify instance of the queue lines.
+        :param deadline: Time after which no more mutation is sent, the rest is left in draft for the next run.
+        @return: False when the deadline is reached, True otherwise.
+        """
+        common_log_line_obj = self.env['common.log.lines.ept']
+        shopify_product_obj = self.env['shopify.product.product.ept']
+        model = "shopify.export.stock.queue.ept"
+        instance.connect_in_shopify()
+        batch_size = 250
+        for offset in range(0, len(self), batch_size):
+            if deadline and time.time() > deadline:
+                return False
+            queue_lines = self[offset:offset + batch_size]
+            items = [{"inventory_item_id": queue_line.inventory_item_id, "location_id": queue_line.location_id,
+                      "quantity": queue_line.quantity} for queue_line in queue_lines]
+            try:
+                errors = shopify_product_obj.shopify_set_inventory_quantities_in_bulk(instance, items)
+            except Exception as error:
+                errors = {index: {"code": False, "message": str(error)} for index in range(len(items))}
+
+            done_lines = self.browse()
+            untracked_lines = self.browse()
+            for index, queue_line in enumerate(queue_lines):
+                error = errors.get(index)
+                if not error:
+                    done_lines |= queue_line
+                    continue
+                if error.get("code") in ("NON_MUTABLE_INVENTORY_ITEM", "ITEM_NOT_STOCKED_AT_LOCATION") and \
+                        "track" in (error.get("message") or "").lower():
+                    untracked_lines |= queue_line
+                    continue
+                odoo_product = queue_line.shopify_product_id.product_id
+                message = "Error while Export stock for Product ID: %s & Product Name: '%s' for instance: " \
+                          "'%s'\nError: %s %s" % (odoo_product.id, odoo_product.name, instance.name,
+                                                  error.get("code") or "", error.get("message"))
+                common_log_line_obj.create_common_log_line_ept(shopify_instance_id=instance.id, module="shopify_ept",
+                                                               message=message, model_name=model,
+                                                               shopify_export_stock_queue_line_id=queue_line.id)
+                queue_line.write({"state": "failed"})
+            if untracked_lines:
+                untracked_lines.shopify_product_id.write({'inventory_management': "Dont track Inventory"})
+            (done_lines | untracked_lines).write({"state": "done"})
+            done_lines.export_stock_queue_id.write({"is_process_queue": True})
+            self.env['shopify.stock.snapshot.ept'].update_stock_snapshot(done_lines)
+            self._cr.commit()
+        return True
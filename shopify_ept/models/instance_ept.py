@@ -3,13 +3,16 @@
 
 import json
 import logging
+import pytz
 
 from calendar import monthrange
 from datetime import date, datetime, timedelta
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools import SQL
 from .. import shopify
 from ..shopify.pyactiveresource.connection import ForbiddenAccess
+from .shopify_rate_limit_ept import ShopifyPostgresRateLimitStore
 
 _logger = logging.getLogger("Shopify Instance")
 _secondsConverter = {
@@ -172,10 +175,16 @@ class ShopifyInstanceEpt(models.Model):
     shopify_password = fields.Char("Password", required=True)
     shopify_shared_secret = fields.Char("Secret Key", required=True)
     shopify_host = fields.Char("Host", required=True)
+    shopify_shop_domain = fields.Char(compute="_compute_shopify_shop_domain", store=True, index=True,
+                                      help="Domain of the host, as sent by Shopify in the X-Shopify-Shop-Domain header "
+                                           "of the webhooks.")
     shopify_last_date_customer_import = fields.Datetime(string="Last Customer Import",
                                                         help="it is used to store last import customer date")
     shopify_last_date_update_stock = fields.Datetime(string="Last Stock Update",
                                                      help="it is used to store last update inventory stock date")
+    shopify_stock_journal_cursor = fields.Float(digits=(20, 0), copy=False, readonly=True,
+                                                help="Transaction watermark of the stock change journal consumed by "
+                                                     "the export stock cron.")
     shopify_last_date_product_import = fields.Datetime(string="Last Product Import",
                                                        help="it is used to store last import product date")
     auto_import_product = fields.Boolean(string="Auto Create Product if not found?")
@@ -196,6 +205,9 @@ class ShopifyInstanceEpt(models.Model):
     # Account field
     shopify_store_time_zone = fields.Char("Store Time Zone",
                                           help='This field used to import order process')
+    shopify_order_kpi_built = fields.Boolean(copy=False, readonly=True,
+                                             help="The order KPI rollup of the dashboard is built for all the days, "
+                                                  "only the changed days are refreshed since then.")
     discount_product_id = fields.Many2one("product.product", "Discount",
                                           domain=[('detailed_type', '=', 'service')],
                                           default=_default_discount_product,
@@ -365,10 +377,19 @@ class ShopifyInstanceEpt(models.Model):
 
     shopify_instance_product_category = fields.Many2one("product.category", string="Default product category",
                                                         help="Select product category")
+    shopify_bulk_export_stock = fields.Boolean("Export Stock in Bulk",
+                                               help="If checked, stock is exported with batched GraphQL "
+                                                    "inventorySetQuantities mutations of up to 250 items, instead of "
+                                                    "one REST call per variant and location.")
 
     _sql_constraints = [('unique_host', 'unique(shopify_host)',
                          "Instance already exists for given host. Host must be Unique for the instance!")]
 
+    @api.depends("shopify_host")
+    def _compute_shopify_shop_domain(self):
+        for instance in self:
+            instance.shopify_shop_domain = (instance.shopify_host or "").split("//")[-1].rstrip("/").lower() or False
+
     def _compute_kanban_shopify_order_data(self):
         if not self._context.get('sort'):
             context = dict(self.env.context)
@@ -427,12 +448,12 @@ class ShopifyInstanceEpt(models.Model):
                                     , interval  '1 day') day
                                    ) d
                                 LEFT   JOIN 
-                                (SELECT date(date_order)::date AS day, sum(amount_untaxed) as amount_untaxed
-                                   FROM   sale_order
-                                   WHERE  date(date_order) >= (select date_trunc('week', date(current_date)))
-                                   AND    date(date_order) <= (select date_trunc('week', date(current_date)) 
+                                (SELECT kpi_date AS day, sum(amount_untaxed) as amount_untaxed
+                                   FROM   shopify_order_kpi_ept
+                                   WHERE  kpi_date >= (select date_trunc('week', date(current_date)))
+                                   AND    kpi_date <= (select date_trunc('week', date(current_date)) 
                                    + interval '6 days')
-                                   AND shopify_instance_id=%s and state in ('sale','done')
+                                   AND shopify_instance_id=%s
                                    GROUP  BY 1
                                    ) t USING (day)
                                 ORDER  BY day""", (record.id,))
@@ -447,13 +468,13 @@ class ShopifyInstanceEpt(models.Model):
                             , date(date_trunc('month', (current_date)) + interval '1 MONTH - 1 day')
                             , interval  '1 day') day
                         union all
-                        SELECT date(date_order)::date AS date_day,
+                        SELECT kpi_date AS date_day,
                         sum(amount_untaxed) as amount_untaxed
-                          FROM   sale_order
-                        WHERE  date(date_order) >= (select date_trunc('month', date(current_date)))
-                        AND date(date_order)::date <= (select date_trunc('month', date(current_date)) 
+                          FROM   shopify_order_kpi_ept
+                        WHERE  kpi_date >= (select date_trunc('month', date(current_date)))
+                        AND kpi_date <= (select date_trunc('month', date(current_date)) 
                         + '1 MONTH - 1 day')
-                        and shopify_instance_id = %s and state in ('sale','done')
+                        and shopify_instance_id = %s
                         group by 1
                         )foo 
                         GROUP  BY 1
@@ -468,14 +489,14 @@ class ShopifyInstanceEpt(models.Model):
                                 , date(date_trunc('year', (current_date)) + interval '1 YEAR - 1 day')
                                 , interval  '1 MONTH') day
                                 union all
-                                SELECT DATE_TRUNC('month',date(date_order)) as month,
+                                SELECT DATE_TRUNC('month',kpi_date) as month,
                                 sum(amount_untaxed) as amount_untaxed
-                                  FROM   sale_order
-                                WHERE  date(date_order) >= (select date_trunc('year', date(current_date))) AND 
-                                date(date_order)::date <= (select date_trunc('year', date(current_date)) 
+                                  FROM   shopify_order_kpi_ept
+                                WHERE  kpi_date >= (select date_trunc('year', date(current_date))) AND 
+                                kpi_date <= (select date_trunc('year', date(current_date)) 
                                 + '1 YEAR - 1 day')
-                                and shopify_instance_id = %s and state in ('sale','done')
-                                group by DATE_TRUNC('month',date(date_order))
+                                and shopify_instance_id = %s
+                                group by DATE_TRUNC('month',kpi_date)
                                 order by month
                                 )foo 
                                 GROUP  BY foo.month
@@ -483,10 +504,10 @@ class ShopifyInstanceEpt(models.Model):
             return self._cr.dictfetchall()
 
         def graph_of_all_time(record):
-            self._cr.execute("""select TRIM(TO_CHAR(DATE_TRUNC('month',date_order),'YYYY-MM')),sum(amount_untaxed)
-                                from sale_order where shopify_instance_id = %s and state in ('sale','done')
-                                group by DATE_TRUNC('month',date_order) 
-                                order by DATE_TRUNC('month',date_order)""",(record.id,))
+            self._cr.execute("""select TRIM(TO_CHAR(DATE_TRUNC('month',kpi_date),'YYYY-MM')),sum(amount_untaxed)
+                                from shopify_order_kpi_ept where shopify_instance_id = %s
+                                group by DATE_TRUNC('month',kpi_date) 
+                                order by DATE_TRUNC('month',kpi_date)""",(record.id,))
             return self._cr.dictfetchall()
 
         # Prepare values for Graph
@@ -513,18 +534,18 @@ class ShopifyInstanceEpt(models.Model):
             current_total = 0.0
             previous_total = 0.0
             day_of_week = date.weekday(date.today())
-            self._cr.execute("""select sum(amount_untaxed) as current_week from sale_order
-                                where date(date_order) >= (select date_trunc('week', date(current_date))) and
-                                shopify_instance_id=%s and state in ('sale','done')""", (record.id,))
+            self._cr.execute("""select sum(amount_untaxed) as current_week from shopify_order_kpi_ept
+                                where kpi_date >= (select date_trunc('week', date(current_date))) and
+                                shopify_instance_id=%s""", (record.id,))
             current_week_data = self._cr.dictfetchone()
             if current_week_data:
                 current_total = current_week_data.get('current_week') if current_week_data.get('current_week') else 0
             # Previous week data
-            self._cr.execute("""select sum(amount_untaxed) as previous_week from sale_order
-                            where date(date_order) between (select date_trunc('week', current_date) - interval '7 day') 
+            self._cr.execute("""select sum(amount_untaxed) as previous_week from shopify_order_kpi_ept
+                            where kpi_date between (select date_trunc('week', current_date) - interval '7 day') 
                             and (select date_trunc('week', (select date_trunc('week', current_date) - interval '7
                             day')) + interval '%s day')
-                            and shopify_instance_id=%s and state in ('sale','done')
+                            and shopify_instance_id=%s
                             """, (day_of_week, record.id))
             previous_week_data = self._cr.dictfetchone()
             if previous_week_data:
@@ -536,18 +557,18 @@ class ShopifyInstanceEpt(models.Model):
             current_total = 0.0
             previous_total = 0.0
             day_of_month = date.today().day - 1
-            self._cr.execute("""select sum(amount_untaxed) as current_month from sale_order
-                                where date(date_order) >= (select date_trunc('month', date(current_date)))
-                                and shopify_instance_id=%s and state in ('sale','done')""", (record.id,))
+            self._cr.execute("""select sum(amount_untaxed) as current_month from shopify_order_kpi_ept
+                                where kpi_date >= (select date_trunc('month', date(current_date)))
+                                and shopify_instance_id=%s""", (record.id,))
             current_data = self._cr.dictfetchone()
             if current_data:
                 current_total = current_data.get('current_month') if current_data.get('current_month') else 0
             # Previous week data
-            self._cr.execute("""select sum(amount_untaxed) as previous_month from sale_order where date(date_order)
+            self._cr.execute("""select sum(amount_untaxed) as previous_month from shopify_order_kpi_ept where kpi_date
                             between (select date_trunc('month', current_date) - interval '1 month') and
                             (select date_trunc('month', (select date_trunc('month', current_date) - interval
                             '1 month')) + interval '%s days')
-                            and shopify_instance_id=%s and state in ('sale','done')
+                            and shopify_instance_id=%s
                             """, (day_of_month, record.id))
             previous_data = self._cr.dictfetchone()
             if previous_data:
@@ -560,17 +581,17 @@ class ShopifyInstanceEpt(models.Model):
             year_begin = date.today().replace(month=1, day=1)
             year_end = date.today()
             delta = (year_end - year_begin).days - 1
-            self._cr.execute("""select sum(amount_untaxed) as current_year from sale_order
-                                where date(date_order) >= (select date_trunc('year', date(current_date)))
-                                and shopify_instance_id=%s and state in ('sale','done')""",(record.id,))
+            self._cr.execute("""select sum(amount_untaxed) as current_year from shopify_order_kpi_ept
+                                where kpi_date >= (select date_trunc('year', date(current_date)))
+                                and shopify_instance_id=%s""",(record.id,))
             current_data = self._cr.dictfetchone()
             if current_data:
                 current_total = current_data.get('current_year') if current_data.get('current_year') else 0
             # Previous week data
-            self._cr.execute("""select sum(amount_untaxed) as previous_year from sale_order where date(date_order)
+            self._cr.execute("""select sum(amount_untaxed) as previous_year from shopify_order_kpi_ept where kpi_date
                             between (select date_trunc('year', date(current_date) - interval '1 year')) and 
                             (select date_trunc('year', date(current_date) - interval '1 year') + interval '%s days') 
-                            and shopify_instance_id=%s and state in ('sale','done')
+                            and shopify_instance_id=%s
                             """, (delta, record.id))
             previous_data = self._cr.dictfetchone()
             if previous_data:
@@ -600,58 +621,17 @@ class ShopifyInstanceEpt(models.Model):
         Task: 167063
         Added by: Preet Bhatti @Emipro Technologies
         Added on: 29/10/20
-        :return: total number of shopify sale orders ids and action for sale orders of current instance
-        """
-        order_query = """
-            SELECT id
-            FROM sale_order
-            WHERE shopify_instance_id = %s AND state IN ('sale', 'done')
+        :return: total number of shopify sale orders from the KPI rollup and action for sale orders of current
+        instance
         """
-
-        def orders_of_current_week(order_query):
-            qry = order_query + """
-                    AND date(date_order) >= (SELECT date_trunc('week', date(current_date)))
-                    ORDER BY date(date_order)
-                """
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def orders_of_current_month(order_query):
-            qry = order_query + """ and date(date_order) >=(select date_trunc('month', date(current_date))) order by
-            date(date_order)"""
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def orders_of_current_year(order_query):
-            qry = order_query + """ and date(date_order) >= (select date_trunc('year', date(current_date))) order by
-            date(date_order)"""
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def orders_of_all_time(record):
-            self._cr.execute(
-                """
-                SELECT id 
-                FROM sale_order 
-                WHERE shopify_instance_id = %s AND state IN ('sale', 'done')
-                """,
-                (record.id,)
-            )
-            return self._cr.dictfetchall()
-
         order_data = {}
-        if self._context.get('sort') == "week":
-            result = orders_of_current_week(order_query)
-        elif self._context.get('sort') == "month":
-            result = orders_of_current_month(order_query)
-        elif self._context.get('sort') == "year":
-            result = orders_of_current_year(order_query)
-        else:
-            result = orders_of_all_time(self)
-        order_ids = [data.get('id') for data in result]
+        domain = [('shopify_instance_id', '=', self.id), ('state', 'in', ['sale', 'done'])]
+        period_start = self.get_kpi_period_start()
+        if period_start:
+            domain.append(('date_order', '>=', fields.Datetime.to_string(self.get_kpi_utc_start(period_start))))
         view = self.env.ref('shopify_ept.action_shopify_sales_order').sudo().read()[0]
-        action = self.prepare_action(view, [('id', 'in', order_ids)])
-        order_data.update({'order_count': len(order_ids), 'order_action': action})
+        action = self.prepare_action(view, domain)
+        order_data.update({'order_count': self.get_kpi_rollup_total('order_count'), 'order_action': action})
         return order_data
 
     def get_shipped_orders(self):
@@ -660,51 +640,67 @@ class ShopifyInstanceEpt(models.Model):
         Task: 167063
         Added by: Preet Bhatti @Emipro Technologies
         Added on: 29/10/20
-        :return: total number of shopify shipped orders ids and action for shipped orders of current instance
-        """
-        shipped_query = """
-            SELECT so.id 
-            FROM stock_picking.xml sp
-            INNER JOIN sale_order so ON so.procurement_group_id = sp.group_id
-            INNER JOIN stock_location ON stock_location.id = sp.location_dest_id AND stock_location.usage = 'customer'
-            WHERE sp.updated_in_shopify = True 
-            AND sp.state != 'cancel' 
-            AND so.shopify_instance_id = %s
+        :return: total number of shopify shipped orders from the KPI rollup and action for shipped orders of current
+        instance
         """
+        order_data = {}
+        domain = [('shopify_instance_id', '=', self.id),
+                  ('picking_ids', 'any', [('updated_in_shopify', '=', True), ('state', '!=', 'cancel'),
+                                          ('location_dest_id.usage', '=', 'customer')])]
+        period_start = self.get_kpi_period_start()
+        if period_start:
+            domain.append(('date_order', '>=', fields.Datetime.to_string(self.get_kpi_utc_start(period_start))))
+        view = self.env.ref('shopify_ept.action_shopify_sales_order').sudo().read()[0]
+        action = self.prepare_action(view, domain)
+        order_data.update({'order_count': self.get_kpi_rollup_total('shipped_order_count'), 'order_action': action})
+        return order_data
 
-        def shipped_order_of_current_week(shipped_query):
-            qry = shipped_query + " AND date(so.date_order) >= (SELECT date_trunc('week', date(current_date)))"
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def shipped_order_of_current_month(shipped_query):
-            qry = shipped_query + " and date(so.date_order) >= (select date_trunc('month', date(current_date)))"
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def shipped_order_of_current_year(shipped_query):
-            qry = shipped_query + " and date(so.date_order) >= (select date_trunc('year', date(current_date)))"
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def shipped_order_of_all_time(shipped_query):
-            self._cr.execute(shipped_query, (self.id,))
-            return self._cr.dictfetchall()
+    def get_kpi_time_zone(self):
+        """
+        This method is used to get the time zone of the store, in which the order KPI rollup counts the days.
+        :return: pytz time zone, UTC when the store has none.
+        """
+        try:
+            return pytz.timezone(self.shopify_store_time_zone or "UTC")
+        except pytz.UnknownTimeZoneError:
+            return pytz.utc
 
-        order_data = {}
+    def get_kpi_period_start(self):
+        """
+        This method is used to get the first day of the period selected in the dashboard, in the time zone of the
+        store.
+        :return: Date of the start of the week, month or year, False for all the time.
+        """
+        today = datetime.now(pytz.utc).astimezone(self.get_kpi_time_zone()).date()
         if self._context.get('sort') == "week":
-            result = shipped_order_of_current_week(shipped_query)
+            period_start = today - timedelta(days=today.weekday())
         elif self._context.get('sort') == "month":
-            result = shipped_order_of_current_month(shipped_query)
+            period_start = today.replace(day=1)
         elif self._context.get('sort') == "year":
-            result = shipped_order_of_current_year(shipped_query)
+            period_start = today.replace(month=1, day=1)
         else:
-            result = shipped_order_of_all_time(shipped_query)
-        order_ids = [data.get('id') for data in result]
-        view = self.env.ref('shopify_ept.action_shopify_sales_order').sudo().read()[0]
-        action = self.prepare_action(view, [('id', 'in', order_ids)])
-        order_data.update({'order_count': len(order_ids), 'order_action': action})
-        return order_data
+            return False
+        return period_start
+
+    def get_kpi_utc_start(self, day):
+        """
+        This method is used to get the UTC datetime of the start of a day of the store, to filter the orders.
+        :return: Naive datetime in UTC.
+        """
+        local_start = self.get_kpi_time_zone().localize(datetime.combine(day, datetime.min.time()))
+        return local_start.astimezone(pytz.utc).replace(tzinfo=None)
+
+    def get_kpi_rollup_total(self, column):
+        """
+        This method is used to sum a counter of the daily KPI rollup of the instance over the selected period.
+        :param column: Name of the counter in the rollup, like order_count.
+        :return: Total of the counter.
+        """
+        start_date = self.get_kpi_period_start() or None
+        self._cr.execute(SQL("SELECT COALESCE(SUM(%s), 0) FROM shopify_order_kpi_ept "
+                             "WHERE shopify_instance_id = %s AND (%s::date IS NULL OR kpi_date >= %s)",
+                             SQL.identifier(column), self.id, start_date, start_date))
+        return self._cr.fetchone()[0]
 
     def get_total_products(self):
         """
@@ -731,16 +727,16 @@ class ShopifyInstanceEpt(models.Model):
         Task: 167063
         Added by: Preet Bhatti @Emipro Technologies
         Added on: 29/10/20
-        :return: total number of customer ids and action for customers
+        :return: total number of customers and action for customers
         """
         customer_data = {}
-        self._cr.execute("""select partner_id from shopify_res_partner_ept where shopify_instance_id = %s"""
-                         , (self.id,))
-        result = self._cr.dictfetchall()
-        customer_ids = [data.get('partner_id') for data in result]
+        self._cr.execute("""select count(distinct partner_id) from shopify_res_partner_ept
+                        where shopify_instance_id = %s""", (self.id,))
+        customer_count = self._cr.fetchone()[0]
         view = self.env.ref('shopify_ept.action_shopify_partner_form').sudo().read()[0]
-        action = self.prepare_action(view, [('id', 'in', customer_ids), ('active', 'in', [True, False])])
-        customer_data.update({'customer_count': len(customer_ids), 'customer_action': action})
+        action = self.prepare_action(view, [('shopify_partner_ids.shopify_instance_id', '=', self.id),
+                                            ('active', 'in', [True, False])])
+        customer_data.update({'customer_count': customer_count, 'customer_action': action})
         return customer_data
 
     def get_refund(self):
@@ -749,47 +745,18 @@ class ShopifyInstanceEpt(models.Model):
         Task: 167349
         Added by: Preet Bhatti @Emipro Technologies
         Added on: 03/11/20
-        :return: total number of refund order ids and action for customers
-        """
-        refund_query = """
-            SELECT id 
-            FROM account_move 
-            WHERE shopify_instance_id = %s 
-            AND move_type = 'out_refund'
+        :return: total number of refunds from the KPI rollup and action for refunds
         """
-
-        def refund_of_current_week(refund_query):
-            qry = refund_query + " AND date(invoice_date) >= (SELECT date_trunc('week', date(current_date)))"
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def refund_of_current_month(refund_query):
-            qry = refund_query + " and date(invoice_date) >= (select date_trunc('month', date(current_date)))"
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def refund_of_current_year(refund_query):
-            qry = refund_query + " and date(invoice_date) >= (select date_trunc('year', date(current_date)))"
-            self._cr.execute(qry, (self.id,))
-            return self._cr.dictfetchall()
-
-        def refund_of_all_time(refund_query):
-            self._cr.execute(refund_query, (self.id,))
-            return self._cr.dictfetchall()
-
         refund_data = {}
-        if self._context.get('sort') == "week":
-            result = refund_of_current_week(refund_query)
-        elif self._context.get('sort') == "month":
-            result = refund_of_current_month(refund_query)
-        elif self._context.get('sort') == "year":
-            result = refund_of_current_year(refund_query)
-        else:
-            result = refund_of_all_time(refund_query)
-        refund_ids = [data.get('id') for data in result]
+        # The same refunds as the rollup counts: the refunds having an invoice date, draft ones included.
+        domain = [('shopify_instance_id', '=', self.id), ('move_type', '=', 'out_refund'),
+                  ('invoice_date', '!=', False)]
+        period_start = self.get_kpi_period_start()
+        if period_start:
+            domain.append(('invoice_date', '>=', fields.Date.to_string(period_start)))
         view = self.env.ref('shopify_ept.action_refund_shopify_invoices').sudo().read()[0]
-        action = self.prepare_action(view, [('id', 'in', refund_ids)])
-        refund_data.update({'refund_count': len(refund_ids), 'refund_action': action})
+        action = self.prepare_action(view, domain)
+        refund_data.update({'refund_count': self.get_kpi_rollup_total('refund_count'), 'refund_action': action})
         return refund_data
 
     def prepare_action(self, view, domain):
@@ -876,7 +843,27 @@ class ShopifyInstanceEpt(models.Model):
             sales_team = self.create_sales_channel(val.get('name'))
 
             val.update({"shopify_default_pos_customer_id": customer.id, "shopify_section_id": sales_team.id})
-        return super(ShopifyInstanceEpt, self).create(vals)
+        instances = super(ShopifyInstanceEpt, self).create(vals)
+        self.env["shopify.webhook.ept"].clear_webhook_route_cache()
+        # The order KPI rollup of the new instances is built at once instead of at the next hourly run.
+        self.env.ref("shopify_ept.refresh_shopify_order_kpi").sudo()._trigger()
+        return instances
+
+    def write(self, vals):
+        """
+        Inherited for clearing the cache of the webhook routes, when the host or the active state changes, and for
+        rebuilding the order KPI rollup, which counts the days in the time zone of the store, when it changes.
+        """
+        if "shopify_store_time_zone" in vals:
+            changed = self.filtered(lambda instance: instance.shopify_store_time_zone != vals[
+                "shopify_store_time_zone"])
+            if changed:
+                changed.shopify_order_kpi_built = False
+                self.env.ref("shopify_ept.refresh_shopify_order_kpi").sudo()._trigger()
+        res = super(ShopifyInstanceEpt, self).write(vals)
+        if {"shopify_host", "active"} & set(vals):
+            self.env["shopify.webhook.ept"].clear_webhook_route_cache()
+        return res
 
     def create_sales_channel(self, name):
         """
@@ -929,9 +916,80 @@ class ShopifyInstanceEpt(models.Model):
 
         shop_url = self.prepare_shopify_shop_url(self.shopify_host, api_key, password)
 
+        self.configure_shopify_transport()
+        self.configure_shopify_rate_limit()
         shopify.ShopifyResource.set_site(shop_url)
         return True
 
+    def configure_shopify_rate_limit(self):
+        """
+        This method sets the leaky bucket limiter which paces all the Shopify API calls below the call limit of
+        the shop. Every process keeps its own buckets, which are synchronised with the other workers through the
+        database every shopify_ept.api_rate_limit_sync_interval seconds and after a 429, unless the system
+        parameter shopify_ept.api_shared_rate_limit is False.
+        The limiter is kept per database, the connections use the one of the database of their thread.
+        """
+        ir_config_parameter_obj = self.env["ir.config_parameter"].sudo()
+        shared = ir_config_parameter_obj.get_param("shopify_ept.api_shared_rate_limit", "True") not in ("False", "0")
+        max_retries = int(ir_config_parameter_obj.get_param("shopify_ept.api_max_retries", 5) or 0)
+        sync_interval = float(ir_config_parameter_obj.get_param("shopify_ept.api_rate_limit_sync_interval", 5) or 0)
+
+        dbname = self.env.cr.dbname
+        limiter = shopify.rate_limit.get_limiter(dbname)
+        shared_store = limiter.shared_store
+        if shared and getattr(shared_store, "dbname", None) != dbname:
+            shared_store = ShopifyPostgresRateLimitStore(dbname)
+        elif not shared:
+            shared_store = None
+        if shared_store is not limiter.shared_store or limiter.max_retries != max_retries or \
+                limiter.sync_interval != sync_interval:
+            # The buckets of the database are kept when only its settings change.
+            store = limiter.store if limiter is not shopify.rate_limit.get_limiter() else None
+            limiter = shopify.rate_limit.LeakyBucketLimiter(store=store, shared_store=shared_store,
+                                                            max_retries=max_retries, sync_interval=sync_interval)
+            shopify.rate_limit.set_limiter(limiter, dbname)
+        return limiter
+
+    def configure_shopify_transport(self):
+        """
+        This method sets the HTTP transport and timeouts used for the Shopify API requests. By default the
+        requests are sent over keep-alive connections pooled per shop host, instead of a new TLS handshake per call.
+        The configuration is taken from the system parameters shopify_ept.api_pooled_transport,
+        shopify_ept.api_timeout and shopify_ept.api_connect_timeout.
+        """
+        ir_config_parameter_obj = self.env["ir.config_parameter"].sudo()
+        pooled = ir_config_parameter_obj.get_param("shopify_ept.api_pooled_transport", "True") not in ("False", "0")
+        timeout = float(ir_config_parameter_obj.get_param("shopify_ept.api_timeout", 0) or 0) or None
+        connect_timeout = float(ir_config_parameter_obj.get_param("shopify_ept.api_connect_timeout", 0) or 0) or None
+
+        transport = shopify.transport.get_default_transport()
+        if pooled and not isinstance(transport, shopify.transport.PooledTransport):
+            transport = shopify.transport.PooledTransport()
+            shopify.transport.set_default_transport(transport)
+        elif not pooled and not isinstance(transport, shopify.transport.UrllibTransport):
+            transport = shopify.transport.UrllibTransport()
+            shopify.transport.set_default_transport(transport)
+        if pooled:
+            transport.timeout = timeout
+            transport.connect_timeout = connect_timeout
+        if shopify.ShopifyResource.timeout != timeout:
+            shopify.ShopifyResource.timeout = timeout
+        return transport
+
+    def get_shopify_api_metrics(self, reset=False):
+        """
+        This method returns the request count and network latency of the Shopify API calls made by this process
+        for the instance host, to see how much of a sync is spent on waiting for Shopify.
+        :param reset: True to reset the counters after reading them.
+        @return: Dictionary of counters.
+        """
+        self.ensure_one()
+        host = self.shopify_host.split("//")[-1].rstrip("/")
+        metrics = shopify.transport.metrics.snapshot(host).get(host, {})
+        if reset:
+            shopify.transport.metrics.reset(host)
+        return metrics
+
     def prepare_shopify_shop_url(self, host, api_key, password):
         """ This method is used to prepare a shop URL.
             @return shop_url
@@ -1051,7 +1109,8 @@ class ShopifyInstanceEpt(models.Model):
         if event == 'customer':
             topic_list = ["customers/create", "customers/update"]
         if event == 'order':
-            topic_list = ["orders/updated"]
+            topic_list = ["orders/updated", "fulfillment_orders/moved", "fulfillment_orders/split",
+                          "fulfillment_orders/merged", "fulfillment_orders/cancelled"]
         return topic_list
 
     def configure_shopify_product_webhook(self):
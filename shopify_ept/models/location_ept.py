@@ -1,11 +1,9 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 
-import time
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
 
 class ShopifyLocationEpt(models.Model):
     _name = 'shopify.location.ept'
@@ -57,10 +55,6 @@ class ShopifyLocationEpt(models.Model):
         shopify_location_list = []
         try:
             locations = shopify.Location.find()
-        except ClientError as error:
-            if hasattr(error, "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                locations = shopify.Location.find()
         except Exception as error:
             raise UserError(error)
         shop = shopify.Shop.current()
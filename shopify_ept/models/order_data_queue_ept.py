@@ -3,13 +3,14 @@
 
 import time
 import re
+import json
 import logging
 from datetime import datetime, timedelta
 import pytz
+from markupsafe import Markup, escape
 from odoo import models, fields, api, _
 
 from odoo.exceptions import UserError
-from ..shopify.pyactiveresource.connection import ClientError
 from .. import shopify
 
 utc = pytz.utc
@@ -54,12 +55,90 @@ class ShopifyOrderDataQueueEpt(models.Model):
     is_action_require = fields.Boolean(default=False, help="it is used  to find the action require queue")
     queue_type = fields.Selection([("shipped", "Shipped Order Queue"), ("unshipped", "Unshipped Order Queue")],
                                   help="Identify to queue for which type of order import.")
+    profile_summary = fields.Text(string="Import Profile", compute="_compute_profile_summary",
+                                  help="Seconds, SQL queries and API calls of every stage of the imports of the "
+                                       "queue lines, in JSON.")
+    profile_summary_html = fields.Html(string="Import Stages", compute="_compute_profile_summary_html",
+                                       sanitize=False)
 
     @api.depends('order_data_queue_line_ids.shopify_order_common_log_lines_ids')
     def _compute_log_lines(self):
         for line in self:
             line.shopify_order_common_log_lines_ids = line.order_data_queue_line_ids.shopify_order_common_log_lines_ids
 
+    @api.depends('order_data_queue_line_ids.profile_stages')
+    def _compute_profile_summary(self):
+        """
+        Sums the import stages of the queue lines with grouped queries, the lines are written by the import and
+        the queue is never written for its profile.
+        """
+        queue_ids = [queue_id for queue_id in self.ids if isinstance(queue_id, int)]
+        summaries = {}
+        if queue_ids:
+            self.env["shopify.order.data.queue.line.ept"].flush_model(["shopify_order_data_queue_id",
+                                                                       "profile_stages"])
+            self._cr.execute("""
+                SELECT shopify_order_data_queue_id, COUNT(*)
+                FROM shopify_order_data_queue_line_ept
+                WHERE shopify_order_data_queue_id IN %s AND profile_stages IS NOT NULL
+                GROUP BY shopify_order_data_queue_id
+            """, (tuple(queue_ids),))
+            summaries = {queue_id: {"orders": orders, "stages": {}} for queue_id, orders in self._cr.fetchall()}
+            self._cr.execute("""
+                SELECT queue_line.shopify_order_data_queue_id, stage.key, COUNT(*), SUM((stage.value->>0)::float),
+                       SUM((stage.value->>1)::int), SUM((stage.value->>2)::int)
+                FROM shopify_order_data_queue_line_ept AS queue_line,
+                     jsonb_each(queue_line.profile_stages::jsonb) AS stage
+                WHERE queue_line.shopify_order_data_queue_id IN %s AND queue_line.profile_stages IS NOT NULL
+                GROUP BY queue_line.shopify_order_data_queue_id, stage.key
+            """, (tuple(queue_ids),))
+            for queue_id, stage, count, seconds, sql_count, api_count in self._cr.fetchall():
+                summaries[queue_id]["stages"][stage] = {"count": count, "seconds": round(seconds, 4),
+                                                        "sql": sql_count, "api": api_count}
+        for queue in self:
+            summary = summaries.get(queue.id)
+            queue.profile_summary = json.dumps(summary) if summary else False
+
+    @api.depends('profile_summary')
+    def _compute_profile_summary_html(self):
+        """
+        Shows the import profile of the queue as a table of its stages, the slowest stage first.
+        """
+        for queue in self:
+            summary = json.loads(queue.profile_summary or "{}")
+            stages = summary.get("stages", {})
+            if not stages:
+                queue.profile_summary_html = False
+                continue
+            orders = summary.get("orders") or 1
+            rows = Markup("").join(
+                Markup("<tr><td>%s</td><td>%s</td><td>%.2f</td><td>%.4f</td><td>%s</td><td>%s</td></tr>") % (
+                    escape(name), values["count"], values["seconds"], values["seconds"] / orders, values["sql"],
+                    values["api"]) for name, values in sorted(stages.items(), key=lambda item: -item[1]["seconds"]))
+            queue.profile_summary_html = Markup(
+                "<p>%s orders, %.2f seconds, %s SQL queries, %s API calls.</p>"
+                "<table class='table table-sm'><thead><tr><th>Stage</th><th>Calls</th><th>Seconds</th>"
+                "<th>Seconds per Order</th><th>SQL Queries</th><th>API Calls</th></tr></thead>"
+                "<tbody>%s</tbody></table>") % (summary.get("orders", 0),
+                                                sum(values["seconds"] for values in stages.values()),
+                                                sum(values["sql"] for values in stages.values()),
+                                                sum(values["api"] for values in stages.values()), rows)
+
+    def action_open_import_profile(self):
+        """
+        Returns action for opening the import profile of every order of the queue, which can be exported.
+        @return: Action to open the queue lines with their import stages.
+        """
+        return {
+            "name": "Import Profile",
+            "type": "ir.actions.act_window",
+            "res_model": "shopify.order.data.queue.line.ept",
+            "views": [(self.env.ref("shopify_ept.view_order_data_queue_line_profile_tree").id, "list"),
+                      (False, "form")],
+            "domain": [("shopify_order_data_queue_id", "in", self.ids), ("profile_stages", "!=", False)],
+            "context": {"create": False},
+        }
+
     @api.depends('order_data_queue_line_ids.state')
     def _compute_queue_state(self):
         """
@@ -83,13 +162,15 @@ class ShopifyOrderDataQueueEpt(models.Model):
             and display the count records in the form view order data queue.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 2/11/2019.
         """
+        state_counts = self.env["data.queue.mixin.ept"].get_queue_line_state_count_ept(
+            "shopify.order.data.queue.line.ept", "shopify_order_data_queue_id", self)
         for order_queue in self:
-            queue_lines = order_queue.order_data_queue_line_ids
-            order_queue.order_queue_line_total_record = len(queue_lines)
-            order_queue.order_queue_line_draft_record = len(queue_lines.filtered(lambda x: x.state == "draft"))
-            order_queue.order_queue_line_done_record = len(queue_lines.filtered(lambda x: x.state == "done"))
-            order_queue.order_queue_line_fail_record = len(queue_lines.filtered(lambda x: x.state == "failed"))
-            order_queue.order_queue_line_cancel_record = len(queue_lines.filtered(lambda x: x.state == "cancel"))
+            state_count = state_counts.get(order_queue.id, {})
+            order_queue.order_queue_line_total_record = sum(state_count.values())
+            order_queue.order_queue_line_draft_record = state_count.get("draft", 0)
+            order_queue.order_queue_line_done_record = state_count.get("done", 0)
+            order_queue.order_queue_line_fail_record = state_count.get("failed", 0)
+            order_queue.order_queue_line_cancel_record = state_count.get("cancel", 0)
 
     @api.model_create_multi
     def create(self, vals):
@@ -116,7 +197,9 @@ class ShopifyOrderDataQueueEpt(models.Model):
             if not from_date:
                 from_date = to_date - timedelta(3)
 
-            self.shopify_create_order_data_queues(instance, from_date, to_date, created_by="scheduled_action")
+            self.env["shopify.cron.scheduler.ept"].run_instance_job(
+                instance, "import_order", self.shopify_create_order_data_queues, instance, from_date, to_date,
+                created_by="scheduled_action")
         return True
 
     def import_shipped_order_cron_action(self, ctx=False):
@@ -131,8 +214,9 @@ class ShopifyOrderDataQueueEpt(models.Model):
         if not from_date:
             from_date = to_date - timedelta(3)
 
-        self.shopify_create_order_data_queues(instance, from_date, to_date, created_by="scheduled_action",
-                                              order_type="shipped")
+        self.env["shopify.cron.scheduler.ept"].run_instance_job(
+            instance, "import_shipped_order", self.shopify_create_order_data_queues, instance, from_date, to_date,
+            created_by="scheduled_action", order_type="shipped")
         return True
 
     def import_buy_with_prime_order_cron_action(self, ctx=False):
@@ -147,8 +231,9 @@ class ShopifyOrderDataQueueEpt(models.Model):
         if not from_date:
             from_date = to_date - timedelta(3)
 
-        self.shopify_create_order_data_queues(instance, from_date, to_date, created_by="scheduled_action",
-                                              order_type="buy_with_prime")
+        self.env["shopify.cron.scheduler.ept"].run_instance_job(
+            instance, "import_buy_with_prime_order", self.shopify_create_order_data_queues, instance, from_date,
+            to_date, created_by="scheduled_action", order_type="buy_with_prime")
         return True
 
     def convert_dates_by_timezone(self, instance, from_date, to_date):
@@ -188,16 +273,11 @@ class ShopifyOrderDataQueueEpt(models.Model):
             queue_type = 'unshipped'
             for order_status_id in instance.shopify_order_status_ids:
                 order_status = order_status_id.status
-                order_ids = self.shopify_order_request(instance, from_date, to_date, order_status)
-
-                if order_ids:
-                    order_queues = order_data_queue_line_obj.create_order_data_queue_line(order_ids,
-                                                                                          instance,
-                                                                                          queue_type,
-                                                                                          created_by)
-                    if len(order_ids) >= 250:
-                        order_queue_list = self.list_all_orders(order_ids, instance, created_by, queue_type)
-                        order_queues += order_queue_list
+                for orders in self.shopify_order_pages(instance, from_date, to_date, order_status):
+                    order_queues += order_data_queue_line_obj.create_order_data_queue_line(orders,
+                                                                                           instance,
+                                                                                           queue_type,
+                                                                                           created_by)
                 instance.last_date_order_import = to_date - timedelta(days=2)
         elif order_type == "shipped":
             order_queues = self.shopify_shipped_order_request(instance, from_date, to_date, created_by="import",
@@ -239,6 +319,24 @@ class ShopifyOrderDataQueueEpt(models.Model):
 
         return order_ids
 
+    def shopify_order_pages(self, instance, from_date, to_date, order_type):
+        """ This method is used to iterate the pages of orders from Shopify as list of dictionaries. Every page is
+            decoded once and the next page is fetched while the current one is added in the queues.
+            :param order_type: Which type of orders pull from Shopify to Odoo.
+            @return: Generator of list of orders.
+        """
+        from_date, to_date = self.convert_dates_by_timezone(instance, from_date, to_date)
+        pages = shopify.RawPageCursor(shopify.Order, status="any", fulfillment_status=order_type,
+                                      updated_at_min=from_date, updated_at_max=to_date, limit=250).pages()
+        while True:
+            try:
+                orders = next(pages)
+            except StopIteration:
+                return
+            except Exception as error:
+                raise UserError(error)
+            yield orders
+
     def shopify_shipped_order_request(self, instance, from_date, to_date, order_type, created_by):
         """ This method is used to import shipped order from the shopify store to Odoo.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 30 December 2020 .
@@ -247,24 +345,20 @@ class ShopifyOrderDataQueueEpt(models.Model):
         order_data_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
         order_queues = []
         queue_type = 'shipped'
-        order_ids = self.shopify_order_request(instance, from_date, to_date, queue_type)
-        if order_ids and order_type == "buy_with_prime":
-            order_ids = self.filter_buy_with_prime_order(instance, order_ids)
-        if order_ids:
-            order_queues = order_data_queue_line_obj.create_order_data_queue_line(order_ids,
-                                                                                  instance,
-                                                                                  queue_type,
-                                                                                  created_by)
-            if len(order_ids) >= 250:
-                order_queue_list = self.list_all_orders(order_ids, instance, created_by, queue_type)
-                order_queues += order_queue_list
-
+        for orders in self.shopify_order_pages(instance, from_date, to_date, queue_type):
+            if order_type == "buy_with_prime":
+                orders = self.filter_buy_with_prime_order(instance, orders)
+            if orders:
+                order_queues += order_data_queue_line_obj.create_order_data_queue_line(orders,
+                                                                                       instance,
+                                                                                       queue_type,
+                                                                                       created_by)
         return order_queues
 
     def filter_buy_with_prime_order(self, instance, order_ids):
         buy_with_prime_order_ids = []
         for order_id in order_ids:
-            order = order_id.to_dict()
+            order = order_id if isinstance(order_id, dict) else order_id.to_dict()
             for buy_with_prime_tag in instance.buy_with_prime_tag_ids:
                 tags = order.get("tags", "").strip().split(",")
                 tags = [tag.strip() for tag in tags]
@@ -272,53 +366,6 @@ class ShopifyOrderDataQueueEpt(models.Model):
                     buy_with_prime_order_ids.append(order_id)
         return buy_with_prime_order_ids
 
-    def list_all_orders(self, result, instance, created_by, queue_type):
-        """
-        This method used to get the list of orders from Shopify to Odoo.
-        @param result: Response of order which received from Shopify store.
-        @param order_type: Here we receive 2 type of order type(unshipped, shipped).
-        @param created_by: To identify which process is created a queue record(webhook, Manually).
-        @param instance:
-        @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 06/11/2019.
-        Task_id : 157350
-        Modify on date 27/12/2019 Taken pagination changes
-        @change : Maulik Barad on Date 10-Sep-2020.
-        """
-        order_data_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
-        order_queue_list = []
-        catch = ""
-
-        while result:
-            page_info = ""
-            # link: link of next page.
-            link = (result.metadata.get('headers', {}).get('Link') or
-                    result.metadata.get('headers', {}).get('link') or
-                    shopify.ShopifyResource.connection.response.headers.get('Link') or
-                    shopify.ShopifyResource.connection.response.headers.get('link'))
-            if not link or not isinstance(link, str):
-                return order_queue_list
-
-            for page_link in link.split(','):
-                if page_link.find('next') > 0:
-                    page_info = page_link.split(';')[0].strip('<>').split('page_info=')[1]
-                    try:
-                        result = shopify.Order().find(limit=250, page_info=page_info)
-                    except ClientError as error:
-                        if hasattr(error,
-                                   "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                            time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                            result = shopify.Order().find(limit=250, page_info=page_info)
-                    except Exception as error:
-                        raise UserError(error)
-                    if result:
-                        order_queues = order_data_queue_line_obj.create_order_data_queue_line(result, instance,
-                                                                                              queue_type,
-                                                                                              created_by)
-                        order_queue_list += order_queues
-            if catch == page_info:
-                break
-        return order_queue_list
-
     def import_order_process_by_remote_ids(self, instance, order_ids):
         """
         This method is used for get a order from shopify based on order ids and create its queue and process it.
@@ -2,13 +2,23 @@
 # See LICENSE file for full copyright and licensing details.
 import json
 import logging
+import os
+import socket
+import threading
 import time
-from odoo import models, fields
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from odoo import models, fields, api
 from .. import shopify
 from ..shopify.pyactiveresource.connection import ClientError
+from .shopify_import_profiler import ShopifyImportProfiler
 
 _logger = logging.getLogger("Shopify Order Queue Line")
 
+# Throughput counters of the parallel order queue workers running in this process, keyed by worker name.
+_worker_throughput = {}
+_worker_throughput_lock = threading.Lock()
+
 
 class ShopifyOrderDataQueueLineEpt(models.Model):
     _name = "shopify.order.data.queue.line.ept"
@@ -35,6 +45,22 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
                                                          "shopify_order_data_queue_line_id",
                                                          help="Log lines created against which line.")
     name = fields.Char(help="Order Name")
+    claimed_by = fields.Char(copy=False, help="Parallel queue worker which has claimed this line for processing.")
+    claimed_at = fields.Datetime(copy=False, help="Date and Time, When the line was claimed by a queue worker.")
+    claim_count = fields.Integer(copy=False, readonly=True,
+                                 help="Number of times the line was claimed by a parallel queue worker.")
+    coalesced_count = fields.Integer(copy=False, readonly=True,
+                                     help="Number of events of this order replaced by a later one, while the line "
+                                          "was waiting to be processed.")
+    profile_seconds = fields.Float(string="Import Seconds", copy=False, readonly=True, digits=(16, 4),
+                                   help="Wall time of the last import of the order.")
+    profile_sql_count = fields.Integer(string="Import SQL Queries", copy=False, readonly=True,
+                                       help="SQL statements executed by the last import of the order.")
+    profile_api_count = fields.Integer(string="Import API Calls", copy=False, readonly=True,
+                                       help="Shopify API calls made by the last import of the order.")
+    profile_stages = fields.Text(string="Import Stages", copy=False, readonly=True,
+                                 help="Seconds, SQL queries and API calls of every stage of the last import of the "
+                                      "order, in JSON.")
 
     def create_order_queue_line(self, order_dict, instance, order_data, customer_name, customer_email, order_queue_id):
         """
@@ -44,8 +70,23 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
         :param order_queue_id: Record of order queue.
         @author: Maulik Barad on Date 10-Sep-2020.
         """
-        instance.connect_in_shopify()
         order_data_queue_line_obj = self.env["shopify.order.data.queue.line.ept"]
+        # Only the latest event of an order waiting in the queue is kept, the earlier ones are replaced in place.
+        # Lines claimed by a parallel worker are being processed, a new line is created for them.
+        existing_data = order_data_queue_line_obj.search(
+            [('shopify_order_id', '=', order_dict.get('id')), ('shopify_instance_id', '=', instance.id),
+             ('state', 'in', ['draft', 'failed']), ('shopify_order_data_queue_id.is_action_require', '=', False),
+             ('claimed_by', '=', False)], order="id desc")
+        existing_data, duplicate_data = existing_data[:1], existing_data[1:]
+        coalesced_count = sum(line.coalesced_count + 1 for line in existing_data | duplicate_data)
+        if duplicate_data:
+            duplicate_data.write({'state': 'cancel', 'processed_at': datetime.now()})
+        if existing_data and self.is_stale_order_event(existing_data, order_dict):
+            # Shopify does not guarantee the order of delivery, an older event must not replace a newer one.
+            existing_data.write({'coalesced_count': coalesced_count})
+            return True
+
+        instance.connect_in_shopify()
         # get transaction data call api
         result = []
         transactions = []
@@ -53,24 +94,14 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
             try:
                 transactions = shopify.Transaction().find(order_id=order_dict.get('id'))
             except ClientError as error:
-                if hasattr(error,
-                           "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                    transactions = shopify.Transaction().find(order_id=order_dict.get('id'))
+                _logger.info("Transactions of Shopify order %s are not requested. Error: %s", order_dict.get('id'),
+                             error)
             for transaction in transactions:
                 transaction_dict = transaction.to_dict()
                 result.append(transaction_dict)
         order_data.update({'transaction': result})
 
-        # get fulfillment data call api
-        # shopify_order = shopify.Order().find(order_dict.get('id'))
-        # fulfillment_data = shopify_order.get('fulfillment_orders')
-        # new_order_data.update({'fulfillment_data': fulfillment_data})
-
         order_data = json.dumps(order_data)
-        existing_data = order_data_queue_line_obj.search(
-            [('shopify_order_id', '=', order_dict.get('id')), ('shopify_instance_id', '=', instance.id),
-             ('state', 'in', ['draft', 'failed']), ('shopify_order_data_queue_id.is_action_require', '=', False)])
         existing_queue = existing_data.shopify_order_data_queue_id
         order_queue_line_vals = {"shopify_order_id": order_dict.get("id", False),
                                  "shopify_instance_id": instance.id,
@@ -82,14 +113,31 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
         if not existing_data:
             self.create(order_queue_line_vals)
         else:
-            order_queue_line_vals.update({'shopify_order_data_queue_id':existing_queue.id})
+            order_queue_line_vals.update({'shopify_order_data_queue_id': existing_queue.id,
+                                          'coalesced_count': coalesced_count})
             if existing_data.state == 'failed':
-                order_queue_line_vals.update({'state':'draft'})
+                order_queue_line_vals.update({'state': 'draft'})
             existing_data.write(order_queue_line_vals)
-            if not existing_queue.order_data_queue_line_ids:
-                existing_queue.unlink()
+            _logger.info("Order %s replaced in queue line %s, %s events coalesced.", order_dict.get("name"),
+                         existing_data.id, coalesced_count)
         return True
 
+    def is_stale_order_event(self, queue_line, order_dict):
+        """
+        This method is used to check that the order data of the event is older than the data of the queue line.
+        :param queue_line: Record of the queue line waiting to be processed.
+        :param order_dict: The response of order in the dictionary.
+        @return: True if the queue line has newer data.
+        """
+        try:
+            queued_updated_at = json.loads(queue_line.order_data or "{}").get("updated_at")
+            updated_at = order_dict.get("updated_at")
+            if not queued_updated_at or not updated_at:
+                return False
+            return datetime.fromisoformat(queued_updated_at) > datetime.fromisoformat(updated_at)
+        except (ValueError, TypeError):
+            return False
+
     def create_order_data_queue_line(self, orders_data, instance, queue_type, created_by="import"):
         """
         This method used to create order data queue lines. It creates new queue after 50 order queue lines.
@@ -104,19 +152,22 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
         fulfillment_data = []
         is_new_order = bool(self._context.get('is_new_order'))
         queue_type_is_buy_with_prime = False
+        fulfillment_order_cache_obj = self.env["shopify.fulfillment.order.cache"]
         for order in orders_data:
             if queue_type != 'shipped' and instance.is_delivery_multi_warehouse:
+                # Orders of the page cursor are dictionaries, the others are resources of the order.
+                shopify_order_id = order.get("id") if isinstance(order, dict) else order.id
                 try:
-                    fulfillment_data = order.get('fulfillment_orders')
+                    fulfillment_data = fulfillment_order_cache_obj.fetch_fulfillment_orders_ept(instance,
+                                                                                                shopify_order_id)
                 except ClientError as error:
-                    if hasattr(error,
-                               "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                        time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                        fulfillment_data = order.get('fulfillment_orders')
+                    _logger.info("Fulfillment orders of Shopify order %s are not requested. Error: %s",
+                                 shopify_order_id, error)
+                    fulfillment_data = []
             if created_by == "webhook" and not is_new_order:
                 order_queue, need_to_create_queue = self.search_webhook_order_queue(created_by, instance, order,
                                                                                     queue_type, need_to_create_queue)
-            elif not is_new_order:
+            elif not is_new_order and not isinstance(order, dict):
                 order = order.to_dict()
 
             if need_to_create_queue:
@@ -129,7 +180,7 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
                 need_to_create_queue = False
                 _logger.info(message)
 
-            data = json.loads(json.dumps(order))
+            data = dict(order)
             if instance.import_buy_with_prime_shopify_order:
                 queue_type_is_buy_with_prime = any(
                     buy_with_prime_tag.name in data.get("tags") for buy_with_prime_tag in
@@ -220,6 +271,9 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
         shopify_order_queue_obj = self.env["shopify.order.data.queue.ept"]
         order_queue_ids = []
 
+        if self.env["ir.config_parameter"].sudo().get_param("shopify_ept.parallel_order_queue"):
+            return self.auto_import_order_queue_data_parallel()
+
         update_query = """
             UPDATE shopify_order_data_queue_ept
             SET is_process_queue = %s
@@ -240,20 +294,22 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
         order_data_queue_list = self._cr.dictfetchall()
         order_queue_list = [queue_data.get('id') for queue_data in order_data_queue_list]
         if order_queue_list:
-            queues = shopify_order_queue_obj.browse(order_queue_list)
-            self.filter_order_queue_lines_and_post_message(queues)
+            queues = shopify_order_queue_obj.browse(list(dict.fromkeys(order_queue_list)))
+            self.env["shopify.cron.scheduler.ept"].process_queues_by_instance(
+                queues, "process_order_queue", self.filter_order_queue_lines_and_post_message)
 
-    def filter_order_queue_lines_and_post_message(self, queues):
+    def filter_order_queue_lines_and_post_message(self, queues, deadline=None):
         """
         This method is used to post a message if the queue is process more than 3 times otherwise
         it calls the child method to process the order queue line.
         :param queues: Record of the order queues.
+        :param deadline: Timestamp after which no more queue is processed, the time of the cron by default.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 16 October 2020 .
         """
         common_log_line_obj = self.env["common.log.lines.ept"]
-        start = time.time()
-        order_queue_process_cron_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
-            "shopify_ept.process_shopify_order_queue")
+        if not deadline:
+            deadline = time.time() + queues.shopify_instance_id.get_shopify_cron_execution_time(
+                "shopify_ept.process_shopify_order_queue") - 60
 
         for queue in queues:
             order_data_queue_line_ids = queue.order_data_queue_line_ids.filtered(lambda x: x.state == "draft")
@@ -272,7 +328,7 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
 
             self._cr.commit()
             order_data_queue_line_ids.process_import_order_queue_data()
-            if time.time() - start > order_queue_process_cron_time - 60:
+            if time.time() > deadline:
                 return True
 
     def process_import_order_queue_data(self, update_order=False):
@@ -294,13 +350,266 @@ class ShopifyOrderDataQueueLineEpt(models.Model):
                 return True
 
             queue_id.is_process_queue = True
+            profiler = ShopifyImportProfiler(self._cr)
+            with profiler.stage("hydrate"):
+                self.hydrate_shopify_order_data(instance)
+            queue_lines = self.filtered("order_data")
             # Below two line used for When the update order webhook calls.
             if update_order or queue_id.created_by == "webhook":
                 created_by = 'Webhook'
-                sale_order_obj.update_shopify_order(self, created_by, instance)
+                sale_order_obj.update_shopify_order(queue_lines, created_by, instance)
             else:
-                sale_order_obj.import_shopify_orders(self, instance)
+                sale_order_obj.with_context(shopify_import_profiler=profiler).import_shopify_orders(queue_lines,
+                                                                                                   instance)
+            queue_lines.store_import_profile(profiler)
             queue_id.write({'is_process_queue': False})
 
             if instance.is_shopify_create_schedule:
                 queue_id.create_schedule_activity(queue_id)
+
+    def store_import_profile(self, profiler):
+        """
+        This method is used to save the stages recorded by the profiler of an import on the queue lines. Only the
+        lines are written, the summary of their queue is computed from them when it is displayed. The stages
+        outside of an order, like the hydration of the lines, are logged only.
+        :param profiler: ShopifyImportProfiler of the import of the queue lines.
+        """
+        for queue_line in self.filtered(lambda line: line.id in profiler.orders):
+            seconds, sql_count, api_count, stages = profiler.order_breakdown(queue_line.id)
+            queue_line.write({"profile_seconds": seconds, "profile_sql_count": sql_count,
+                              "profile_api_count": api_count, "profile_stages": json.dumps(stages)})
+        summary = profiler.summary()
+        _logger.info("Import stages of %s orders: %s", summary["orders"], ", ".join(
+            "%s %.2fs/%s sql/%s api" % (name, values["seconds"], values["sql"], values["api"])
+            for name, values in summary["stages"].items()))
+        return True
+
+    def hydrate_shopify_order_data(self, instance):
+        """
+        This method is used to fetch the order response of the queue lines which only have the order id, e.g. the
+        lines of a bulk operation created before the order data was exported in bulk. The orders are fetched by 250
+        ids at a time instead of paging through all the orders.
+        :param instance: Record of the Shopify instance.
+        """
+        queue_lines = self.filtered(lambda line: not line.order_data and line.shopify_order_id and
+                                                 line.state in ["draft", "failed"])
+        if not queue_lines:
+            return True
+        instance.connect_in_shopify()
+        fulfillment_order_cache_obj = self.env["shopify.fulfillment.order.cache"]
+        for offset in range(0, len(queue_lines), 250):
+            batch = queue_lines[offset:offset + 250]
+            orders = shopify.Order().find(ids=",".join(batch.mapped("shopify_order_id")), status="any", limit=250)
+            orders_by_id = {str(order.id): order for order in orders}
+            for queue_line in batch:
+                order = orders_by_id.get(queue_line.shopify_order_id)
+                if not order:
+                    queue_line.write({"state": "failed"})
+                    continue
+                fulfillment_data = []
+                if queue_line.shopify_order_data_queue_id.queue_type != 'shipped' and \
+                        instance.is_delivery_multi_warehouse:
+                    fulfillment_data = fulfillment_order_cache_obj.fetch_fulfillment_orders_ept(
+                        instance, queue_line.shopify_order_id)
+                order_dict = order.to_dict()
+                data = json.loads(json.dumps(order_dict))
+                is_buy_with_prime = False
+                if instance.import_buy_with_prime_shopify_order:
+                    is_buy_with_prime = any(buy_with_prime_tag.name in data.get("tags") for buy_with_prime_tag in
+                                            instance.buy_with_prime_tag_ids)
+                data.update({'fulfillment_data': fulfillment_data, "buy_with_prime": is_buy_with_prime})
+                transactions = []
+                if order_dict.get('payment_gateway_names'):
+                    transactions = [transaction.to_dict() for transaction in
+                                    shopify.Transaction().find(order_id=order_dict.get('id'))]
+                data.update({'transaction': transactions})
+                queue_line.write({"order_data": json.dumps(data)})
+        self._cr.commit()
+        return True
+
+    def auto_import_order_queue_data_parallel(self):
+        """
+        This method is used to drain the order queue lines with several workers at the same time. Each worker
+        claims a small batch of draft lines of one queue with row level locks(FOR UPDATE SKIP LOCKED), a queue is
+        processed by one worker at a time, so the workers never write the same queue or import an order twice.
+        It will be called from auto queue process cron when the parallel order queue configuration is enabled.
+        """
+        self.set_action_require_on_exhausted_queues()
+        ir_config_parameter_obj = self.env["ir.config_parameter"].sudo()
+        worker_count = max(int(ir_config_parameter_obj.get_param("shopify_ept.order_queue_workers", 1) or 1), 1)
+        cron_time = self.env["shopify.instance.ept"].get_shopify_cron_execution_time(
+            "shopify_ept.process_shopify_order_queue")
+        deadline = time.time() + cron_time - 60
+        worker_prefix = "%s:%s:%s" % (socket.gethostname(), os.getpid(), threading.get_ident())
+
+        if worker_count == 1:
+            return self.process_order_queue_claims(worker_prefix, deadline)
+
+        with ThreadPoolExecutor(max_workers=worker_count) as executor:
+            for number in range(worker_count):
+                executor.submit(self._run_order_queue_worker, "%s/%s" % (worker_prefix, number), deadline)
+        return True
+
+    def _run_order_queue_worker(self, worker_name, deadline):
+        """
+        Runs one pooled worker with its own cursor, so the claimed batches are committed independently.
+        :param worker_name: Unique name of the worker.
+        :param deadline: Timestamp after which the worker must stop claiming new batches.
+        """
+        try:
+            with self.env.registry.cursor() as cr:
+                env = api.Environment(cr, self.env.uid, self.env.context)
+                env[self._name].process_order_queue_claims(worker_name, deadline)
+        except Exception as error:
+            _logger.exception("Order queue worker %s stopped with an error: %s", worker_name, error)
+
+    def process_order_queue_claims(self, worker_name, deadline):
+        """
+        Claims batches of draft order queue lines and processes them until the queue is empty or the deadline of
+        the cron is reached.
+        :param worker_name: Unique name of the worker, stored in the claimed lines.
+        :param deadline: Timestamp after which the worker must stop claiming new batches.
+        """
+        batch_size = max(int(self.env["ir.config_parameter"].sudo().get_param(
+            "shopify_ept.order_queue_claim_size", 5) or 5), 1)
+        lease_time = max(deadline - time.time(), 60)
+        # Lines the worker has left in draft are released at once for the other workers, the worker itself does not
+        # claim them again in this run, so they are not retried in a loop.
+        unfinished_ids = set()
+
+        while time.time() < deadline:
+            queue_lines = self.claim_order_queue_lines(worker_name, batch_size, lease_time, unfinished_ids)
+            if not queue_lines:
+                break
+            start = time.time()
+            try:
+                for queue in queue_lines.shopify_order_data_queue_id:
+                    queue_lines.filtered(lambda line: line.shopify_order_data_queue_id == queue) \
+                        .process_import_order_queue_data()
+            except Exception:
+                self._cr.rollback()
+                queue_lines.invalidate_recordset()
+                unfinished_ids.update(queue_lines.filtered(lambda line: line.state == "draft").ids)
+                queue_lines.write({"claimed_by": False, "claimed_at": False})
+                self._cr.commit()
+                raise
+            unfinished_ids.update(queue_lines.filtered(lambda line: line.state == "draft").ids)
+            queue_lines.write({"claimed_by": False, "claimed_at": False})
+            self._cr.commit()
+            self.update_order_queue_worker_throughput(worker_name, queue_lines, time.time() - start)
+
+        stats = self.get_order_queue_worker_throughput().get(worker_name)
+        if stats:
+            _logger.info("Order queue worker %s processed %s lines(%s done, %s failed) in %.2f seconds.",
+                         worker_name, stats["processed"], stats["done"], stats["failed"], stats["seconds"])
+        return True
+
+    def claim_order_queue_lines(self, worker_name, batch_size, lease_time, skip_line_ids=None):
+        """
+        Claims the draft order queue lines of one queue for a worker. A queue having lines claimed by another
+        worker is skipped, as well as a queue locked by another worker which is claiming it, so a queue is
+        processed by one worker at a time. The claim is committed at once so the lines stay reserved while the
+        worker commits order by order. A claim older than the lease time is treated as abandoned by a crashed
+        worker and claimed again, a line is claimed 3 times at most.
+        :param worker_name: Unique name of the worker.
+        :param batch_size: Maximum number of lines to claim.
+        :param lease_time: Seconds after which a claim can be taken over by another worker.
+        :param skip_line_ids: Ids of the lines not to claim, e.g. the lines the worker has left in draft.
+        @return: Records of the claimed order queue lines.
+        """
+        claim_query = """
+            WITH claimed_queue AS (
+                SELECT queue.id
+                FROM shopify_order_data_queue_ept AS queue
+                INNER JOIN shopify_instance_ept AS instance ON queue.shopify_instance_id = instance.id
+                WHERE queue.is_action_require IS NOT TRUE AND instance.active
+                AND EXISTS (SELECT 1 FROM shopify_order_data_queue_line_ept AS queue_line
+                            WHERE queue_line.shopify_order_data_queue_id = queue.id AND queue_line.state = 'draft'
+                            AND COALESCE(queue_line.claim_count, 0) < %(max_claims)s
+                            AND queue_line.id != ALL(%(skip_line_ids)s::int[])
+                            AND (queue_line.claimed_at IS NULL OR queue_line.claimed_at < %(lease_limit)s))
+                AND NOT EXISTS (SELECT 1 FROM shopify_order_data_queue_line_ept AS queue_line
+                                WHERE queue_line.shopify_order_data_queue_id = queue.id
+                                AND queue_line.state = 'draft' AND queue_line.claimed_at >= %(lease_limit)s
+                                AND queue_line.claimed_by != %(worker)s)
+                ORDER BY queue.create_date, queue.id
+                LIMIT 1
+                FOR UPDATE OF queue SKIP LOCKED
+            )
+            UPDATE shopify_order_data_queue_line_ept
+            SET claimed_by = %(worker)s, claimed_at = %(now)s, claim_count = COALESCE(claim_count, 0) + 1
+            WHERE id IN (
+                SELECT queue_line.id
+                FROM shopify_order_data_queue_line_ept AS queue_line
+                WHERE queue_line.shopify_order_data_queue_id IN (SELECT id FROM claimed_queue)
+                AND queue_line.state = 'draft' AND COALESCE(queue_line.claim_count, 0) < %(max_claims)s
+                AND queue_line.id != ALL(%(skip_line_ids)s::int[])
+                AND (queue_line.claimed_at IS NULL OR queue_line.claimed_at < %(lease_limit)s)
+                ORDER BY queue_line.id
+                LIMIT %(batch_size)s
+                FOR UPDATE OF queue_line SKIP LOCKED
+            )
+            RETURNING id
+        """
+        now = datetime.now()
+        self._cr.execute(claim_query, {"worker": worker_name, "now": now, "max_claims": 3,
+                                       "lease_limit": now - timedelta(seconds=lease_time), "batch_size": batch_size,
+                                       "skip_line_ids": list(skip_line_ids or [])})
+        line_ids = [row[0] for row in self._cr.fetchall()]
+        self._cr.commit()
+        return self.browse(line_ids)
+
+    def set_action_require_on_exhausted_queues(self):
+        """
+        This method is used to mark the queues having a draft line claimed 3 times by the parallel workers, whose
+        last claim is released or has expired, as queues to process manually. It posts the same message and schedule activity
+        as the queue process of the cron does after 3 attempts.
+        """
+        common_log_line_obj = self.env["common.log.lines.ept"]
+        cron_time = self.env["shopify.instance.ept"].get_shopify_cron_execution_time(
+            "shopify_ept.process_shopify_order_queue")
+        self._cr.execute("""
+            SELECT DISTINCT queue_line.shopify_order_data_queue_id
+            FROM shopify_order_data_queue_line_ept AS queue_line
+            INNER JOIN shopify_order_data_queue_ept AS queue ON queue_line.shopify_order_data_queue_id = queue.id
+            WHERE queue_line.state = 'draft' AND queue_line.claim_count >= 3 AND queue.is_action_require IS NOT TRUE
+            AND (queue_line.claimed_at IS NULL OR queue_line.claimed_at < %s)
+        """, (datetime.now() - timedelta(seconds=max(cron_time - 60, 60)),))
+        queues = self.env["shopify.order.data.queue.ept"].browse([row[0] for row in self._cr.fetchall()])
+        note = "<p>Need to process this order queue manually.There are 3 attempts been made by " \
+               "automated action to process this queue,<br/>- Ignore, if this queue is already processed.</p>"
+        for queue in queues:
+            queue.is_action_require = True
+            queue.message_post(body=note)
+            if queue.shopify_instance_id.is_shopify_create_schedule:
+                common_log_line_obj.create_crash_queue_schedule_activity(queue, "shopify.order.data.queue.ept", note)
+        self._cr.commit()
+        return True
+
+    def update_order_queue_worker_throughput(self, worker_name, queue_lines, seconds):
+        """
+        Adds a processed batch to the throughput counters of the worker.
+        :param worker_name: Unique name of the worker.
+        :param queue_lines: Processed order queue lines.
+        :param seconds: Time taken by the batch.
+        """
+        states = queue_lines.mapped("state")
+        with _worker_throughput_lock:
+            stats = _worker_throughput.setdefault(worker_name, {"batches": 0, "processed": 0, "done": 0,
+                                                                "failed": 0, "seconds": 0.0})
+            stats["batches"] += 1
+            stats["processed"] += len(queue_lines)
+            stats["done"] += states.count("done")
+            stats["failed"] += states.count("failed")
+            stats["seconds"] += seconds
+            stats["orders_per_second"] = stats["processed"] / stats["seconds"] if stats["seconds"] else 0.0
+            stats["last_batch_at"] = fields.Datetime.now()
+
+    @api.model
+    def get_order_queue_worker_throughput(self):
+        """
+        Returns the throughput counters of the parallel order queue workers of this process.
+        @return: Dictionary of worker name and its counters.
+        """
+        with _worker_throughput_lock:
+            return {worker: dict(stats) for worker, stats in _worker_throughput.items()}
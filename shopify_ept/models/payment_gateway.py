@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 import json
-import time
 
 from datetime import datetime, timedelta
 from odoo import models, fields
@@ -34,13 +33,8 @@ class ShopifyPaymentGateway(models.Model):
                                            updated_at_max=to_date, fields=['payment_gateway_names'], limit=250)
         except ClientError as error:
             if hasattr(error, "response"):
-                if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                    results = shopify.Order().find(status="any", updated_at_min=from_date,
-                                                   updated_at_max=to_date, fields=['payment_gateway_names'], limit=250)
-                else:
-                    message = str(error.code) + "\n" + json.loads(error.response.body.decode()).get("errors")
-                    raise UserError(message)
+                message = str(error.code) + "\n" + json.loads(error.response.body.decode()).get("errors")
+                raise UserError(message)
         except Exception as error:
             raise UserError(error)
 
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 
-from odoo import models
+from odoo import models, api
 
 
 class ProductTemplate(models.Model):
@@ -29,11 +29,27 @@ class ProductTemplate(models.Model):
 class ProductProduct(models.Model):
     _inherit = 'product.product'
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Inherited for adding the new products to the Shopify variant index of the batch being processed.
+        """
+        products = super(ProductProduct, self).create(vals_list)
+        index = self.env.context.get("shopify_variant_index")
+        if index:
+            index.add_products(products)
+        return products
+
     def write(self, vals):
         """
         This method use to archive/unarchive shopify product base on odoo product.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 30/03/2019.
         """
+        index = self.env.context.get("shopify_variant_index")
+        if index and {'default_code', 'barcode', 'active'} & set(vals.keys()):
+            index.discard_products(self.ids)
+            index.discard_variants(self.env['shopify.product.product.ept'].with_context(active_test=False).search(
+                [('product_id', 'in', self.ids)]).ids)
         if 'active' in vals.keys():
             shopify_product_product_obj = self.env['shopify.product.product.ept']
             for product in self:
@@ -44,4 +60,6 @@ class ProductProduct(models.Model):
                         [('product_id', '=', product.id), ('active', '=', False)])
                 shopify_product.write({'active': vals.get('active')})
         res = super(ProductProduct, self).write(vals)
+        if index and {'default_code', 'barcode', 'active'} & set(vals.keys()):
+            index.add_products(self)
         return res
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 
-import time
 import json
 import logging
 import re
@@ -10,7 +9,6 @@ from datetime import datetime, timedelta
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
 
 _logger = logging.getLogger("Shopify Product Queue")
 
@@ -60,13 +58,15 @@ class ShopifyProductDataQueue(models.Model):
             it display in the form view of product queue.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 2/11/2019.
         """
+        state_counts = self.env["data.queue.mixin.ept"].get_queue_line_state_count_ept(
+            "shopify.product.data.queue.line.ept", "product_data_queue_id", self)
         for product_queue in self:
-            queue_lines = product_queue.product_data_queue_lines
-            product_queue.queue_line_total_records = len(queue_lines)
-            product_queue.queue_line_draft_records = len(queue_lines.filtered(lambda x: x.state == "draft"))
-            product_queue.queue_line_fail_records = len(queue_lines.filtered(lambda x: x.state == "failed"))
-            product_queue.queue_line_done_records = len(queue_lines.filtered(lambda x: x.state == "done"))
-            product_queue.queue_line_cancel_records = len(queue_lines.filtered(lambda x: x.state == "cancel"))
+            state_count = state_counts.get(product_queue.id, {})
+            product_queue.queue_line_total_records = sum(state_count.values())
+            product_queue.queue_line_draft_records = state_count.get("draft", 0)
+            product_queue.queue_line_fail_records = state_count.get("failed", 0)
+            product_queue.queue_line_done_records = state_count.get("done", 0)
+            product_queue.queue_line_cancel_records = state_count.get("cancel", 0)
 
     @api.depends("product_data_queue_lines.state")
     def _compute_queue_state(self):
@@ -154,20 +154,16 @@ class ShopifyProductDataQueue(models.Model):
             if product_queue_list:
                 results = True
         else:
-            results = self.api_call_to_get_product_ept('active', import_based_on, from_date, to_date)
-            product_queue_list += self.create_product_queues(instance, results, skip_existing_product)
-
-            if len(results) >= 250:
-                product_queue_list += self.shopify_list_all_products(instance, results, skip_existing_product)
+            for products in self.api_call_to_get_product_ept('active', import_based_on, from_date, to_date):
+                results = True
+                product_queue_list += self.create_product_queues(instance, products, skip_existing_product)
             if results:
                 instance.shopify_last_date_product_import = datetime.now()
 
             if is_import_draft_product:
-                results = self.api_call_to_get_product_ept('draft', import_based_on, from_date, to_date)
-                product_queue_list += self.create_product_queues(instance, results, skip_existing_product)
-
-                if len(results) >= 250:
-                    product_queue_list += self.shopify_list_all_products(instance, results, skip_existing_product)
+                for products in self.api_call_to_get_product_ept('draft', import_based_on, from_date, to_date):
+                    results = True
+                    product_queue_list += self.create_product_queues(instance, products, skip_existing_product)
         if not results:
             _logger.info("No Products found to be imported from Shopify.")
             return False
@@ -180,13 +176,27 @@ class ShopifyProductDataQueue(models.Model):
         return product_queue_list
 
     def api_call_to_get_product_ept(self, status, import_based_on, from_date, to_date):
+        """
+        This method is used to iterate the pages of products from Shopify as list of dictionaries. Every page is
+        decoded once and the next page is fetched while the current one is added in the queues.
+        @return: Generator of list of products.
+        """
         if import_based_on == "create_date":
-            results = shopify.Product().find(status=status, created_at_min=from_date, created_at_max=to_date,
-                                             limit=250)
+            cursor = shopify.RawPageCursor(shopify.Product, status=status, created_at_min=from_date,
+                                           created_at_max=to_date, limit=250)
         else:
-            results = shopify.Product().find(status=status, updated_at_min=from_date, updated_at_max=to_date,
-                                             limit=250)
-        return results
+            cursor = shopify.RawPageCursor(shopify.Product, status=status, updated_at_min=from_date,
+                                           updated_at_max=to_date, limit=250)
+        pages = cursor.pages()
+        while True:
+            try:
+                products = next(pages)
+            except StopIteration:
+                return
+            except Exception as error:
+                raise UserError(error)
+            if products:
+                yield products
 
     def import_products_by_remote_ids(self, template_ids, instance):
         """ This method is used to import Shopify products into Odoo using remote ids(open product in Shopify store,
@@ -216,38 +226,6 @@ class ShopifyProductDataQueue(models.Model):
             raise UserError(_("Please enter the product template ids 100 or less"))
         return product_queue_list
 
-    def shopify_list_all_products(self, instance, result, skip_existing_product):
-        """This method used to call the page wise data of product to import from Shopify to Odoo.
-            @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 14/10/2019.
-            Modify on date 27/12/2019 Taken pagination changes.
-        """
-        product_queue_list = []
-        catch = ""
-        while result:
-            page_info = ""
-            link = shopify.ShopifyResource.connection.response.headers.get(
-                "Link") if shopify.ShopifyResource.connection.response.headers.get(
-                "Link") else shopify.ShopifyResource.connection.response.headers.get("link")
-            if not link or not isinstance(link, str):
-                return product_queue_list
-            for page_link in link.split(","):
-                if page_link.find("next") > 0:
-                    page_info = page_link.split(";")[0].strip("<>").split("page_info=")[1]
-                    try:
-                        result = shopify.Product().find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error,
-                                   "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                            time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                            result = shopify.Product().find(page_info=page_info, limit=250)
-                    except Exception as error:
-                        raise UserError(error)
-                    if result:
-                        product_queue_list += self.create_product_queues(instance, result, skip_existing_product)
-            if catch == page_info:
-                break
-        return product_queue_list
-
     def shopify_create_product_queue(self, instance, created_by="import", skip_existing_product=False):
         """
         This method used to create a product queue.
@@ -357,6 +335,25 @@ class ShopifyProductDataQueue(models.Model):
 
         return queue_id, model_id, data_ref, note
 
+    def process_product_webhook_ept(self, product_data, instance, webhook_route):
+        """
+        This method is used to process the product create, update and delete webhooks. It is called by the webhook
+        controller or by the webhook inbox.
+        :param product_data: Response of the webhook.
+        :param webhook_route: Route of the webhook controller.
+        """
+        shopify_template = self.env["shopify.product.template.ept"].with_context(active_test=False).search(
+            [("shopify_tmpl_id", "=", product_data.get("id")), ("shopify_instance_id", "=", instance.id)], limit=1)
+
+        if webhook_route in ['shopify_odoo_webhook_for_product_update',
+                             'shopify_odoo_webhook_for_product_create'] and shopify_template or product_data.get(
+            "published_at"):
+            self.create_shopify_product_queue_from_webhook(product_data, instance)
+
+        if webhook_route == 'shopify_odoo_webhook_for_product_delete' and shopify_template:
+            shopify_template.write({"active": False})
+        return True
+
     def create_shopify_product_queue_from_webhook(self, product_data, instance):
         """
         This method used to create a product queue while receive a response from webhook.
@@ -401,6 +398,7 @@ class ShopifyProductDataQueue(models.Model):
             skip_existing_product = False
             if not from_date:
                 from_date = to_date - timedelta(30)
-            self.shopify_create_product_data_queue(instance, import_products_based_on_date, from_date, to_date,
-                                                   skip_existing_product)
+            self.env["shopify.cron.scheduler.ept"].run_instance_job(
+                instance, "import_product", self.shopify_create_product_data_queue, instance,
+                import_products_based_on_date, from_date, to_date, skip_existing_product)
         return True
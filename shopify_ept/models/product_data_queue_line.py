@@ -57,21 +57,23 @@ class ShopifyProductDataQueueLineEpt(models.Model):
                     product_data_queue_ids.append(result[0])
 
             queues = product_data_queue_obj.browse(product_data_queue_ids)
-            self.process_product_queue_and_post_message(queues)
+            self.env["shopify.cron.scheduler.ept"].process_queues_by_instance(
+                queues, "process_product_queue", self.process_product_queue_and_post_message)
         return
 
-    def process_product_queue_and_post_message(self, queues):
+    def process_product_queue_and_post_message(self, queues, deadline=None):
         """
         This method is used to post a message if the queue is process more than 3 times otherwise
         it calls the child method to process the product queue line.
         :param queues: Records of product queue.
+        :param deadline: Timestamp after which no more queue is processed, the time of the cron by default.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 19 October 2020 .
         Task_id: 167537
         """
         common_log_line_obj = self.env["common.log.lines.ept"]
-        start = time.time()
-        product_queue_process_cron_time = queues.shopify_instance_id.get_shopify_cron_execution_time(
-            "shopify_ept.process_shopify_product_queue")
+        if not deadline:
+            deadline = time.time() + queues.shopify_instance_id.get_shopify_cron_execution_time(
+                "shopify_ept.process_shopify_product_queue") - 60
 
         for queue in queues:
             product_data_queue_line_ids = queue.product_data_queue_lines
@@ -91,7 +93,7 @@ class ShopifyProductDataQueueLineEpt(models.Model):
 
             self._cr.commit()
             product_data_queue_line_ids.process_product_queue_line_data()
-            if time.time() - start > product_queue_process_cron_time - 60:
+            if time.time() > deadline:
                 return True
         return True
 
@@ -112,7 +114,10 @@ class ShopifyProductDataQueueLineEpt(models.Model):
                 self.env.cr.execute(
                     """update shopify_product_data_queue_ept set is_process_queue = False where is_process_queue = True""")
                 self._cr.commit()
-                for product_queue_line in self:
+                self.hydrate_shopify_product_data(shopify_instance)
+                shopify_product_template_obj = shopify_product_template_obj.with_context(
+                    shopify_variant_index=self.prepare_shopify_variant_index(shopify_instance))
+                for product_queue_line in self.filtered("synced_product_data"):
                     shopify_product_template_obj.shopify_sync_products(product_queue_line,
                                                                        False,
                                                                        shopify_instance)
@@ -120,6 +125,50 @@ class ShopifyProductDataQueueLineEpt(models.Model):
                     self._cr.commit()
         return True
 
+    def prepare_shopify_variant_index(self, instance):
+        """
+        This method is used to load the variant index with the variant ids, SKUs and barcodes of all the queue
+        lines, so the variants of the batch are resolved without a search per variant.
+        :param instance: Record of the Shopify instance.
+        @return: Object of ShopifyVariantIndex.
+        """
+        variant_ids, skus, barcodes = set(), set(), set()
+        for product_queue_line in self.filtered("synced_product_data"):
+            try:
+                product_data = json.loads(product_queue_line.synced_product_data)
+            except ValueError:
+                continue
+            for variant in product_data.get("variants") or []:
+                variant_ids.add(variant.get("id"))
+                skus.add(variant.get("sku"))
+                barcodes.add(variant.get("barcode"))
+        return self.env["shopify.product.product.ept"].prepare_shopify_variant_index_ept(instance, variant_ids, skus,
+                                                                                         barcodes)
+
+    def hydrate_shopify_product_data(self, instance):
+        """
+        This method is used to fetch the product response of the queue lines created from a bulk operation, which
+        only have the product id. The products are fetched by 250 ids at a time.
+        :param instance: Record of the Shopify instance.
+        """
+        queue_lines = self.filtered(lambda line: not line.synced_product_data and line.product_data_id and
+                                                 line.state in ["draft", "failed"])
+        if not queue_lines:
+            return True
+        instance.connect_in_shopify()
+        for offset in range(0, len(queue_lines), 250):
+            batch = queue_lines[offset:offset + 250]
+            products = shopify.Product().find(ids=",".join(batch.mapped("product_data_id")), limit=250)
+            products_by_id = {str(product.id): product for product in products}
+            for queue_line in batch:
+                product = products_by_id.get(queue_line.product_data_id)
+                if not product:
+                    queue_line.write({"state": "failed"})
+                    continue
+                queue_line.write({"synced_product_data": json.dumps(product.to_dict())})
+        self._cr.commit()
+        return True
+
     def replace_product_response(self):
         """
         This method used to replace the product data response in the failed queue line. It will
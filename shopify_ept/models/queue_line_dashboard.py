@@ -6,7 +6,7 @@ from odoo import models
 class QueueLineDashboard(models.AbstractModel):
     _inherit = "queue.line.dashboard"
 
-    def _prepare_query(self, duration, state, table):
+    def _prepare_dashboard_domain(self, table):
         """
         Override the common connector method here to filter out the proper data in order data queue line base on
         order data queue.
@@ -15,19 +15,5 @@ class QueueLineDashboard(models.AbstractModel):
         """
         if table == 'shopify_order_data_queue_line_ept':
             queue_type = 'unshipped' if self._context.get('unshipped') else 'shipped'
-            qry = """
-                SELECT oql.id 
-                FROM shopify_order_data_queue_line_ept as oql
-                INNER JOIN shopify_order_data_queue_ept as oq ON oq.id=oql.shopify_order_data_queue_id
-                WHERE oq.queue_type = %s AND oql.state = %s
-            """
-            params = (queue_type, state)
-            if duration == 'today':
-                qry += " AND oql.create_date >= CURRENT_DATE"
-            elif duration == 'yesterday':
-                qry += " AND oql.create_date BETWEEN CURRENT_DATE - INTERVAL '1' DAY AND CURRENT_DATE"
-            self._cr.execute(qry, params)
-            line_ids = self._cr.dictfetchall()
-            return [line_id.get('id') for line_id in line_ids]
-        res = super(QueueLineDashboard, self)._prepare_query(duration, state, table)
-        return res
+            return [('shopify_order_data_queue_id.queue_type', '=', queue_type)]
+        return super(QueueLineDashboard, self)._prepare_dashboard_domain(table)
@@ -12,6 +12,7 @@ class ResPartner(models.Model):
 
     is_shopify_customer = fields.Boolean(string="Is Shopify Customer?", default=False,
                                          help="Used for identified that the customer is imported from Shopify store.")
+    shopify_partner_ids = fields.One2many("shopify.res.partner.ept", "partner_id", string="Shopify Customers")
 
     @api.model
     def create_shopify_pos_customer(self, order_response, instance):
@@ -15,7 +15,7 @@ from markupsafe import Markup
 from odoo.tests import Form
 from ..shopify.pyactiveresource.util import xml_to_dict
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
+from .shopify_import_profiler import ShopifyImportProfiler
 
 utc = pytz.utc
 
@@ -109,6 +109,37 @@ class SaleOrder(models.Model):
                          'unique(shopify_instance_id,shopify_order_id,shopify_order_number)',
                          "Shopify order must be Unique.")]
 
+    ORDER_KPI_FIELDS = {"state", "date_order", "shopify_instance_id", "procurement_group_id", "order_line"}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Inherited method for marking the KPI days of the created Shopify orders to refresh.
+        """
+        orders = super(SaleOrder, self).create(vals_list)
+        self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(orders)
+        return orders
+
+    def write(self, vals):
+        """
+        Inherited method for marking the KPI days of the Shopify orders to refresh, before and after the change of
+        a field counted by the rollup.
+        """
+        kpi_changed = self.ORDER_KPI_FIELDS.intersection(vals)
+        if kpi_changed:
+            self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(self)
+        res = super(SaleOrder, self).write(vals)
+        if kpi_changed:
+            self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(self)
+        return res
+
+    def unlink(self):
+        """
+        Inherited method for marking the KPI days of the deleted Shopify orders to refresh.
+        """
+        self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(self)
+        return super(SaleOrder, self).unlink()
+
     def prepare_shopify_customer_and_addresses(self, order_response, pos_order, instance, order_data_line):
         """
         Searches for existing customer in Odoo and creates in odoo, if not found.
@@ -190,7 +221,10 @@ class SaleOrder(models.Model):
         else:
             shopify_location_id = False
 
-        if shopify_location_id:
+        prefetch = self.env.context.get("shopify_order_prefetch")
+        if shopify_location_id and prefetch and str(shopify_location_id) in prefetch["locations"]:
+            shopify_location = prefetch["locations"][str(shopify_location_id)]
+        elif shopify_location_id:
             shopify_location = shopify_location_obj.search(
                 [("shopify_location_id", "=", shopify_location_id),
                  ("instance_id", "=", instance.id)],
@@ -341,7 +375,10 @@ class SaleOrder(models.Model):
         product = False
         if not line.get('product_id'):
             if line.get('sku'):
-                product = self.env["product.product"].search([("default_code", "=", line.get('sku'))], limit=1)
+                prefetch = self.env.context.get("shopify_order_prefetch")
+                product = prefetch and prefetch["products"].get(line.get('sku'))
+                if not product:
+                    product = self.env["product.product"].search([("default_code", "=", line.get('sku'))], limit=1)
             if not product:
                 if line.get('requires_shipping'):
                     product = instance.custom_storable_product_id
@@ -407,15 +444,22 @@ class SaleOrder(models.Model):
         Task Id : 157350
         @change: By Maulik Barad on Date 21-Sep-2020.
         @change: By Meera Sidapara on Date 27-Oct-2021 for Task Id : 179249.
+        The stages of every order are recorded by the profiler of the shopify_import_profiler context key.
         """
         order_risk_obj = self.env["shopify.order.risk"]
         common_log_line_obj = self.env["common.log.lines.ept"]
         order_ids = []
         commit_count = 0
+        profiler = self._context.get("shopify_import_profiler") or ShopifyImportProfiler(self._cr)
 
         instance.connect_in_shopify()
+        with profiler.stage("prefetch"):
+            prefetch = self.prepare_shopify_order_prefetch_ept(order_data_lines, instance)
+        self = self.with_context(shopify_order_prefetch=prefetch, shopify_variant_index=prefetch["variant_index"],
+                                 shopify_import_profiler=profiler)
 
         for order_data_line in order_data_lines:
+            profiler.start_order(order_data_line.id)
             if commit_count == 5:
                 self._cr.commit()
                 commit_count = 0
@@ -442,7 +486,8 @@ class SaleOrder(models.Model):
                 order_data_line.write({'state': 'failed', 'processed_at': datetime.now()})
                 continue
 
-            sale_order = self.search_existing_shopify_order(order_response, instance, order_number)
+            with profiler.stage("existing_order"):
+                sale_order = self.search_existing_shopify_order(order_response, instance, order_number)
 
             if sale_order:
                 order_data_line.write({"state": "done", "processed_at": datetime.now(),
@@ -452,20 +497,24 @@ class SaleOrder(models.Model):
                 continue
 
             pos_order = order_response.get("source_name", "") == "pos"
-            partner, delivery_address, invoice_address = self.prepare_shopify_customer_and_addresses(
-                order_response, pos_order, instance, order_data_line)
+            with profiler.stage("customer"):
+                partner, delivery_address, invoice_address = self.prepare_shopify_customer_and_addresses(
+                    order_response, pos_order, instance, order_data_line)
             if not partner:
                 continue
 
             lines = order_response.get("line_items")
-            if self.check_mismatch_details(lines, instance, order_number, order_data_line):
+            with profiler.stage("product_lookup"):
+                mismatch = self.check_mismatch_details(lines, instance, order_number, order_data_line)
+            if mismatch:
                 _logger.info("Mismatch details found in this Shopify Order(%s) and id (%s)", order_number,
                              order_response.get("id"))
                 order_data_line.write({"state": "failed", "processed_at": datetime.now()})
                 continue
 
-            sale_order = self.shopify_create_order(instance, partner, delivery_address, invoice_address,
-                                                   order_data_line, order_response, lines, order_number)
+            with profiler.stage("order_creation"):
+                sale_order = self.shopify_create_order(instance, partner, delivery_address, invoice_address,
+                                                       order_data_line, order_response, lines, order_number)
             if not sale_order:
                 message = "Configuration missing in Odoo while importing Shopify Order(%s) and id (%s)" % (
                     order_number, order_response.get("id"))
@@ -477,49 +526,42 @@ class SaleOrder(models.Model):
                                                                shopify_order_data_queue_line_id=order_data_line.id if order_data_line else False)
                 continue
             order_ids.append(sale_order.id)
+            prefetch["orders"][(str(order_response.get("id")), str(order_number))] = sale_order
 
-            location_vals = self.set_shopify_location_and_warehouse(order_response, instance, pos_order, sale_order)
+            with profiler.stage("location"):
+                location_vals = self.set_shopify_location_and_warehouse(order_response, instance, pos_order,
+                                                                        sale_order)
 
-            if instance.is_delivery_multi_warehouse:
-                warehouses = sale_order.order_line.filtered(lambda line_item: line_item.warehouse_id_ept).mapped(
-                    'warehouse_id_ept')
-                if warehouses and len(set(warehouses.ids)) == 1:
-                    location_vals.update({"warehouse_id": warehouses.id})
+                if instance.is_delivery_multi_warehouse:
+                    warehouses = sale_order.order_line.filtered(lambda line_item: line_item.warehouse_id_ept).mapped(
+                        'warehouse_id_ept')
+                    if warehouses and len(set(warehouses.ids)) == 1:
+                        location_vals.update({"warehouse_id": warehouses.id})
 
-            sale_order.write(location_vals)
+                sale_order.write(location_vals)
 
             if sale_order.shopify_order_status != "fulfilled":
-                risk_result = shopify.OrderRisk().find(order_id=order_response.get("id"))
-                if risk_result:
-                    order_risk_obj.shopify_create_risk_in_order(risk_result, sale_order)
-                    risk = sale_order.risk_ids.filtered(lambda x: x.recommendation != "accept")
-                    if risk:
-                        sale_order.is_risky_order = True
+                with profiler.stage("order_risk"):
+                    risk_result = shopify.OrderRisk().find(order_id=order_response.get("id"))
+                    if risk_result:
+                        order_risk_obj.shopify_create_risk_in_order(risk_result, sale_order)
+                        risk = sale_order.risk_ids.filtered(lambda x: x.recommendation != "accept")
+                        if risk:
+                            sale_order.is_risky_order = True
 
             _logger.info("Starting auto workflow process for Odoo order(%s) and Shopify order is (%s)",
                          sale_order.name, order_number)
             message = ""
             try:
-                context = dict(self.env.context)
-                if not self._context.get('shopify_order_financial_status'):
-                    context.update({'shopify_order_financial_status': order_response.get(
-                        "financial_status")})
-                context.update({'order_data_line': order_data_line})
-                self.env.context = context
-                if sale_order.shopify_order_status == "fulfilled":
-                    sale_order.auto_workflow_process_id.shipped_order_workflow_ept(sale_order)
-                    if order_data_line and order_data_line.shopify_order_data_queue_id.created_by == "scheduled_action":
-                        created_by = 'Scheduled Action'
-                    else:
-                        created_by = self.env.user.name
-                    # Below code add for create partially/fully refund
-                    message = self.create_shipped_order_refund(shopify_financial_status, order_response, sale_order,
-                                                               created_by)
-                elif not sale_order.is_risky_order:
-                    if sale_order.shopify_order_status == "partial":
-                        sale_order.process_order_fullfield_qty(order_response)
-                        sale_order.with_context(shopify_order_financial_status=order_response.get(
-                            "financial_status")).process_orders_and_invoices_ept()
+                with profiler.stage("auto_workflow"):
+                    context = dict(self.env.context)
+                    if not self._context.get('shopify_order_financial_status'):
+                        context.update({'shopify_order_financial_status': order_response.get(
+                            "financial_status")})
+                    context.update({'order_data_line': order_data_line})
+                    self.env.context = context
+                    if sale_order.shopify_order_status == "fulfilled":
+                        sale_order.auto_workflow_process_id.shipped_order_workflow_ept(sale_order)
                         if order_data_line and order_data_line.shopify_order_data_queue_id.created_by == \
                                 "scheduled_action":
                             created_by = 'Scheduled Action'
@@ -528,10 +570,22 @@ class SaleOrder(models.Model):
                         # Below code add for create partially/fully refund
                         message = self.create_shipped_order_refund(shopify_financial_status, order_response, sale_order,
                                                                    created_by)
-                    else:
-                        sale_order.with_context(shopify_order_financial_status=order_response.get(
-                            "financial_status")).process_orders_and_invoices_ept()
-
+                    elif not sale_order.is_risky_order:
+                        if sale_order.shopify_order_status == "partial":
+                            sale_order.process_order_fullfield_qty(order_response)
+                            sale_order.with_context(shopify_order_financial_status=order_response.get(
+                                "financial_status")).process_orders_and_invoices_ept()
+                            if order_data_line and order_data_line.shopify_order_data_queue_id.created_by == \
+                                    "scheduled_action":
+                                created_by = 'Scheduled Action'
+                            else:
+                                created_by = self.env.user.name
+                            # Below code add for create partially/fully refund
+                            message = self.create_shipped_order_refund(shopify_financial_status, order_response,
+                                                                       sale_order, created_by)
+                        else:
+                            sale_order.with_context(shopify_order_financial_status=order_response.get(
+                                "financial_status")).process_orders_and_invoices_ept()
 
             except Exception as error:
                 if order_data_line:
@@ -560,8 +614,99 @@ class SaleOrder(models.Model):
                                        "sale_order_id": sale_order.id, "order_data": False})
             _logger.info("Processed the Odoo Order %s process and Shopify Order (%s)", sale_order.name, order_number)
 
+        profiler.finish_order()
         return order_ids
 
+    def prepare_shopify_order_prefetch_ept(self, order_data_lines, instance):
+        """
+        This method collects the order ids, customer ids, variant ids, SKUs, locations and tax lines of all the
+        queue lines and resolves them with a few set based searches. The lookups done per order consult this
+        data first, so the import of a queue does not search the same records again for every order.
+        Existing orders are fully resolved here, for the other records a miss falls back to the normal search.
+        :param order_data_lines: Records of the order queue lines.
+        @return: Dictionary of prefetched records.
+        """
+        prefetch = {"order_ids": set(), "orders": {}, "order_names": {}, "customers": {}, "variants": {},
+                    "variant_skus": {}, "products": {}, "locations": {}, "taxes": {}}
+        order_names, customer_ids, variant_ids, skus, location_ids, tax_keys = set(), set(), set(), set(), set(), set()
+        company = instance.shopify_warehouse_id.company_id
+
+        for order_data_line in order_data_lines.filtered("order_data"):
+            try:
+                order_response = json.loads(order_data_line.order_data)
+            except ValueError:
+                continue
+            prefetch["order_ids"].add(str(order_response.get("id")))
+            order_names.add(order_response.get("name"))
+            if order_response.get("customer"):
+                customer_ids.add(str(order_response["customer"].get("id")))
+            if order_response.get("location_id"):
+                location_ids.add(str(order_response.get("location_id")))
+            for fulfillment in order_response.get("fulfillments") or []:
+                location_ids.add(str(fulfillment.get("location_id")))
+            taxes_included = order_response.get("taxes_included") or False
+            for line in (order_response.get("line_items") or []) + (order_response.get("shipping_lines") or []):
+                if line.get("variant_id"):
+                    variant_ids.add(str(line.get("variant_id")))
+                if line.get("sku"):
+                    skus.add(line.get("sku"))
+                for tax in line.get("tax_lines") or []:
+                    rate = float(tax.get("rate", 0.0)) * 100
+                    if rate != 0.0 and float(tax.get("price", 0.0)) != 0.0:
+                        tax_keys.add((self.prepare_shopify_tax_name(tax.get("title"), rate, taxes_included, company),
+                                      bool(taxes_included), rate))
+
+        if prefetch["order_ids"]:
+            sale_orders = self.search([("shopify_instance_id", "=", instance.id), "|",
+                                       ("shopify_order_id", "in", list(prefetch["order_ids"])),
+                                       ("client_order_ref", "in", list(order_names))])
+            for sale_order in sale_orders:
+                key = (sale_order.shopify_order_id, sale_order.shopify_order_number)
+                prefetch["orders"].setdefault(key, self.browse())
+                prefetch["orders"][key] |= sale_order
+                prefetch["order_names"].setdefault(sale_order.client_order_ref, self.browse())
+                prefetch["order_names"][sale_order.client_order_ref] |= sale_order
+
+        if customer_ids:
+            shopify_partners = self.env["shopify.res.partner.ept"].search(
+                [("shopify_instance_id", "=", instance.id), ("shopify_customer_id", "in", list(customer_ids))])
+            for shopify_partner in shopify_partners:
+                prefetch["customers"].setdefault(shopify_partner.shopify_customer_id, shopify_partner.partner_id)
+
+        if variant_ids or skus:
+            shopify_variants = self.env["shopify.product.product.ept"].search(
+                [("shopify_instance_id", "=", instance.id), ("exported_in_shopify", "=", True), "|",
+                 ("variant_id", "in", list(variant_ids)), ("default_code", "in", list(skus))])
+            for shopify_variant in shopify_variants:
+                if shopify_variant.variant_id in variant_ids:
+                    prefetch["variants"].setdefault(shopify_variant.variant_id, shopify_variant.browse())
+                    prefetch["variants"][shopify_variant.variant_id] |= shopify_variant
+                if shopify_variant.default_code in skus:
+                    prefetch["variant_skus"].setdefault(shopify_variant.default_code, shopify_variant.browse())
+                    prefetch["variant_skus"][shopify_variant.default_code] |= shopify_variant
+        if skus:
+            for product in self.env["product.product"].search([("default_code", "in", list(skus))]):
+                prefetch["products"].setdefault(product.default_code, product)
+        # Products missing in Odoo are imported while importing the orders, their variants are resolved from the index.
+        prefetch["variant_index"] = self.env["shopify.product.product.ept"].prepare_shopify_variant_index_ept(
+            instance, variant_ids, skus, set())
+
+        if location_ids:
+            shopify_locations = self.env["shopify.location.ept"].search(
+                [("instance_id", "=", instance.id), ("shopify_location_id", "in", list(location_ids))])
+            for shopify_location in shopify_locations:
+                prefetch["locations"].setdefault(shopify_location.shopify_location_id, shopify_location)
+
+        if tax_keys:
+            account_taxes = self.env["account.tax"].search([("type_tax_use", "=", "sale"),
+                                                            ("company_id", "=", company.id),
+                                                            ("name", "in", list({key[0] for key in tax_keys}))])
+            for account_tax in account_taxes:
+                key = (account_tax.name, account_tax.price_include, account_tax.amount)
+                if key in tax_keys:
+                    prefetch["taxes"].setdefault(key, account_tax)
+        return prefetch
+
     def validate_and_paid_invoices_ept(self, work_flow_process_record):
         """
         According to the workflow configuration, It will create invoices, validate them and register payment.
@@ -693,6 +838,14 @@ class SaleOrder(models.Model):
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 27 October 2020 .
             Task_id: 167537
         """
+        prefetch = self.env.context.get("shopify_order_prefetch")
+        if prefetch and str(order_response.get("id")) in prefetch["order_ids"]:
+            sale_order = prefetch["orders"].get((str(order_response.get("id")), str(order_number))) or \
+                         prefetch["order_names"].get(order_response.get("name"))
+            # The prefetch is taken at the start of the batch, a miss is searched again, as a parallel worker or
+            # a webhook may have created the order since then.
+            if sale_order:
+                return sale_order
 
         sale_order = self.search([("shopify_order_id", "=", order_response.get("id")),
                                   ("shopify_instance_id", "=", instance.id),
@@ -761,6 +914,12 @@ class SaleOrder(models.Model):
         shopify_variant = False
         shopify_product_obj = self.env["shopify.product.product.ept"]
         sku = line.get("sku") or False
+        prefetch = self.env.context.get("shopify_order_prefetch")
+        if prefetch:
+            shopify_variant = prefetch["variants"].get(str(line.get("variant_id"))) or \
+                              sku and prefetch["variant_skus"].get(sku)
+            if shopify_variant:
+                return shopify_variant
         if line.get("variant_id", None):
             shopify_variant = shopify_product_obj.search(
                 [("variant_id", "=", line.get("variant_id")),
@@ -899,9 +1058,11 @@ class SaleOrder(models.Model):
 
         return is_create_order
 
-    def set_fulfilment_order_id_and_fulfillment_line_id(self, order, picking):
+    def set_fulfilment_order_id_and_fulfillment_line_id(self, order, picking, fulfillment_order_data=None):
         """
         This method sets order line warehouse based on Shopify Location.
+        :param fulfillment_order_data: Fulfillment orders of the order already loaded, they are requested when
+        not given.
         @author:Meera Sidapara @Emipro Technologies Pvt. Ltd on date 07 September 2022.
         Task Id : 199989 - Fulfillment location wise order
         """
@@ -911,17 +1072,20 @@ class SaleOrder(models.Model):
         backorders = picking.backorder_ids.filtered(lambda order: not order.updated_in_shopify)
         if stock_moves and backorders:
             self.set_backorder_fulfillment_data(backorders, stock_moves)
-        fulfillment_order_data = []
         fulfillment_order = False
         if not stock_moves:
-            try:
-                fulfillment_order = shopify.fulfillment.FulfillmentOrders.find(order_id=int(shopify_order_id))
-                for order_data in fulfillment_order:
-                    order_data = order_data.to_dict()
-                    if order_data.get('status') != 'closed':
-                        fulfillment_order_data.append(order_data)
-            except Exception as Error:
-                _logger.info("Error in Request of shopify fulfillment order for the fulfilment. Error: %s", Error)
+            if fulfillment_order_data is not None:
+                fulfillment_order = fulfillment_order_data
+                fulfillment_order_data = [data for data in fulfillment_order_data if data.get('status') != 'closed']
+            else:
+                fulfillment_order_data = []
+                try:
+                    fulfillment_order = self.env['shopify.fulfillment.order.cache'].fetch_fulfillment_orders_ept(
+                        order.shopify_instance_id, shopify_order_id)
+                    fulfillment_order_data = [data for data in fulfillment_order if data.get('status') != 'closed']
+                except Exception as Error:
+                    _logger.info("Error in Request of shopify fulfillment order for the fulfilment. Error: %s",
+                                 Error)
             for data in fulfillment_order_data:
                 for line in data.get('line_items'):
                     if isinstance(data.get('delivery_method'), dict) and data.get('delivery_method').get(
@@ -972,8 +1136,8 @@ class SaleOrder(models.Model):
         shopify_location_obj = self.env['shopify.location.ept']
         shopify_order_id = order.shopify_order_id
         if not order_response.get('fulfillment_data'):
-            shopify_order = shopify.Order().find(shopify_order_id)
-            order_response["fulfillment_data"] = shopify_order.get('fulfillment_orders')
+            order_response["fulfillment_data"] = self.env[
+                'shopify.fulfillment.order.cache'].fetch_fulfillment_orders_ept(instance, shopify_order_id)
         fulfillment_data = order_response.get('fulfillment_data')
         for data in fulfillment_data:
             shopify_location_id = data.get('assigned_location_id')
@@ -1240,6 +1404,9 @@ class SaleOrder(models.Model):
         """
         shopify_product_obj = self.env["shopify.product.product.ept"]
         variant_id = line.get("variant_id")
+        prefetch = self.env.context.get("shopify_order_prefetch")
+        if prefetch and prefetch["variants"].get(str(variant_id)):
+            return prefetch["variants"][str(variant_id)][:1]
         shopify_product = shopify_product_obj.search(
             [("shopify_instance_id", "=", instance.id), ("variant_id", "=", variant_id),
              ('exported_in_shopify', '=', True)], limit=1)
@@ -1265,9 +1432,11 @@ class SaleOrder(models.Model):
         line_vals = self.prepare_vals_for_sale_order_line(product, product_name, price, quantity)
 
         # order_line_vals = sale_order_line_obj.create_sale_order_line_ept(line_vals)
-        order_line_vals = self.shopify_set_tax_in_sale_order_line(instance, line, order_response, is_shipping,
-                                                                  is_discount, previous_line, line_vals,
-                                                                  is_duties)
+        with (self._context.get("shopify_import_profiler") or ShopifyImportProfiler(self._cr)).stage(
+                "tax_resolution"):
+            order_line_vals = self.shopify_set_tax_in_sale_order_line(instance, line, order_response, is_shipping,
+                                                                      is_discount, previous_line, line_vals,
+                                                                      is_duties)
         if is_discount:
             order_line_vals["name"] = "Discount for " + str(product_name)
             if instance.apply_tax_in_order == "odoo_tax" and previous_line:
@@ -1371,27 +1540,39 @@ class SaleOrder(models.Model):
         tax_id = []
         taxes = []
         company = instance.shopify_warehouse_id.company_id
+        prefetch = self.env.context.get("shopify_order_prefetch")
         for tax in tax_lines:
             rate = float(tax.get("rate", 0.0))
             price = float(tax.get('price', 0.0))
             title = tax.get("title")
             rate = rate * 100
             if rate != 0.0 and price != 0.0:
-                if tax_included:
-                    name = "%s_(%s %s included)_%s" % (title, str(rate), "%", company.name)
-                else:
-                    name = "%s_(%s %s excluded)_%s" % (title, str(rate), "%", company.name)
-                tax_id = self.env["account.tax"].search([("price_include", "=", tax_included),
-                                                         ("type_tax_use", "=", "sale"), ("amount", "=", rate),
-                                                         ("name", "=", name), ("company_id", "=", company.id)], limit=1)
+                name = self.prepare_shopify_tax_name(title, rate, tax_included, company)
+                tax_id = prefetch and prefetch["taxes"].get((name, bool(tax_included), rate))
+                if not tax_id:
+                    tax_id = self.env["account.tax"].search([("price_include", "=", tax_included),
+                                                             ("type_tax_use", "=", "sale"), ("amount", "=", rate),
+                                                             ("name", "=", name), ("company_id", "=", company.id)],
+                                                            limit=1)
                 if not tax_id:
                     tax_id = self.sudo().shopify_create_account_tax(instance, rate, tax_included, company, name)
                 if tax_id:
+                    if prefetch:
+                        prefetch["taxes"][(name, bool(tax_included), rate)] = tax_id
                     taxes.append(tax_id.id)
         if taxes:
             tax_id = [(6, 0, taxes)]
         return tax_id
 
+    @api.model
+    def prepare_shopify_tax_name(self, title, rate, tax_included, company):
+        """ This method is used to prepare the name of the tax created for the Shopify tax line.
+            :param rate: Rate of tax in percentage.
+        """
+        if tax_included:
+            return "%s_(%s %s included)_%s" % (title, str(rate), "%", company.name)
+        return "%s_(%s %s excluded)_%s" % (title, str(rate), "%", company.name)
+
     @api.model
     def shopify_create_account_tax(self, instance, value, price_included, company, name):
         """This method used to create tax in Odoo when importing orders from Shopify to Odoo.
@@ -1588,14 +1769,44 @@ class SaleOrder(models.Model):
         Task Id : 157905
         Migration done by Haresh Mori on October 2021
         """
-        common_log_line_obj = self.env["common.log.lines.ept"]
-        log_lines = []
-        notify_customer = instance.notify_customer
         _logger.info(_("Update Order Status process start for '%s' Instance"), instance.name)
 
         instance.connect_in_shopify()
         if not picking_ids:
             picking_ids = self.shopify_search_picking_for_update_order_status(instance)
+        if self.env["ir.config_parameter"].sudo().get_param("shopify_ept.batch_fulfillment", "True") not in (
+                "False", "0"):
+            log_lines = self.env["shopify.fulfillment.engine.ept"].update_order_status_in_batch(instance,
+                                                                                               picking_ids)
+        else:
+            log_lines = self.update_order_status_per_picking(instance, picking_ids)
+
+        if log_lines and instance.is_shopify_create_schedule:
+            message = []
+            count = 0
+            for log_line in log_lines:
+                count += 1
+                if count <= 5:
+                    message.append('<' + 'li' + '>' + log_line.message + '<' + '/' + 'li' + '>')
+            if count >= 5:
+                message.append(
+                    '<' + 'p' + '>' + 'Please refer the logline' + '  ' + log_line.name + '  '
+                    + 'check it in more detail' + '<' + '/' + 'p' + '>')
+            note = "\n".join(message)
+            self.create_schedule_activity_against_loglines(log_lines, note)
+
+        self.closed_at(instance)
+        return True
+
+    def update_order_status_per_picking(self, instance, picking_ids):
+        """
+        This method is used to update the order status in Shopify one picking at a time with the REST API. It is
+        used when the system parameter shopify_ept.batch_fulfillment is False.
+        @return: Log lines of the pickings which are not updated.
+        """
+        common_log_line_obj = self.env["common.log.lines.ept"]
+        log_lines = []
+        notify_customer = instance.notify_customer
         for picking in picking_ids:
             carrier_name = self.get_shopify_carrier_code(picking)
             sale_order = picking.sale_id
@@ -1620,8 +1831,8 @@ class SaleOrder(models.Model):
                 continue
 
             if not fulfillment_order:
-                shopify_order_id = sale_order.shopify_order_id
-                fulfillment_order = shopify.fulfillment.FulfillmentOrders.find(order_id=int(shopify_order_id))
+                fulfillment_order = self.env['shopify.fulfillment.order.cache'].fetch_fulfillment_orders_ept(
+                    instance, sale_order.shopify_order_id)
             if fulfillment_order and len(fulfillment_order) > 1:
                 shopify_location_id, fulfillment_vals = self.prepare_vals_for_multiple_fulfillment(sale_order,
                                                                                                    tracking_numbers,
@@ -1651,23 +1862,7 @@ class SaleOrder(models.Model):
                                                    new_fulfillment)
 
             sale_order.shopify_location_id = shopify_location_id
-
-        if log_lines and instance.is_shopify_create_schedule:
-            message = []
-            count = 0
-            for log_line in log_lines:
-                count += 1
-                if count <= 5:
-                    message.append('<' + 'li' + '>' + log_line.message + '<' + '/' + 'li' + '>')
-            if count >= 5:
-                message.append(
-                    '<' + 'p' + '>' + 'Please refer the logline' + '  ' + log_line.name + '  '
-                    + 'check it in more detail' + '<' + '/' + 'p' + '>')
-            note = "\n".join(message)
-            self.create_schedule_activity_against_loglines(log_lines, note)
-
-        self.closed_at(instance)
-        return True
+        return log_lines
 
     def prepare_vals_for_multiple_fulfillment(self, sale_order, tracking_numbers, picking, carrier_name, line_items):
         """
@@ -1901,11 +2096,6 @@ class SaleOrder(models.Model):
                 fulfillment_result = new_fulfillment.save()
                 if not fulfillment_result:
                     return False, fulfillment_result, new_fulfillment
-            except ClientError as error:
-                if hasattr(error,
-                           "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                    fulfillment_result = new_fulfillment.save()
             except Exception as error:
                 message = "%s" % str(error)
                 _logger.info(message)
@@ -1955,9 +2145,31 @@ class SaleOrder(models.Model):
                     service_order_line.write({'shopify_fulfillment_order_status': 'closed'})
 
         picking.write({'updated_in_shopify': True, 'shopify_fulfillment_id': fulfillment_id})
+        self.env['shopify.fulfillment.order.cache'].invalidate_fulfillment_orders_ept(instance,
+                                                                                     [sale_order.shopify_order_id])
 
         return True
 
+    @api.model
+    def process_order_webhook_ept(self, order_data, instance):
+        """
+        This method is used to process the order update webhook. It is called by the webhook controller or by the
+        webhook inbox.
+        :param order_data: Response of the webhook.
+        :param instance: Record of the Shopify instance.
+        """
+        fulfillment_status = order_data.get("fulfillment_status") or "unfulfilled"
+        # An update of the order can change its fulfillment orders, they are requested again when needed.
+        self.env["shopify.fulfillment.order.cache"].invalidate_fulfillment_orders_ept(instance, [order_data.get("id")])
+        if self.search_read([("shopify_instance_id", "=", instance.id),
+                             ("shopify_order_id", "=", order_data.get("id")),
+                             ("shopify_order_number", "=", order_data.get("order_number"))], ["id"]):
+            self.process_shopify_order_via_webhook(order_data, instance, True)
+        elif fulfillment_status in ["fulfilled", "unfulfilled", "partial"]:
+            order_data["fulfillment_status"] = fulfillment_status
+            self.with_context({'is_new_order': True}).process_shopify_order_via_webhook(order_data, instance)
+        return True
+
     @api.model
     def process_shopify_order_via_webhook(self, order_data, instance, update_order=False):
         """
@@ -3194,6 +3406,29 @@ class SaleOrderLine(models.Model):
     shopify_fulfillment_line_id = fields.Char("Fulfillment Line ID")
     shopify_fulfillment_order_status = fields.Char("Fulfillment Order Status")
 
+    ORDER_KPI_FIELDS = {"product_uom_qty", "price_unit", "discount", "tax_id", "order_id"}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Inherited method for marking the KPI days of the orders of the created lines to refresh.
+        """
+        lines = super(SaleOrderLine, self).create(vals_list)
+        self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(lines.order_id)
+        return lines
+
+    def write(self, vals):
+        """
+        Inherited method for marking the KPI days of the orders of the lines to refresh when an amount changes.
+        """
+        kpi_changed = self.ORDER_KPI_FIELDS.intersection(vals)
+        if kpi_changed:
+            self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(self.order_id)
+        res = super(SaleOrderLine, self).write(vals)
+        if kpi_changed:
+            self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(self.order_id)
+        return res
+
     def unlink(self):
         """
         This method is used to prevent the delete sale order line if the order has a Shopify order.
@@ -3205,6 +3440,7 @@ class SaleOrderLine(models.Model):
                     "You can not delete this line because this line is Shopify order line and we need "
                     "Shopify line id while we are doing update order status")
                 raise UserError(msg)
+        self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(self.order_id)
         return super(SaleOrderLine, self).unlink()
 
 
@@ -0,0 +1,585 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import json
+import logging
+import re
+from datetime import datetime, timedelta
+from urllib.request import urlopen
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from .. import shopify
+
+_logger = logging.getLogger("Shopify Bulk Operation")
+
+BULK_OPERATION_RUN_QUERY = """
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+BULK_OPERATION_STATUS_QUERY = """
+query bulkOperation($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation {
+      id
+      status
+      errorCode
+      objectCount
+      url
+    }
+  }
+}
+"""
+
+# The amounts of the bulk queries, in the currency of the shop and in the currency of the customer.
+MONEY_BAG = "shopMoney { amount currencyCode } presentmentMoney { amount currencyCode }"
+
+MAILING_ADDRESS = "firstName lastName name company address1 address2 city province provinceCode zip country " \
+                  "countryCodeV2 phone"
+
+TAX_LINES = "taxLines { title rate priceSet { %s } }" % MONEY_BAG
+
+# The orders are exported whole, with their line items, shipping lines, transactions and fulfillment orders, the
+# queue lines are created with the order data of the import from the result file, without any REST request. The
+# nested connections are exported as lines of their own, linked to their parent by __parentId.
+BULK_ORDER_QUERY = """
+{
+  orders(query: "%%s") {
+    edges {
+      node {
+        id
+        legacyResourceId
+        name
+        email
+        phone
+        note
+        tags
+        createdAt
+        updatedAt
+        processedAt
+        cancelledAt
+        cancelReason
+        closedAt
+        displayFinancialStatus
+        displayFulfillmentStatus
+        currencyCode
+        presentmentCurrencyCode
+        taxesIncluded
+        sourceName
+        paymentGatewayNames
+        discountCodes
+        totalDiscountsSet { %(money)s }
+        subtotalPriceSet { %(money)s }
+        totalTaxSet { %(money)s }
+        totalPriceSet { %(money)s }
+        %(tax_lines)s
+        physicalLocation { legacyResourceId }
+        fulfillments { location { legacyResourceId } }
+        customer {
+          legacyResourceId
+          email
+          firstName
+          lastName
+          phone
+          tags
+          createdAt
+          updatedAt
+          defaultAddress { id %(address)s }
+        }
+        billingAddress { %(address)s }
+        shippingAddress { %(address)s }
+        transactions {
+          id
+          kind
+          status
+          gateway
+          test
+          createdAt
+          processedAt
+          amountSet { %(money)s }
+          parentTransaction { id }
+        }
+        lineItems {
+          edges {
+            node {
+              id
+              name
+              title
+              variantTitle
+              sku
+              quantity
+              unfulfilledQuantity
+              requiresShipping
+              taxable
+              isGiftCard
+              product { legacyResourceId }
+              variant { legacyResourceId }
+              originalUnitPriceSet { %(money)s }
+              totalDiscountSet { %(money)s }
+              discountAllocations { allocatedAmountSet { %(money)s } }
+              %(tax_lines)s
+              duties { id price { %(money)s } %(tax_lines)s }
+              customAttributes { key value }
+            }
+          }
+        }
+        shippingLines {
+          edges {
+            node {
+              id
+              title
+              code
+              source
+              carrierIdentifier
+              originalPriceSet { %(money)s }
+              discountedPriceSet { %(money)s }
+              %(tax_lines)s
+            }
+          }
+        }
+        fulfillmentOrders {
+          edges {
+            node {
+              id
+              status
+              assignedLocation { location { legacyResourceId } }
+              deliveryMethod { methodType }
+              lineItems {
+                edges {
+                  node {
+                    id
+                    totalQuantity
+                    remainingQuantity
+                    lineItem { id }
+                  }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+""" % {"money": MONEY_BAG, "address": MAILING_ADDRESS, "tax_lines": TAX_LINES}
+
+FULFILLMENT_STATUS = {"FULFILLED": "fulfilled", "PARTIALLY_FULFILLED": "partial", "RESTOCKED": "restocked"}
+
+BULK_PRODUCT_QUERY = """
+{
+  products(query: "%s") {
+    edges {
+      node {
+        legacyResourceId
+        title
+      }
+    }
+  }
+}
+"""
+
+
+def iter_bulk_operation_result(url, timeout=300):
+    """
+    Yields the objects of the JSONL result file of a bulk operation one line at a time, so the file is never loaded
+    whole in the memory.
+    """
+    response = urlopen(url, timeout=timeout)
+    try:
+        for line in response:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    finally:
+        response.close()
+
+
+def iter_bulk_objects(records):
+    """
+    Groups the lines of the JSONL result file of a bulk operation by top level object. The objects of the nested
+    connections are added to their parent under __children, by GraphQL type, e.g. {"LineItem": [...]}.
+    """
+    root, nodes = None, {}
+    for record in records:
+        parent_id = record.pop("__parentId", None)
+        if parent_id is None:
+            if root is not None:
+                yield root
+            root, nodes = record, {}
+        elif parent_id in nodes:
+            nodes[parent_id].setdefault("__children", {}).setdefault(_gid_type(record.get("id")), []).append(record)
+        else:
+            _logger.warning("Parent %s of the bulk operation record %s is not found.", parent_id, record.get("id"))
+            continue
+        if record.get("id"):
+            nodes[record["id"]] = record
+    if root is not None:
+        yield root
+
+
+def _gid_type(gid):
+    return (gid or "").split("/")[-2] if (gid or "").count("/") >= 3 else False
+
+
+def _gid_id(gid):
+    value = (gid or "").split("/")[-1].split("?")[0]
+    return int(value) if value.isdigit() else None
+
+
+def _legacy_id(resource):
+    value = (resource or {}).get("legacyResourceId")
+    return int(value) if value else None
+
+
+def _amount(money_bag):
+    return ((money_bag or {}).get("shopMoney") or {}).get("amount") or "0.00"
+
+
+def _price_set(money_bag):
+    money_bag = money_bag or {}
+    return {key: {"amount": (money_bag.get(field) or {}).get("amount") or "0.00",
+                  "currency_code": (money_bag.get(field) or {}).get("currencyCode")}
+            for key, field in (("shop_money", "shopMoney"), ("presentment_money", "presentmentMoney"))}
+
+
+def _lower(value):
+    return value.lower() if value else None
+
+
+def _address(address):
+    if not address:
+        return None
+    return {"first_name": address.get("firstName"), "last_name": address.get("lastName"),
+            "name": address.get("name"), "company": address.get("company"), "address1": address.get("address1"),
+            "address2": address.get("address2"), "city": address.get("city"), "province": address.get("province"),
+            "province_code": address.get("provinceCode"), "zip": address.get("zip"),
+            "country": address.get("country"), "country_code": address.get("countryCodeV2"),
+            "phone": address.get("phone")}
+
+
+def _tax_lines(tax_lines):
+    return [{"title": tax_line.get("title"), "rate": tax_line.get("rate") or 0.0,
+             "price": _amount(tax_line.get("priceSet")), "price_set": _price_set(tax_line.get("priceSet"))}
+            for tax_line in tax_lines or []]
+
+
+def _customer(customer):
+    if not customer:
+        return None
+    default_address = customer.get("defaultAddress")
+    return {"id": _legacy_id(customer), "email": customer.get("email"), "first_name": customer.get("firstName"),
+            "last_name": customer.get("lastName"), "phone": customer.get("phone"),
+            "tags": ", ".join(customer.get("tags") or []), "created_at": customer.get("createdAt"),
+            "updated_at": customer.get("updatedAt"),
+            "default_address": default_address and dict(_address(default_address), id=_gid_id(
+                default_address.get("id")), default=True)}
+
+
+def _line_item(line):
+    quantity = line.get("quantity") or 0
+    unfulfilled_quantity = line.get("unfulfilledQuantity")
+    if unfulfilled_quantity is None or unfulfilled_quantity == quantity:
+        fulfillment_status = None
+    else:
+        fulfillment_status = "fulfilled" if not unfulfilled_quantity else "partial"
+    return {"id": _gid_id(line.get("id")), "variant_id": _legacy_id(line.get("variant")),
+            "product_id": _legacy_id(line.get("product")), "product_exists": bool(line.get("product")),
+            "sku": line.get("sku"), "title": line.get("title"), "name": line.get("name"),
+            "variant_title": line.get("variantTitle"), "quantity": quantity,
+            "fulfillable_quantity": unfulfilled_quantity if unfulfilled_quantity is not None else quantity,
+            "fulfillment_status": fulfillment_status,
+            "price": _amount(line.get("originalUnitPriceSet")),
+            "price_set": _price_set(line.get("originalUnitPriceSet")),
+            "total_discount": _amount(line.get("totalDiscountSet")),
+            "total_discount_set": _price_set(line.get("totalDiscountSet")),
+            "discount_allocations": [{"amount": _amount(allocation.get("allocatedAmountSet")),
+                                      "amount_set": _price_set(allocation.get("allocatedAmountSet"))}
+                                     for allocation in line.get("discountAllocations") or []],
+            "tax_lines": _tax_lines(line.get("taxLines")),
+            "duties": [{"id": _gid_id(duty.get("id")), "price_set": _price_set(duty.get("price")),
+                        "tax_lines": _tax_lines(duty.get("taxLines"))} for duty in line.get("duties") or []],
+            "requires_shipping": line.get("requiresShipping"), "taxable": line.get("taxable"),
+            "gift_card": line.get("isGiftCard"),
+            "properties": [{"name": attribute.get("key"), "value": attribute.get("value")}
+                           for attribute in line.get("customAttributes") or []]}
+
+
+def _shipping_line(line):
+    return {"id": _gid_id(line.get("id")), "title": line.get("title"), "code": line.get("code"),
+            "source": line.get("source"), "carrier_identifier": line.get("carrierIdentifier"),
+            "price": _amount(line.get("originalPriceSet")), "price_set": _price_set(line.get("originalPriceSet")),
+            "discounted_price": _amount(line.get("discountedPriceSet")),
+            "discounted_price_set": _price_set(line.get("discountedPriceSet")),
+            "tax_lines": _tax_lines(line.get("taxLines")), "discount_allocations": []}
+
+
+def _transaction(transaction, order_id, currency):
+    return {"id": _gid_id(transaction.get("id")), "order_id": order_id, "kind": _lower(transaction.get("kind")),
+            "status": _lower(transaction.get("status")), "gateway": transaction.get("gateway"),
+            "amount": _amount(transaction.get("amountSet")), "currency": currency, "test": transaction.get("test"),
+            "created_at": transaction.get("createdAt"), "processed_at": transaction.get("processedAt"),
+            "parent_id": _gid_id((transaction.get("parentTransaction") or {}).get("id"))}
+
+
+def _fulfillment_order(fulfillment_order, order_id):
+    fulfillment_order_id = _gid_id(fulfillment_order.get("id"))
+    location = (fulfillment_order.get("assignedLocation") or {}).get("location")
+    return {"id": fulfillment_order_id, "order_id": order_id, "status": _lower(fulfillment_order.get("status")),
+            "assigned_location_id": _legacy_id(location),
+            "delivery_method": {"method_type": _lower((fulfillment_order.get("deliveryMethod") or {}).get(
+                "methodType"))},
+            "line_items": [{"id": _gid_id(line.get("id")), "fulfillment_order_id": fulfillment_order_id,
+                            "line_item_id": _gid_id((line.get("lineItem") or {}).get("id")),
+                            "quantity": line.get("totalQuantity"),
+                            "fulfillable_quantity": line.get("remainingQuantity")}
+                           for line in fulfillment_order.get("__children", {}).get("FulfillmentOrderLineItem", [])]}
+
+
+def bulk_order_to_order_data(order):
+    """
+    Converts an order of the bulk result, grouped by iter_bulk_objects, into the order response of the REST API
+    read by the order import, with its transactions and fulfillment orders.
+    """
+    children = order.get("__children", {})
+    order_id = _legacy_id(order)
+    currency = order.get("currencyCode")
+    numbers = re.findall(r"\d+", order.get("name") or "")
+    payment_gateway_names = order.get("paymentGatewayNames") or []
+    return {
+        "id": order_id, "name": order.get("name"), "order_number": int(numbers[-1]) if numbers else None,
+        "email": order.get("email"), "phone": order.get("phone"), "note": order.get("note"),
+        "tags": ", ".join(order.get("tags") or []), "currency": currency,
+        "presentment_currency": order.get("presentmentCurrencyCode"),
+        "financial_status": _lower(order.get("displayFinancialStatus")),
+        "fulfillment_status": FULFILLMENT_STATUS.get(order.get("displayFulfillmentStatus")),
+        "gateway": payment_gateway_names[0] if payment_gateway_names else None,
+        "payment_gateway_names": payment_gateway_names, "source_name": order.get("sourceName"),
+        "taxes_included": order.get("taxesIncluded"),
+        "discount_codes": [{"code": code} for code in order.get("discountCodes") or []],
+        "total_discounts": _amount(order.get("totalDiscountsSet")),
+        "total_discounts_set": _price_set(order.get("totalDiscountsSet")),
+        "subtotal_price": _amount(order.get("subtotalPriceSet")),
+        "total_tax": _amount(order.get("totalTaxSet")),
+        "total_price": _amount(order.get("totalPriceSet")),
+        "total_price_set": _price_set(order.get("totalPriceSet")),
+        "created_at": order.get("createdAt"), "updated_at": order.get("updatedAt"),
+        "processed_at": order.get("processedAt"), "cancelled_at": order.get("cancelledAt"),
+        "cancel_reason": _lower(order.get("cancelReason")), "closed_at": order.get("closedAt"),
+        "location_id": _legacy_id(order.get("physicalLocation")),
+        "fulfillments": [{"location_id": _legacy_id(fulfillment.get("location"))}
+                         for fulfillment in order.get("fulfillments") or []],
+        "refunds": [],
+        "tax_lines": _tax_lines(order.get("taxLines")),
+        "customer": _customer(order.get("customer")),
+        "billing_address": _address(order.get("billingAddress")),
+        "shipping_address": _address(order.get("shippingAddress")),
+        "line_items": [_line_item(line) for line in children.get("LineItem", [])],
+        "shipping_lines": [_shipping_line(line) for line in children.get("ShippingLine", [])],
+        "transaction": [_transaction(transaction, order_id, currency)
+                        for transaction in order.get("transactions") or []],
+        "fulfillment_data": [_fulfillment_order(fulfillment_order, order_id)
+                             for fulfillment_order in children.get("FulfillmentOrder", [])]}
+
+
+class ShopifyBulkOperationEpt(models.Model):
+    _name = "shopify.bulk.operation.ept"
+    _description = "Shopify Bulk Operation"
+    _order = "id desc"
+
+    name = fields.Char(string="Bulk Operation ID", readonly=True)
+    shopify_instance_id = fields.Many2one("shopify.instance.ept", string="Instance", required=True,
+                                          ondelete="cascade")
+    resource_type = fields.Selection([("order", "Orders"), ("product", "Products")], required=True)
+    queue_type = fields.Selection([("shipped", "Shipped Order Queue"), ("unshipped", "Unshipped Order Queue")],
+                                  help="Type of the order queues to create.")
+    skip_existing_product = fields.Boolean()
+    created_by = fields.Selection([("import", "By Manually Import Process"),
+                                   ("scheduled_action", "By Scheduled Action")], default="import")
+    state = fields.Selection([("running", "Running"), ("completed", "Completed"), ("imported", "Imported"),
+                              ("failed", "Failed")], default="running", copy=False)
+    object_count = fields.Integer(readonly=True)
+    imported_count = fields.Integer(readonly=True, help="Number of queue lines created from the result file.")
+    result_offset = fields.Integer(readonly=True, help="Number of records of the result file already read, the "
+                                                       "import resumes after them.")
+    error_code = fields.Char(readonly=True)
+    result_url = fields.Char(readonly=True)
+
+    @api.model
+    def shopify_submit_bulk_operation(self, instance, resource_type, search_query, queue_type=False,
+                                      skip_existing_product=False, created_by="import"):
+        """
+        This method is used to submit a bulkOperationRunQuery, which exports the records matching the search query
+        in a JSONL file. The scheduled action polls the operation and creates the queue lines from its result.
+        :param resource_type: order or product.
+        :param search_query: Shopify search syntax, e.g. updated_at:>='2024-01-01T00:00:00Z'.
+        @return: Record of the bulk operation.
+        """
+        instance.connect_in_shopify()
+        query = (BULK_ORDER_QUERY if resource_type == "order" else BULK_PRODUCT_QUERY) % search_query.replace(
+            '"', '\\"')
+        result = json.loads(shopify.GraphQL().execute(BULK_OPERATION_RUN_QUERY, {"query": query}))
+        response = (result.get("data") or {}).get("bulkOperationRunQuery") or {}
+        errors = response.get("userErrors") or result.get("errors")
+        if errors or not response.get("bulkOperation"):
+            raise UserError(_("Shopify bulk operation is not started.\n%s") % "\n".join(
+                error.get("message", "") for error in errors or []))
+
+        bulk_operation = self.create({"name": response["bulkOperation"]["id"],
+                                      "shopify_instance_id": instance.id,
+                                      "resource_type": resource_type,
+                                      "queue_type": queue_type,
+                                      "skip_existing_product": skip_existing_product,
+                                      "created_by": created_by})
+        _logger.info("Started bulk operation %s of %s for instance %s.", bulk_operation.name, resource_type,
+                     instance.name)
+        poll_cron = self.env.ref("shopify_ept.process_shopify_bulk_operation")
+        if not poll_cron.active:
+            poll_cron.write({'active': True, 'nextcall': datetime.now() + timedelta(seconds=60)})
+        return bulk_operation
+
+    def auto_process_shopify_bulk_operations(self):
+        """
+        This method is used to poll the running bulk operations and to create the queue lines of the completed ones.
+        It will be called from the scheduled action.
+        """
+        for bulk_operation in self.search([("state", "in", ["running", "completed"])]):
+            try:
+                bulk_operation.update_bulk_operation_status()
+                if bulk_operation.state == "completed":
+                    bulk_operation.import_bulk_operation_result()
+            except Exception as error:
+                self._cr.rollback()
+                _logger.error("Bulk operation %s is not processed: %s", bulk_operation.name, error)
+            self._cr.commit()
+        if not self.search_count([("state", "in", ["running", "completed"])]):
+            self.env.ref("shopify_ept.process_shopify_bulk_operation").sudo().write({"active": False})
+        return True
+
+    def update_bulk_operation_status(self):
+        """
+        This method is used to read the status of the running bulk operation.
+        """
+        if self.state != "running":
+            return True
+        self.shopify_instance_id.connect_in_shopify()
+        result = json.loads(shopify.GraphQL().execute(BULK_OPERATION_STATUS_QUERY, {"id": self.name}))
+        node = (result.get("data") or {}).get("node") or {}
+        status = node.get("status")
+        values = {"object_count": int(node.get("objectCount") or 0), "error_code": node.get("errorCode")}
+        if status == "COMPLETED":
+            values.update({"state": "completed", "result_url": node.get("url")})
+        elif status in ("FAILED", "CANCELED", "EXPIRED"):
+            values.update({"state": "failed", "error_code": node.get("errorCode") or status})
+        self.write(values)
+        return True
+
+    def import_bulk_operation_result(self):
+        """
+        This method is used to stream the result file of the completed bulk operation into queue lines. The lines
+        are created 50 at a time, one queue per batch, and committed after every batch. An order is added to the
+        batch once all its nested records are read, they follow it in the file.
+        """
+        batch = []
+        position = 0
+        if self.result_url:
+            for record in iter_bulk_objects(iter_bulk_operation_result(self.result_url)):
+                position += 1
+                if position <= self.result_offset:
+                    continue
+                batch.append(record)
+                if len(batch) == 50:
+                    self.create_queue_lines_from_bulk_records(batch)
+                    batch = []
+            if batch:
+                self.create_queue_lines_from_bulk_records(batch)
+        self.write({"state": "imported"})
+        _logger.info("Created %s queue lines from bulk operation %s.", self.imported_count, self.name)
+        if self.imported_count:
+            queue_cron = self.env.ref("shopify_ept.process_shopify_order_queue" if self.resource_type == "order"
+                                      else "shopify_ept.process_shopify_product_queue")
+            if not queue_cron.active:
+                queue_cron.write({'active': True, 'nextcall': datetime.now() + timedelta(seconds=120)})
+        return True
+
+    def create_queue_lines_from_bulk_records(self, records):
+        """
+        This method is used to create one queue with the lines of a batch of records of the result file. Records
+        which already have a draft or failed queue line are skipped.
+        """
+        instance = self.shopify_instance_id
+        if self.resource_type == "order":
+            line_obj = self.env["shopify.order.data.queue.line.ept"]
+            id_field, queue_field = "shopify_order_id", "shopify_order_data_queue_id"
+            domain = [("shopify_order_data_queue_id.is_action_require", "=", False)]
+        else:
+            line_obj = self.env["shopify.product.data.queue.line.ept"]
+            id_field, queue_field = "product_data_id", "product_data_queue_id"
+            domain = [("product_data_queue_id.is_action_require", "=", False)]
+
+        remote_ids = [str(record.get("legacyResourceId")) for record in records]
+        existing_ids = set(line_obj.search(domain + [(id_field, "in", remote_ids),
+                                                     ("shopify_instance_id", "=", instance.id),
+                                                     ("state", "in", ["draft", "failed"])]).mapped(id_field))
+        self.result_offset += len(records)
+        records = [record for record in records if str(record.get("legacyResourceId")) not in existing_ids]
+        if not records:
+            self._cr.commit()
+            return False
+
+        if self.resource_type == "order":
+            queue_type = self.queue_type or "unshipped"
+            queue = line_obj.shopify_create_order_queue(instance, queue_type, self.created_by)
+            fulfillment_order_cache_obj = self.env["shopify.fulfillment.order.cache"]
+            vals_list = []
+            for record in records:
+                order_data = self.prepare_bulk_order_data(record, instance)
+                if queue_type != "shipped" and instance.is_delivery_multi_warehouse:
+                    fulfillment_order_cache_obj.set_fulfillment_orders_ept(instance, order_data["id"],
+                                                                           order_data["fulfillment_data"])
+                customer_name, customer_email = line_obj.get_customer_name_and_email(order_data)
+                vals_list.append({"shopify_order_id": str(record.get("legacyResourceId")),
+                                  "shopify_instance_id": instance.id,
+                                  "name": record.get("name", ""),
+                                  "order_data": json.dumps(order_data),
+                                  "customer_name": customer_name or False,
+                                  "customer_email": customer_email or False,
+                                  queue_field: queue.id})
+        else:
+            queue = self.env["shopify.product.data.queue.ept"].shopify_create_product_queue(
+                instance, "import", self.skip_existing_product)
+            image_import_state = "pending" if instance.sync_product_with_images else "done"
+            vals_list = [{"product_data_id": str(record.get("legacyResourceId")),
+                          "shopify_instance_id": instance.id,
+                          "name": record.get("title"),
+                          "shopify_image_import_state": image_import_state,
+                          queue_field: queue.id} for record in records]
+        line_obj.create(vals_list)
+        self.imported_count += len(vals_list)
+        self._cr.commit()
+        return queue
+
+    @api.model
+    def prepare_bulk_order_data(self, record, instance):
+        """
+        This method is used to prepare the order data of a queue line from an order of the result file, in the
+        format of the order data of the REST import.
+        :param record: Order of the result file, with its nested records.
+        @return: Dictionary of the order data.
+        """
+        order_data = bulk_order_to_order_data(record)
+        is_buy_with_prime = False
+        if instance.import_buy_with_prime_shopify_order:
+            is_buy_with_prime = any(buy_with_prime_tag.name in order_data.get("tags") for buy_with_prime_tag in
+                                    instance.buy_with_prime_tag_ids)
+        order_data.update({"buy_with_prime": is_buy_with_prime})
+        return order_data
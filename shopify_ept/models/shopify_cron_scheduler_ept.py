@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger("Shopify Scheduler")
+
+# Keys of the advisory locks, the first integer is the namespace and the second one the instance or worker slot.
+# The instance jobs have one namespace per job, from INSTANCE_LOCK_NAMESPACE + 1 on.
+INSTANCE_LOCK_NAMESPACE = 5310100
+WORKER_SLOT_LOCK_NAMESPACE = 53102
+
+# Per instance scheduled actions, created by the cron configuration wizard.
+INSTANCE_JOB_CRONS = {
+    "export_stock": "shopify_ept.ir_cron_shopify_auto_export_inventory_instance_%d",
+    "import_order": "shopify_ept.ir_cron_shopify_auto_import_order_instance_%d",
+    "import_shipped_order": "shopify_ept.ir_cron_shopify_auto_import_shipped_order_instance_%d",
+    "import_buy_with_prime_order": "shopify_ept.ir_cron_shopify_auto_import_buy_with_prime_order_instance_%d",
+    "import_cancel_order": "shopify_ept.ir_cron_shopify_auto_import_cancel_order_instance_%d",
+    "update_order_status": "shopify_ept.ir_cron_shopify_auto_update_order_status_instance_%d",
+    "import_payout_report": "shopify_ept.ir_cron_auto_import_payout_report_instance_%d",
+    "process_bank_statement": "shopify_ept.ir_cron_auto_process_bank_statement_instance_%d",
+    "import_product": "shopify_ept.ir_cron_shopify_auto_import_product_instance_%d",
+}
+
+# Queue processing jobs, run by one scheduled action for all the instances.
+QUEUE_JOB_CRONS = {
+    "process_order_queue": "shopify_ept.process_shopify_order_queue",
+    "process_product_queue": "shopify_ept.process_shopify_product_queue",
+}
+
+# Draft queue lines of every instance, used for the lag metrics.
+QUEUE_LINE_TABLES = {
+    "order": "shopify_order_data_queue_line_ept",
+    "product": "shopify_product_data_queue_line_ept",
+    "customer": "shopify_customer_data_queue_line_ept",
+    "export_stock": "shopify_export_stock_queue_line_ept",
+}
+
+JOB_NAMES = list(INSTANCE_JOB_CRONS) + list(QUEUE_JOB_CRONS)
+
+
+class ShopifyInstanceJobStatsEpt(models.Model):
+    _name = "shopify.instance.job.stats.ept"
+    _description = "Shopify Instance Job Statistics"
+    _log_access = False
+
+    instance_id = fields.Many2one("shopify.instance.ept", required=True, ondelete="cascade", readonly=True)
+    job_name = fields.Char(required=True, readonly=True)
+    runs = fields.Integer(readonly=True)
+    postponed = fields.Integer(readonly=True)
+    seconds = fields.Float(readonly=True, help="Total time of the runs of the job, by all the workers.")
+    max_seconds = fields.Float(readonly=True)
+    last_run_at = fields.Datetime(readonly=True)
+
+    _sql_constraints = [("unique_instance_job", "unique(instance_id, job_name)",
+                         "Statistics of a job must be unique per instance.")]
+
+
+class ShopifyCronSchedulerEpt(models.AbstractModel):
+    _name = "shopify.cron.scheduler.ept"
+    _description = "Shopify Instance Job Scheduler"
+
+    def run_instance_job(self, instance, job_name, method, *args, **kwargs):
+        """
+        This method is used to run a scheduled job of an instance. A job of an instance runs in one worker at a
+        time, the other jobs of the instance are not blocked by it, and not more jobs than the configured workers
+        run at the same time for all the instances. A job which cannot run now is triggered again later, so an
+        instance with a long job does not block the others.
+        :param instance: Record of the Shopify instance.
+        :param job_name: Key of INSTANCE_JOB_CRONS or QUEUE_JOB_CRONS.
+        :param method: Method to call with the remaining arguments.
+        @return: Result of the method, True when the job is postponed.
+        """
+        lock_cr = self.env.registry.cursor()
+        lock_namespace = self._get_job_lock_namespace(job_name)
+        slot = None
+        instance_locked = False
+        try:
+            lock_cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (lock_namespace, instance.id))
+            instance_locked = lock_cr.fetchone()[0]
+            if instance_locked:
+                slot = self._acquire_worker_slot(lock_cr)
+            lock_cr.commit()
+            if not instance_locked or slot is False:
+                reason = "the job of the instance is running" if not instance_locked else "all workers are busy"
+                _logger.info("Postponed job %s of instance %s, %s.", job_name, instance.name, reason)
+                self._update_job_stats(lock_cr, instance, job_name, postponed=True)
+                self._postpone_instance_job(instance, job_name)
+                return True
+
+            start = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._update_job_stats(lock_cr, instance, job_name, seconds=time.time() - start)
+        finally:
+            if slot:
+                lock_cr.execute("SELECT pg_advisory_unlock(%s, %s)", (WORKER_SLOT_LOCK_NAMESPACE, slot))
+            if instance_locked:
+                lock_cr.execute("SELECT pg_advisory_unlock(%s, %s)", (lock_namespace, instance.id))
+            lock_cr.commit()
+            lock_cr.close()
+
+    @staticmethod
+    def _get_job_lock_namespace(job_name):
+        """
+        Returns the advisory lock namespace of a job, so the lock of an instance is taken per job.
+        """
+        return INSTANCE_LOCK_NAMESPACE + 1 + JOB_NAMES.index(job_name)
+
+    def _acquire_worker_slot(self, lock_cr):
+        """
+        Takes one of the worker slots configured in shopify_ept.instance_job_workers.
+        :return: Number of the slot, None when the workers are not limited and False when all of them are busy.
+        """
+        workers = int(self.env["ir.config_parameter"].sudo().get_param("shopify_ept.instance_job_workers", 0) or 0)
+        if workers <= 0:
+            return None
+        for slot in range(1, workers + 1):
+            lock_cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (WORKER_SLOT_LOCK_NAMESPACE, slot))
+            if lock_cr.fetchone()[0]:
+                return slot
+        return False
+
+    def _postpone_instance_job(self, instance, job_name):
+        """
+        Triggers the scheduled action of the job again after the delay of shopify_ept.instance_job_retry_delay.
+        The queue jobs trigger the scheduled action of all the instances.
+        """
+        if job_name in QUEUE_JOB_CRONS:
+            cron = self.env.ref(QUEUE_JOB_CRONS[job_name], raise_if_not_found=False)
+        else:
+            cron = self.env.ref(INSTANCE_JOB_CRONS[job_name] % instance.id, raise_if_not_found=False)
+        if not cron:
+            return False
+        delay = int(self.env["ir.config_parameter"].sudo().get_param("shopify_ept.instance_job_retry_delay", 60)
+                    or 60)
+        cron.sudo()._trigger(fields.Datetime.now() + timedelta(seconds=delay))
+        return True
+
+    def _update_job_stats(self, lock_cr, instance, job_name, seconds=0.0, postponed=False):
+        """
+        Adds a run or a postponement of the job to its statistics, in the lock cursor which is committed at the end
+        of the job, so the statistics of all the workers are kept even when the job fails.
+        """
+        lock_cr.execute("""
+            INSERT INTO shopify_instance_job_stats_ept AS stats
+                (instance_id, job_name, runs, postponed, seconds, max_seconds, last_run_at)
+            VALUES (%(instance)s, %(job)s, %(runs)s, %(postponed)s, %(seconds)s, %(seconds)s, %(last_run_at)s)
+            ON CONFLICT (instance_id, job_name) DO UPDATE SET
+                runs = stats.runs + EXCLUDED.runs,
+                postponed = stats.postponed + EXCLUDED.postponed,
+                seconds = stats.seconds + EXCLUDED.seconds,
+                max_seconds = GREATEST(stats.max_seconds, EXCLUDED.max_seconds),
+                last_run_at = COALESCE(EXCLUDED.last_run_at, stats.last_run_at)
+        """, {"instance": instance.id, "job": job_name, "runs": 0 if postponed else 1, "postponed": int(postponed),
+              "seconds": seconds, "last_run_at": None if postponed else fields.Datetime.now()})
+
+    @api.model
+    def is_instance_job_running(self, instance):
+        """
+        This method is used to check that a job of the instance is running in any worker.
+        @return: True/False
+        """
+        self._cr.execute("""
+            SELECT 1 FROM pg_locks
+            WHERE locktype = 'advisory' AND granted AND classid BETWEEN %s AND %s AND objid = %s AND objsubid = 2
+            LIMIT 1
+        """, (self._get_job_lock_namespace(JOB_NAMES[0]), self._get_job_lock_namespace(JOB_NAMES[-1]), instance.id))
+        return bool(self._cr.fetchone())
+
+    @api.model
+    def process_queues_by_instance(self, queues, job_name, method):
+        """
+        This method is used to process the queues of a queue scheduled action instance by instance, every instance
+        as a job of run_instance_job. The instances are spread over shopify_ept.queue_job_workers workers, each one
+        with its own cursor, which take the next instance when they are done with one. The advisory lock of the job
+        is the claim of the instance: an instance whose queues are processed by a worker of another process is
+        skipped and postponed. Every instance gets an equal share of the time left to its worker, so the backlog of
+        one instance does not delay the queues of the others.
+        :param queues: Records of the queues in their processing order.
+        :param job_name: Key of QUEUE_JOB_CRONS.
+        :param method: Method processing the queues of an instance, called with the queues and the deadline.
+        """
+        if not queues:
+            return True
+        cron_time = queues.shopify_instance_id.get_shopify_cron_execution_time(QUEUE_JOB_CRONS[job_name])
+        deadline = time.time() + cron_time - 60
+        workers = max(int(self.env["ir.config_parameter"].sudo().get_param("shopify_ept.queue_job_workers", 1)
+                          or 1), 1)
+        pending = deque((instance_id, queues.filtered(lambda queue: queue.shopify_instance_id.id == instance_id).ids)
+                        for instance_id in dict.fromkeys(queues.shopify_instance_id.ids))
+        pending_lock = threading.Lock()
+        workers = min(workers, len(pending))
+        if workers == 1:
+            return self._process_queue_jobs(pending, pending_lock, 1, job_name, method, queues._name, deadline)
+
+        # The method is called again on the records of the cursor of every worker.
+        records = method.__self__
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _number in range(workers):
+                executor.submit(self._run_queue_job_worker, pending, pending_lock, workers, job_name,
+                                records._name, records.ids, method.__name__, queues._name, deadline)
+        return True
+
+    def _run_queue_job_worker(self, pending, pending_lock, workers, job_name, model_name, record_ids, method_name,
+                              queue_model, deadline):
+        """
+        Runs one queue worker with its own cursor, committed by the queue methods as they progress.
+        """
+        threading.current_thread().dbname = self.env.cr.dbname
+        try:
+            with self.env.registry.cursor() as cr:
+                env = api.Environment(cr, self.env.uid, self.env.context)
+                method = getattr(env[model_name].browse(record_ids), method_name)
+                env[self._name]._process_queue_jobs(pending, pending_lock, workers, job_name, method, queue_model,
+                                                    deadline)
+        except Exception as error:
+            _logger.exception("Queue worker of job %s stopped with an error: %s", job_name, error)
+
+    def _process_queue_jobs(self, pending, pending_lock, workers, job_name, method, queue_model, deadline):
+        """
+        Takes the instances of the pending queues one by one and processes their queues through run_instance_job
+        until none is left or the deadline is reached.
+        :param pending: deque of tuple (instance id, queue ids) shared by the workers.
+        """
+        queue_obj = self.env[queue_model]
+        while True:
+            with pending_lock:
+                if not pending:
+                    return True
+                instance_id, queue_ids = pending.popleft()
+                rounds = -(-(len(pending) + 1) // workers)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return True
+            queues = queue_obj.browse(queue_ids)
+            self.run_instance_job(queues.shopify_instance_id, job_name, method, queues,
+                                  time.time() + remaining / rounds)
+
+    @api.model
+    def get_instance_lag_metrics(self, instances=None):
+        """
+        This method is used to get the lag of every instance: the number of draft queue lines and the age of the
+        oldest of them in minutes, per type of queue, and the counters of its jobs run by all the workers.
+        :param instances: Records of the Shopify instances, all of them when not given.
+        @return: dict {instance_id: {"queues": {...}, "jobs": {...}, "running": True/False}}
+        """
+        instances = instances if instances is not None else self.env["shopify.instance.ept"].search([])
+        metrics = {instance.id: {"name": instance.name, "queues": {}, "jobs": {},
+                                 "running": self.is_instance_job_running(instance)} for instance in instances}
+        for queue_type, table in QUEUE_LINE_TABLES.items():
+            self._cr.execute("""
+                SELECT shopify_instance_id, COUNT(*),
+                       EXTRACT(EPOCH FROM (NOW() AT TIME ZONE 'UTC' - MIN(create_date))) / 60
+                FROM %s
+                WHERE state = 'draft' AND shopify_instance_id = ANY(%%s::int[])
+                GROUP BY shopify_instance_id
+            """ % table, (instances.ids,))
+            for instance_id, draft_count, oldest_age in self._cr.fetchall():
+                metrics[instance_id]["queues"][queue_type] = {"draft": draft_count,
+                                                              "oldest_draft_age": round(float(oldest_age or 0), 1)}
+        for stats in self.env["shopify.instance.job.stats.ept"].search_read(
+                [("instance_id", "in", instances.ids)],
+                ["instance_id", "job_name", "runs", "postponed", "seconds", "max_seconds", "last_run_at"]):
+            metrics[stats["instance_id"][0]]["jobs"][stats["job_name"]] = {
+                field: stats[field] for field in ("runs", "postponed", "seconds", "max_seconds", "last_run_at")}
+        return metrics
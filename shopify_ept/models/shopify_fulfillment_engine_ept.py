@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import models, api
+from .. import shopify
+
+_logger = logging.getLogger("Shopify Fulfillment")
+
+ORDER_STATUS_QUERY = """
+query orderStatus($ids: [ID!]!) {
+  nodes(ids: $ids) {
+    ... on Order {
+      legacyResourceId
+      displayFulfillmentStatus
+      cancelledAt
+      cancelReason
+    }
+  }
+}
+"""
+
+# The nested connections make this query much more expensive than the status query, Shopify rejects a query
+# costing more than 1000 points, so fewer orders are requested at a time.
+FULFILLMENT_ORDERS_QUERY = """
+query fulfillmentOrders($ids: [ID!]!) {
+  nodes(ids: $ids) {
+    ... on Order {
+      legacyResourceId
+      fulfillmentOrders(first: 5) {
+        pageInfo {
+          hasNextPage
+        }
+        nodes {
+          id
+          status
+          assignedLocation {
+            location {
+              legacyResourceId
+            }
+          }
+          deliveryMethod {
+            methodType
+          }
+          lineItems(first: 30) {
+            pageInfo {
+              hasNextPage
+            }
+            nodes {
+              id
+              totalQuantity
+              lineItem {
+                id
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+FULFILLMENT_CREATE_MUTATION = """
+mutation fulfillmentCreateV2($fulfillment: FulfillmentV2Input!) {
+  fulfillmentCreateV2(fulfillment: $fulfillment) {
+    fulfillment {
+      id
+      status
+      fulfillmentLineItems(first: 50) {
+        nodes {
+          lineItem {
+            id
+          }
+        }
+      }
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+def has_more_fulfillment_order_pages(node):
+    """
+    Returns True when the fulfillment orders of an order, or the line items of one of them, do not fit in the
+    first page of FULFILLMENT_ORDERS_QUERY.
+    """
+    connection = node.get("fulfillmentOrders") or {}
+    if (connection.get("pageInfo") or {}).get("hasNextPage"):
+        return True
+    return any(((fulfillment_order.get("lineItems") or {}).get("pageInfo") or {}).get("hasNextPage")
+               for fulfillment_order in connection.get("nodes", []))
+
+
+def is_throttled(result):
+    """
+    Returns True when Shopify rejected a GraphQL request because the query cost budget of the shop is exhausted.
+    """
+    return any((error.get("extensions") or {}).get("code") == "THROTTLED" for error in result.get("errors") or [])
+
+
+def execute_graphql(graphql, query, variables, connection=None, attempts=5):
+    """
+    Sends a GraphQL request and sends it again after the query cost is restored when Shopify throttles it.
+    @return: Result of the last attempt, still throttled when all the attempts were throttled.
+    """
+    result = {}
+    for attempt in range(attempts):
+        result = json.loads(graphql.execute(query, variables, connection=connection))
+        if not is_throttled(result):
+            break
+        cost = (result.get("extensions") or {}).get("cost") or {}
+        throttle_status = cost.get("throttleStatus") or {}
+        restore_rate = float(throttle_status.get("restoreRate") or 50.0)
+        required = float(cost.get("requestedQueryCost") or 10.0)
+        available = float(throttle_status.get("currentlyAvailable") or 0.0)
+        if attempt < attempts - 1:
+            time.sleep(min(max((required - available) / restore_rate, 1.0) * (attempt + 1), 30.0))
+    return result
+
+
+# REST like fulfillment status of the GraphQL displayFulfillmentStatus of an order.
+FULFILLMENT_STATUS = {"FULFILLED": "fulfilled", "PARTIALLY_FULFILLED": "partial"}
+
+
+def gid_to_id(gid):
+    """
+    Returns the numeric id of a GraphQL global id, e.g. gid://shopify/FulfillmentOrder/123 gives "123".
+    """
+    return str(gid).rsplit("/", 1)[-1] if gid else ""
+
+
+def convert_fulfillment_order_node(node, shopify_order_id):
+    """
+    Converts a fulfillment order of the GraphQL API in the same format as the REST FulfillmentOrders resource.
+    """
+    fulfillment_order_id = gid_to_id(node.get("id"))
+    location = (node.get("assignedLocation") or {}).get("location") or {}
+    return {
+        "id": int(fulfillment_order_id),
+        "order_id": int(shopify_order_id),
+        "status": (node.get("status") or "").lower(),
+        "assigned_location_id": int(location["legacyResourceId"]) if location.get("legacyResourceId") else False,
+        "delivery_method": {"method_type": ((node.get("deliveryMethod") or {}).get("methodType") or "").lower()},
+        "line_items": [{"id": int(gid_to_id(line.get("id"))),
+                        "fulfillment_order_id": int(fulfillment_order_id),
+                        "line_item_id": int(gid_to_id((line.get("lineItem") or {}).get("id"))),
+                        "quantity": line.get("totalQuantity")}
+                       for line in (node.get("lineItems") or {}).get("nodes", [])],
+    }
+
+
+class ShopifyFulfillmentEngineEpt(models.AbstractModel):
+    _name = "shopify.fulfillment.engine.ept"
+    _description = "Shopify Fulfillment Engine"
+
+    @api.model
+    def update_order_status_in_batch(self, instance, pickings):
+        """
+        This method is used to update the order status in Shopify for many pickings with few API calls. The status
+        of the orders is read with one GraphQL query per 250 orders, the fulfillment orders which are not known
+        yet are read with one query per batch of orders, and the fulfillments are created in parallel. The
+        results are written once all the fulfillments are sent.
+        :param instance: Record of the Shopify instance, connected already.
+        :param pickings: Records of the pickings to update.
+        @return: Log lines of the pickings which are not updated.
+        """
+        sale_order_obj = self.env["sale.order"]
+        common_log_line_obj = self.env["common.log.lines.ept"]
+        log_lines = []
+        pickings = pickings.filtered(lambda picking: picking.sale_id.shopify_order_id)
+        order_status = self.get_shopify_order_status(pickings.sale_id)
+
+        pickings = self.filter_pickings_by_order_status(pickings, order_status)
+        fulfillment_orders = self.get_shopify_fulfillment_orders(
+            instance, pickings.filtered(lambda picking: not picking.move_ids.filtered("shopify_fulfillment_line_id")).sale_id)
+
+        fulfillment_requests = []
+        for picking in pickings:
+            sale_order = picking.sale_id
+            _logger.info("We are processing Sale order '%s' and Picking '%s'", sale_order.name, picking.name)
+            carrier_name = sale_order_obj.get_shopify_carrier_code(picking)
+            order_fulfillment_orders = fulfillment_orders.get(sale_order.shopify_order_id)
+            sale_order_obj.set_fulfilment_order_id_and_fulfillment_line_id(sale_order, picking,
+                                                                           order_fulfillment_orders)
+            tracking_numbers, line_items = sale_order.prepare_tracking_numbers_and_lines_for_fulfilment(picking)
+            if not line_items:
+                message = "No order lines found for the update order shipping status for order [%s]" \
+                          % sale_order.name
+                _logger.info(message)
+                log_lines.append(
+                    common_log_line_obj.create_common_log_line_ept(shopify_instance_id=instance.id,
+                                                                   module="shopify_ept", message=message,
+                                                                   model_name="sale.order",
+                                                                   order_ref=sale_order.client_order_ref))
+                continue
+
+            fulfillment_order_ids = set(sale_order.order_line.move_ids.filtered(
+                "shopify_fulfillment_order_id").mapped("shopify_fulfillment_order_id"))
+            if len(fulfillment_order_ids) > 1 or len(order_fulfillment_orders or []) > 1:
+                shopify_location_id, fulfillment_vals = sale_order_obj.prepare_vals_for_multiple_fulfillment(
+                    sale_order, tracking_numbers, picking, carrier_name, line_items)
+                if not shopify_location_id:
+                    continue
+            else:
+                shopify_location_id = sale_order_obj.search_shopify_location_for_update_order_status(
+                    sale_order, instance, line_items, picking)
+                if not shopify_location_id:
+                    continue
+                fulfillment_vals = sale_order_obj.prepare_vals_for_fulfillment(
+                    sale_order, shopify_location_id, tracking_numbers, picking, carrier_name, line_items,
+                    instance.notify_customer)
+            fulfillment_requests.append((picking, shopify_location_id,
+                                         [self.prepare_fulfillment_input(vals) for vals in fulfillment_vals]))
+
+        results = self.submit_shopify_fulfillments([fulfillment_inputs for _picking, _location, fulfillment_inputs
+                                                    in fulfillment_requests],
+                                                   [picking.sale_id.id for picking, _location, _inputs
+                                                    in fulfillment_requests])
+        # The fulfilled orders have new fulfillment order statuses, their cached fulfillment orders are outdated.
+        self.env["shopify.fulfillment.order.cache"].invalidate_fulfillment_orders_ept(
+            instance, [picking.sale_id.shopify_order_id for picking, _location, _inputs in fulfillment_requests])
+        for (picking, shopify_location_id, _fulfillment_inputs), result in zip(fulfillment_requests, results):
+            log_line = self.process_fulfillment_result(instance, picking, shopify_location_id, result,
+                                                       order_status.get(picking.sale_id.shopify_order_id) or {})
+            if log_line:
+                log_lines.append(log_line)
+        return log_lines
+
+    def execute_graphql_nodes(self, query, shopify_order_ids, batch_size):
+        """
+        This method is used to request the orders with a nodes query, batch_size orders at a time.
+        @return: dict {shopify_order_id: node}
+        """
+        nodes = {}
+        graphql = shopify.GraphQL()
+        shopify_order_ids = list(dict.fromkeys(shopify_order_ids))
+        for index in range(0, len(shopify_order_ids), batch_size):
+            order_ids = shopify_order_ids[index:index + batch_size]
+            try:
+                result = execute_graphql(graphql, query, {
+                    "ids": ["gid://shopify/Order/%s" % order_id for order_id in order_ids]})
+            except Exception as error:
+                _logger.info("Error in Request of shopify orders %s for the fulfilment, they are kept for the next "
+                             "run. Error: %s", order_ids, error)
+                continue
+            if result.get("errors") and not (result.get("data") or {}).get("nodes"):
+                _logger.info("Shopify orders %s are not read for the fulfilment, they are kept for the next run. "
+                             "Error: %s", order_ids, result["errors"])
+                continue
+            for node in (result.get("data") or {}).get("nodes") or []:
+                if node and node.get("legacyResourceId"):
+                    nodes[str(node["legacyResourceId"])] = node
+        return nodes
+
+    def get_shopify_order_status(self, sale_orders):
+        """
+        This method is used to read the fulfillment and cancel status of the orders, 250 orders per request.
+        @return: dict {shopify_order_id: {"fulfillment_status": ..., "cancelled": True/False}}
+        """
+        nodes = self.execute_graphql_nodes(ORDER_STATUS_QUERY, sale_orders.mapped("shopify_order_id"), 250)
+        return {order_id: {"fulfillment_status": FULFILLMENT_STATUS.get(node.get("displayFulfillmentStatus")),
+                           "cancelled": bool(node.get("cancelledAt") and node.get("cancelReason"))}
+                for order_id, node in nodes.items()}
+
+    def get_shopify_fulfillment_orders(self, instance, sale_orders):
+        """
+        This method is used to read the fulfillment orders of the orders, in the format of the REST API. They are
+        taken from the fulfillment order cache, only the orders missing in it are requested and cached. An order
+        having more fulfillment orders or line items than the first page of the query is read with the REST API,
+        so a partial list is never used nor cached.
+        @return: dict {shopify_order_id: [fulfillment order]}
+        """
+        if not sale_orders:
+            return {}
+        fulfillment_order_cache_obj = self.env["shopify.fulfillment.order.cache"]
+        shopify_order_ids = sale_orders.mapped("shopify_order_id")
+        fulfillment_orders = fulfillment_order_cache_obj.get_cached_fulfillment_orders_ept(instance,
+                                                                                           shopify_order_ids)
+        missing_order_ids = [order_id for order_id in shopify_order_ids if order_id not in fulfillment_orders]
+        if not missing_order_ids:
+            return fulfillment_orders
+        batch_size = max(int(self.env["ir.config_parameter"].sudo().get_param(
+            "shopify_ept.fulfillment_order_batch_size", 5) or 5), 1)
+        nodes = self.execute_graphql_nodes(FULFILLMENT_ORDERS_QUERY, missing_order_ids, batch_size)
+        for order_id, node in nodes.items():
+            if has_more_fulfillment_order_pages(node):
+                try:
+                    fulfillment_orders[order_id] = fulfillment_order_cache_obj.fetch_fulfillment_orders_ept(
+                        instance, order_id)
+                except Exception as error:
+                    _logger.info("Error in Request of fulfillment orders of the Shopify order %s. Error: %s",
+                                 order_id, error)
+                continue
+            fulfillment_orders[order_id] = [convert_fulfillment_order_node(fulfillment_order, order_id) for
+                                            fulfillment_order in (node.get("fulfillmentOrders") or {}).get("nodes",
+                                                                                                           [])]
+            fulfillment_order_cache_obj.set_fulfillment_orders_ept(instance, order_id, fulfillment_orders[order_id])
+        return fulfillment_orders
+
+    def filter_pickings_by_order_status(self, pickings, order_status):
+        """
+        This method is used to skip the pickings of the orders which are fulfilled or cancelled in Shopify
+        already, or which could not be read.
+        @return: Pickings to fulfill.
+        """
+        shopify_location_obj = self.env["shopify.location.ept"]
+        fulfilled_orders = cancelled_orders = self.env["sale.order"]
+        for sale_order in pickings.sale_id:
+            status = order_status.get(sale_order.shopify_order_id)
+            if status is None:
+                _logger.info("Status of order %s is not read from Shopify, its pickings are kept for the next run.",
+                             sale_order.name)
+                continue
+            if status["fulfillment_status"] == "fulfilled":
+                _logger.info('Order %s is already fulfilled', sale_order.name)
+                sale_order.shopify_location_id = shopify_location_obj.search(
+                    [("warehouse_for_order", "=", sale_order.warehouse_id.id),
+                     ("instance_id", "=", sale_order.shopify_instance_id.id)], limit=1)
+                fulfilled_orders |= sale_order
+            elif status["cancelled"]:
+                cancelled_orders |= sale_order
+        fulfilled_orders.picking_ids.filtered(lambda l: l.state == 'done').write({'updated_in_shopify': True})
+        cancelled_orders.picking_ids.filtered(lambda l: l.state == 'done').write({'is_cancelled_in_shopify': True})
+        return pickings.filtered(lambda picking: picking.sale_id.shopify_order_id in order_status and
+                                 picking.sale_id not in fulfilled_orders | cancelled_orders)
+
+    def prepare_fulfillment_input(self, fulfillment_vals):
+        """
+        This method is used to convert the values of a REST fulfillment into a FulfillmentV2Input.
+        """
+        fulfillment_input = {"notifyCustomer": bool(fulfillment_vals.get("notify_customer")),
+                             "lineItemsByFulfillmentOrder": []}
+        for fulfillment_order in fulfillment_vals.get("line_items_by_fulfillment_order", []):
+            if not fulfillment_order.get("fulfillment_order_id"):
+                continue
+            fulfillment_input["lineItemsByFulfillmentOrder"].append({
+                "fulfillmentOrderId": "gid://shopify/FulfillmentOrder/%s" % fulfillment_order[
+                    "fulfillment_order_id"],
+                "fulfillmentOrderLineItems": [
+                    {"id": "gid://shopify/FulfillmentOrderLineItem/%s" % line["id"], "quantity": line["quantity"]}
+                    for line in fulfillment_order.get("fulfillment_order_line_items", []) if line.get("id")]})
+        if fulfillment_vals.get("tracking_info"):
+            fulfillment_input["trackingInfo"] = fulfillment_vals["tracking_info"]
+        return fulfillment_input
+
+    def submit_shopify_fulfillments(self, fulfillment_requests, group_keys=None):
+        """
+        This method is used to create the fulfillments with fulfillmentCreateV2 mutations sent by a pool of
+        threads. The calls share the rate limit of the shop, the fulfillments of a picking are sent in turn and
+        stop at the first error. The pickings having the same group key, e.g. the pickings of one order, are sent
+        in turn by the same thread, as they fulfill the same fulfillment orders. The threads do not use the ORM
+        and send the requests through their own copy of the connection of the current thread, as they have no
+        active Shopify session.
+        :param fulfillment_requests: List of the FulfillmentV2Input lists of each picking.
+        :param group_keys: List of the group key of each picking, every picking is its own group without it.
+        @return: List of the results of each picking, in the same order.
+        """
+        if not fulfillment_requests:
+            return []
+        workers = max(int(self.env["ir.config_parameter"].sudo().get_param("shopify_ept.fulfillment_workers", 4)
+                          or 4), 1)
+        graphql = shopify.GraphQL()
+        connection = shopify.ShopifyResource.connection
+        groups = {}
+        for index, group_key in enumerate(group_keys or range(len(fulfillment_requests))):
+            groups.setdefault(group_key, []).append(index)
+
+        def _submit_picking(worker_connection, fulfillment_inputs):
+            results = []
+            for fulfillment_input in fulfillment_inputs:
+                try:
+                    result = execute_graphql(graphql, FULFILLMENT_CREATE_MUTATION, {"fulfillment": fulfillment_input},
+                                             connection=worker_connection)
+                except Exception as error:
+                    results.append({"exception": str(error)})
+                    break
+                # The top level errors, e.g. a throttled request, do not reject the fulfillment itself, so the
+                # picking is left for the next run as for an exception.
+                if result.get("errors"):
+                    results.append({"exception": "; ".join(error.get("message", "") for error in result["errors"])})
+                    break
+                response = (result.get("data") or {}).get("fulfillmentCreateV2") or {}
+                errors = response.get("userErrors")
+                if errors or not response.get("fulfillment"):
+                    results.append({"errors": [error.get("message", "") for error in errors or []]})
+                    break
+                results.append({"fulfillment": response["fulfillment"]})
+            return results
+
+        def _submit(indexes):
+            # Connections hold the last response, so every call gets its own one for the same shop.
+            worker_connection = connection.__class__(connection.site, connection.user, connection.password,
+                                                     connection.timeout, connection.format,
+                                                     transport=connection.transport,
+                                                     rate_limit_key=connection.rate_limit_key)
+            return [(index, _submit_picking(worker_connection, fulfillment_requests[index])) for index in indexes]
+
+        if workers == 1:
+            group_results = [_submit(indexes) for indexes in groups.values()]
+        else:
+            with ThreadPoolExecutor(max_workers=min(workers, len(groups))) as executor:
+                group_results = list(executor.map(_submit, groups.values()))
+        results = [None] * len(fulfillment_requests)
+        for group_result in group_results:
+            for index, result in group_result:
+                results[index] = result
+        return results
+
+    def process_fulfillment_result(self, instance, picking, shopify_location_id, results, order_status):
+        """
+        This method is used to write the result of the fulfillments of a picking, as the REST process does.
+        @return: Log line when the picking is not updated.
+        """
+        sale_order = picking.sale_id
+        last_result = results[-1] if results else {}
+        message = False
+        if "exception" in last_result:
+            message = last_result["exception"]
+        elif "errors" in last_result:
+            if order_status.get("fulfillment_status") != "partial":
+                picking.write({'is_manually_action_shopify_fulfillment': True})
+            sale_order.write({'is_service_tracking_updated': False})
+            message = "Order(%s) status not updated due to %s:" % (sale_order.name, last_result["errors"])
+        if message:
+            _logger.info(message)
+            return self.env["common.log.lines.ept"].create_common_log_line_ept(
+                shopify_instance_id=instance.id, module="shopify_ept", message=message, model_name="sale.order",
+                order_ref=sale_order.client_order_ref)
+
+        fulfillment_id = ""
+        line_item_ids = set()
+        for result in results:
+            fulfillment = result.get("fulfillment") or {}
+            fulfillment_id = gid_to_id(fulfillment.get("id")) or fulfillment_id
+            line_item_ids.update(gid_to_id((line.get("lineItem") or {}).get("id")) for line in
+                                 (fulfillment.get("fulfillmentLineItems") or {}).get("nodes", []))
+        service_order_lines = sale_order.order_line.filtered(
+            lambda x: x.shopify_line_id in line_item_ids and x.product_id.type == 'service'
+                      and not x.is_delivery and x.shopify_fulfillment_order_status != 'closed')
+        if service_order_lines:
+            service_order_lines.write({'shopify_fulfillment_order_status': 'closed'})
+        picking.write({'updated_in_shopify': True, 'shopify_fulfillment_id': fulfillment_id})
+        sale_order.shopify_location_id = shopify_location_id
+        return False
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import json
+import logging
+from datetime import datetime, timedelta
+
+from odoo import models, fields, api
+from .. import shopify
+
+_logger = logging.getLogger("Shopify Fulfillment Order Cache")
+
+
+class ShopifyFulfillmentOrderCache(models.Model):
+    _name = "shopify.fulfillment.order.cache"
+    _description = "Shopify Fulfillment Order Cache"
+    _order = "shopify_order_id, fulfillment_order_id"
+    _log_access = False
+
+    shopify_instance_id = fields.Many2one("shopify.instance.ept", string="Instance", required=True,
+                                          ondelete="cascade", readonly=True)
+    shopify_order_id = fields.Char(string="Shopify Order ID", required=True, index=True, readonly=True)
+    fulfillment_order_id = fields.Char(string="Fulfillment Order ID", index=True, readonly=True)
+    status = fields.Char(readonly=True)
+    assigned_location_id = fields.Char(string="Assigned Location ID", readonly=True)
+    delivery_method_type = fields.Char(readonly=True)
+    line_items = fields.Text(readonly=True, help="Line items of the fulfillment order, in JSON.")
+    fetched_at = fields.Datetime(readonly=True)
+
+    @api.model
+    def get_cached_fulfillment_orders_ept(self, instance, shopify_order_ids):
+        """
+        This method is used to read the cached fulfillment orders of the orders, in the format of the REST API.
+        Entries older than the hours of shopify_ept.fulfillment_order_cache_ttl are not used.
+        :param instance: Record of the Shopify instance.
+        :param shopify_order_ids: Shopify ids of the orders.
+        @return: dict {shopify_order_id: [fulfillment order]} of the orders found in the cache.
+        """
+        shopify_order_ids = [str(order_id) for order_id in shopify_order_ids if order_id]
+        if not shopify_order_ids:
+            return {}
+        ttl = int(self.env["ir.config_parameter"].sudo().get_param("shopify_ept.fulfillment_order_cache_ttl", 24)
+                  or 24)
+        entries = self.search([("shopify_instance_id", "=", instance.id),
+                               ("shopify_order_id", "in", shopify_order_ids),
+                               ("fetched_at", ">=", datetime.now() - timedelta(hours=ttl))])
+        result = {}
+        for entry in entries:
+            result.setdefault(entry.shopify_order_id, []).append(entry.prepare_fulfillment_order_data())
+        return result
+
+    def prepare_fulfillment_order_data(self):
+        """
+        This method is used to convert a cache entry into a fulfillment order of the REST API.
+        """
+        return {"id": int(self.fulfillment_order_id),
+                "order_id": int(self.shopify_order_id),
+                "status": self.status,
+                "assigned_location_id": int(self.assigned_location_id) if self.assigned_location_id else False,
+                "delivery_method": {"method_type": self.delivery_method_type},
+                "line_items": json.loads(self.line_items or "[]")}
+
+    @api.model
+    def set_fulfillment_orders_ept(self, instance, shopify_order_id, fulfillment_orders):
+        """
+        This method is used to replace the cached fulfillment orders of an order.
+        :param instance: Record of the Shopify instance.
+        :param shopify_order_id: Shopify id of the order.
+        :param fulfillment_orders: Fulfillment orders of the REST API, as dictionaries or resources.
+        """
+        self.invalidate_fulfillment_orders_ept(instance, shopify_order_ids=[shopify_order_id])
+        vals_list = []
+        for fulfillment_order in fulfillment_orders or []:
+            if not isinstance(fulfillment_order, dict):
+                fulfillment_order = fulfillment_order.to_dict()
+            delivery_method = fulfillment_order.get("delivery_method")
+            vals_list.append({
+                "shopify_instance_id": instance.id,
+                "shopify_order_id": str(shopify_order_id),
+                "fulfillment_order_id": str(fulfillment_order.get("id")),
+                "status": fulfillment_order.get("status"),
+                "assigned_location_id": fulfillment_order.get("assigned_location_id") and str(
+                    fulfillment_order.get("assigned_location_id")),
+                "delivery_method_type": delivery_method.get("method_type") if isinstance(delivery_method,
+                                                                                         dict) else False,
+                "line_items": json.dumps([{"id": line.get("id"),
+                                           "fulfillment_order_id": line.get("fulfillment_order_id"),
+                                           "line_item_id": line.get("line_item_id"),
+                                           "quantity": line.get("quantity")}
+                                          for line in fulfillment_order.get("line_items") or []]),
+                "fetched_at": datetime.now()})
+        return self.create(vals_list)
+
+    @api.model
+    def fetch_fulfillment_orders_ept(self, instance, shopify_order_id):
+        """
+        This method is used to get the fulfillment orders of an order from the cache, they are requested from
+        Shopify and cached on a miss. The instance must be connected already, the errors of the request are raised
+        to the caller.
+        @return: List of the fulfillment orders, in the format of the REST API.
+        """
+        cached = self.get_cached_fulfillment_orders_ept(instance, [shopify_order_id])
+        if cached:
+            return cached[str(shopify_order_id)]
+        fulfillment_orders = shopify.Order({"id": int(shopify_order_id)}).get("fulfillment_orders")
+        self.set_fulfillment_orders_ept(instance, shopify_order_id, fulfillment_orders)
+        _logger.info("Cached %s fulfillment orders of the Shopify order %s.", len(fulfillment_orders or []),
+                     shopify_order_id)
+        return [fulfillment_order if isinstance(fulfillment_order, dict) else fulfillment_order.to_dict()
+                for fulfillment_order in fulfillment_orders or []]
+
+    @api.model
+    def invalidate_fulfillment_orders_ept(self, instance, shopify_order_ids=None, fulfillment_order_ids=None):
+        """
+        This method is used to remove the cached fulfillment orders of the orders, or of the orders having one of
+        the fulfillment orders.
+        """
+        shopify_order_ids = {str(order_id) for order_id in shopify_order_ids or [] if order_id}
+        fulfillment_order_ids = [str(fulfillment_order_id) for fulfillment_order_id in fulfillment_order_ids or []
+                                 if fulfillment_order_id]
+        if fulfillment_order_ids:
+            shopify_order_ids.update(self.search([("shopify_instance_id", "=", instance.id),
+                                                  ("fulfillment_order_id", "in", fulfillment_order_ids)]).mapped(
+                "shopify_order_id"))
+        if not shopify_order_ids:
+            return False
+        self._cr.execute("""
+            DELETE FROM shopify_fulfillment_order_cache
+            WHERE shopify_instance_id = %s AND shopify_order_id = ANY(%s)
+        """, (instance.id, list(shopify_order_ids)))
+        self.invalidate_model()
+        return True
+
+    @api.model
+    def process_fulfillment_order_webhook_ept(self, webhook_data, instance):
+        """
+        This method is used to invalidate the orders of the fulfillment orders received with a fulfillment_orders/*
+        webhook. The payloads of the topics differ, so every fulfillment order of the payload is taken.
+        """
+        fulfillment_order_ids, shopify_order_ids = [], []
+
+        def _collect(data, key=""):
+            if isinstance(data, dict):
+                if key.endswith("fulfillment_order") and data.get("id"):
+                    fulfillment_order_ids.append(str(data["id"]).rsplit("/", 1)[-1])
+                if data.get("order_id"):
+                    shopify_order_ids.append(str(data["order_id"]).rsplit("/", 1)[-1])
+                for child_key, value in data.items():
+                    _collect(value, child_key)
+            elif isinstance(data, list):
+                for value in data:
+                    _collect(value, key)
+
+        _collect(webhook_data)
+        return self.invalidate_fulfillment_orders_ept(instance, shopify_order_ids, fulfillment_order_ids)
+
+    @api.autovacuum
+    def _gc_expired_fulfillment_orders(self):
+        """
+        Deletes the cache entries which are older than their time to live.
+        """
+        ttl = int(self.env["ir.config_parameter"].sudo().get_param("shopify_ept.fulfillment_order_cache_ttl", 24)
+                  or 24)
+        self._cr.execute("DELETE FROM shopify_fulfillment_order_cache WHERE fetched_at < %s",
+                         (datetime.now() - timedelta(hours=ttl),))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import time
+from contextlib import contextmanager
+
+from ..shopify.transport import metrics
+
+UNSTAGED = "other"
+
+
+class ShopifyImportProfiler(object):
+    """
+    Records the wall time, SQL statements and Shopify API calls of the named stages of every imported order. The
+    stages can be nested, a stage is charged with its own cost only and the cost of an order which is in none of
+    its stages is charged to the "other" stage. Stages entered outside of an order are only part of the summary.
+    """
+
+    def __init__(self, cr):
+        self._cr = cr
+        self._stack = []
+        self._order_key = None
+        self._order_start = None
+        self.orders = {}
+        self.queue_stages = {}
+
+    def _counters(self):
+        return time.time(), self._cr.sql_log_count, metrics.thread_requests()
+
+    @staticmethod
+    def _add(stages, name, cost):
+        totals = stages.setdefault(name, {"count": 0, "seconds": 0.0, "sql": 0, "api": 0})
+        totals["count"] += 1
+        totals["seconds"] += cost[0]
+        totals["sql"] += cost[1]
+        totals["api"] += cost[2]
+
+    def start_order(self, key):
+        """
+        Closes the order in progress and starts to charge the stages to the order of the key.
+        """
+        self.finish_order()
+        self._order_key = key
+        self._order_start = self._counters()
+        self.orders[key] = {}
+
+    def finish_order(self):
+        """
+        Closes the order in progress and charges its cost outside of the stages to the "other" stage.
+        """
+        if self._order_key is None:
+            return
+        stages = self.orders[self._order_key]
+        total = [end - start for start, end in zip(self._order_start, self._counters())]
+        staged = [sum(values[field] for values in stages.values()) for field in ("seconds", "sql", "api")]
+        self._add(stages, UNSTAGED, [max(value - used, 0) for value, used in zip(total, staged)])
+        self._order_key = None
+        self._order_start = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Charges the cost of the block, without its nested stages, to the stage of the current order.
+        """
+        frame = [self._counters(), [0.0, 0, 0]]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            cost = [end - start for start, end in zip(frame[0], self._counters())]
+            if self._stack:
+                parent_children = self._stack[-1][1]
+                for index, value in enumerate(cost):
+                    parent_children[index] += value
+            own_cost = [value - nested for value, nested in zip(cost, frame[1])]
+            self._add(self.orders[self._order_key] if self._order_key is not None else self.queue_stages, name,
+                      own_cost)
+
+    def summary(self):
+        """
+        Returns the totals of every stage over all the orders and the stages entered outside of an order:
+        {"orders": count, "stages": {stage: {"count", "seconds", "sql", "api"}}}.
+        """
+        self.finish_order()
+        stages = {}
+        for order_stages in list(self.orders.values()) + [self.queue_stages]:
+            for name, values in order_stages.items():
+                totals = stages.setdefault(name, {"count": 0, "seconds": 0.0, "sql": 0, "api": 0})
+                for field in totals:
+                    totals[field] += values[field]
+        return {"orders": len(self.orders), "stages": stages}
+
+    def order_breakdown(self, key):
+        """
+        Returns the totals and the stages of an order: (seconds, sql, api, {stage: [seconds, sql, api]}).
+        """
+        stages = self.orders.get(key, {})
+        breakdown = {name: [round(values["seconds"], 4), values["sql"], values["api"]]
+                     for name, values in stages.items()}
+        return (round(sum(values["seconds"] for values in stages.values()), 4),
+                sum(values["sql"] for values in stages.values()),
+                sum(values["api"] for values in stages.values()), breakdown)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import logging
+from datetime import timedelta
+
+import pytz
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger("Shopify Order KPI")
+
+# Day of an order in the time zone of its store, the dates of the orders are stored in UTC.
+ORDER_DAY = "date(so.date_order AT TIME ZONE 'UTC' AT TIME ZONE COALESCE(si.shopify_store_time_zone, 'UTC'))"
+
+# Orders, shipped orders and refunds of the instances and days to refresh, in one row per order or refund. The days
+# are filtered with a range on the columns first, so their indexes can be used, the range of the orders is one day
+# wider on both sides for the time zone of the store.
+KPI_SOURCE_QUERY = """
+    SELECT so.shopify_instance_id AS instance_id, {order_day} AS kpi_date,
+           so.amount_untaxed AS amount_untaxed, 1 AS order_count, 0 AS shipped_order_count, 0 AS refund_count
+    FROM sale_order so
+    INNER JOIN shopify_instance_ept si ON si.id = so.shopify_instance_id
+    WHERE so.state IN ('sale', 'done') AND so.shopify_instance_id = ANY(%(instance_ids)s::int[])
+    AND (%(all_dates)s OR (so.date_order >= %(order_date_from)s AND so.date_order < %(order_date_to)s
+                           AND {order_day} = ANY(%(dates)s::date[])))
+    UNION ALL
+    SELECT so.shopify_instance_id, {order_day}, 0, 0, 1, 0
+    FROM sale_order so
+    INNER JOIN shopify_instance_ept si ON si.id = so.shopify_instance_id
+    WHERE so.shopify_instance_id = ANY(%(instance_ids)s::int[])
+    AND (%(all_dates)s OR (so.date_order >= %(order_date_from)s AND so.date_order < %(order_date_to)s
+                           AND {order_day} = ANY(%(dates)s::date[])))
+    AND EXISTS (SELECT 1 FROM stock_picking sp
+                INNER JOIN stock_location sl ON sl.id = sp.location_dest_id AND sl.usage = 'customer'
+                WHERE sp.group_id = so.procurement_group_id AND sp.updated_in_shopify = True
+                AND sp.state != 'cancel')
+    UNION ALL
+    SELECT am.shopify_instance_id, am.invoice_date, 0, 0, 0, 1
+    FROM account_move am
+    WHERE am.move_type = 'out_refund' AND am.invoice_date IS NOT NULL
+    AND am.shopify_instance_id = ANY(%(instance_ids)s::int[])
+    AND (%(all_dates)s OR (am.invoice_date >= %(date_from)s AND am.invoice_date < %(date_to)s
+                           AND am.invoice_date = ANY(%(dates)s::date[])))
+""".format(order_day=ORDER_DAY)
+
+
+class ShopifyOrderKpiEpt(models.Model):
+    _name = "shopify.order.kpi.ept"
+    _description = "Shopify Daily Order KPI"
+    _log_access = False
+
+    shopify_instance_id = fields.Many2one("shopify.instance.ept", string="Instance", required=True,
+                                          ondelete="cascade", readonly=True)
+    kpi_date = fields.Date(required=True, readonly=True)
+    amount_untaxed = fields.Float(readonly=True, help="Untaxed amount of the confirmed orders of the day.")
+    order_count = fields.Integer(readonly=True, help="Number of confirmed orders of the day.")
+    shipped_order_count = fields.Integer(readonly=True, help="Number of orders of the day shipped in Shopify.")
+    refund_count = fields.Integer(readonly=True, help="Number of refunds invoiced on the day, draft ones included.")
+
+    _sql_constraints = [("unique_instance_date", "unique(shopify_instance_id, kpi_date)",
+                         "Only one KPI rollup is allowed per instance and day.")]
+
+    @api.model
+    def refresh_order_kpi_ept(self, instances, dates=None):
+        """
+        This method is used to recompute the rollup rows of the instances, for the given days or for all of them,
+        with one grouped query.
+        :param instances: Records of the Shopify instances.
+        :param dates: Days to recompute, None to rebuild all the rows of the instances.
+        """
+        if not instances or dates is not None and not dates:
+            return True
+        self.env.flush_all()
+        dates = sorted(dates) if dates is not None else []
+        params = {"instance_ids": instances.ids, "all_dates": not dates, "dates": dates,
+                  "date_from": dates[0] if dates else None,
+                  "date_to": dates[-1] + timedelta(days=1) if dates else None,
+                  "order_date_from": dates[0] - timedelta(days=1) if dates else None,
+                  "order_date_to": dates[-1] + timedelta(days=2) if dates else None}
+        self._cr.execute("""
+            DELETE FROM shopify_order_kpi_ept
+            WHERE shopify_instance_id = ANY(%(instance_ids)s::int[])
+            AND (%(all_dates)s OR kpi_date = ANY(%(dates)s::date[]))
+        """, params)
+        self._cr.execute("""
+            INSERT INTO shopify_order_kpi_ept (shopify_instance_id, kpi_date, amount_untaxed, order_count,
+                                               shipped_order_count, refund_count)
+            SELECT instance_id, kpi_date, SUM(amount_untaxed), SUM(order_count), SUM(shipped_order_count),
+                   SUM(refund_count)
+            FROM (%s) kpi_source
+            GROUP BY instance_id, kpi_date
+            ON CONFLICT (shopify_instance_id, kpi_date) DO UPDATE
+            SET amount_untaxed = EXCLUDED.amount_untaxed, order_count = EXCLUDED.order_count,
+                shipped_order_count = EXCLUDED.shipped_order_count, refund_count = EXCLUDED.refund_count
+        """ % KPI_SOURCE_QUERY, params)
+        self.invalidate_model()
+        return True
+
+    @api.model
+    def get_order_kpi_date_ept(self, instance, date_order):
+        """
+        This method is used to get the day of an order in the time zone of its store, as the rollup counts it.
+        :param instance: Record of the Shopify instance.
+        :param date_order: Datetime of the order, in UTC.
+        """
+        return pytz.utc.localize(date_order).astimezone(instance.get_kpi_time_zone()).date()
+
+    @api.model
+    def mark_orders_kpi_dirty_ept(self, orders):
+        """
+        This method is used to mark the days of the Shopify orders to refresh.
+        :param orders: Records of the sale orders.
+        """
+        return self.mark_order_kpi_dirty_ept(
+            (order.shopify_instance_id.id, self.get_order_kpi_date_ept(order.shopify_instance_id, order.date_order))
+            for order in orders.sudo() if order.shopify_instance_id and order.date_order)
+
+    @api.model
+    def mark_refunds_kpi_dirty_ept(self, moves):
+        """
+        This method is used to mark the days of the Shopify refunds to refresh.
+        :param moves: Records of the account moves, the other types than refunds are ignored.
+        """
+        return self.mark_order_kpi_dirty_ept((move.shopify_instance_id.id, move.invoice_date) for move in moves.sudo()
+                                             if move.move_type == "out_refund" and move.shopify_instance_id)
+
+    @api.model
+    def mark_order_kpi_dirty_ept(self, changes):
+        """
+        This method is used to mark days of the instances to refresh. It is called by the write paths of the orders,
+        pickings and refunds, the days are inserted once per transaction, when it commits, and the scheduled action
+        is triggered to rebuild them. The days are read by the scheduled action once committed only, so no change
+        is missed, whatever the length of the transaction.
+        :param changes: iterable of tuple (instance id, date)
+        """
+        changes = {change for change in changes if change[0] and change[1]}
+        if not changes:
+            return True
+        dirty = self._cr.precommit.data.setdefault("shopify_order_kpi_dirty", set())
+        if not dirty:
+            self._cr.precommit.add(self._insert_order_kpi_dirty_ept)
+        dirty.update(changes)
+        return True
+
+    def _insert_order_kpi_dirty_ept(self):
+        dirty = self._cr.precommit.data.pop("shopify_order_kpi_dirty", set())
+        if not dirty:
+            return
+        instance_ids, dates = zip(*dirty)
+        # A plain insert, without any unique key, so the parallel import workers never conflict on it.
+        self._cr.execute("""
+            INSERT INTO shopify_order_kpi_dirty_ept (shopify_instance_id, kpi_date)
+            SELECT instance_id, kpi_date FROM unnest(%s::int[], %s::date[]) AS dirty(instance_id, kpi_date)
+        """, (list(instance_ids), list(dates)))
+        self.env.ref("shopify_ept.refresh_shopify_order_kpi").sudo()._trigger()
+
+    @api.model
+    def trigger_order_kpi_build_ept(self):
+        """
+        This method is used to run the scheduled action as soon as possible, to build the rollups of the instances
+        which are not built yet. It is called on the install of the module.
+        """
+        self.env.ref("shopify_ept.refresh_shopify_order_kpi").sudo()._trigger()
+        return True
+
+    def auto_refresh_shopify_order_kpi(self):
+        """
+        This method is used to refresh the days marked by the write paths of the orders, pickings and refunds. The
+        rows of an instance which is not built yet, e.g. a new instance or an instance whose store time zone
+        changed, are rebuilt completely once. It will be called from the scheduled action.
+        """
+        instance_obj = self.env["shopify.instance.ept"]
+        new_instances = instance_obj.search([("shopify_order_kpi_built", "=", False)])
+        for instance in new_instances:
+            self.refresh_order_kpi_ept(instance)
+            instance.shopify_order_kpi_built = True
+            self._cr.commit()
+
+        # The marked days are consumed with the rows visible now, the rows of running transactions are read next
+        # time.
+        self._cr.execute("DELETE FROM shopify_order_kpi_dirty_ept RETURNING shopify_instance_id, kpi_date")
+        dirty_dates = {}
+        for instance_id, kpi_date in self._cr.fetchall():
+            dirty_dates.setdefault(instance_id, set()).add(kpi_date)
+        for instance in instance_obj.browse(list(dirty_dates)).exists():
+            self.refresh_order_kpi_ept(instance, dirty_dates[instance.id])
+        self._cr.commit()
+        _logger.info("Refreshed the order KPI rollups of %s instances.", len(set(new_instances.ids) | set(dirty_dates)))
+        return True
+
+
+class ShopifyOrderKpiDirtyEpt(models.Model):
+    _name = "shopify.order.kpi.dirty.ept"
+    _description = "Shopify Order KPI Day to Refresh"
+    _log_access = False
+
+    shopify_instance_id = fields.Many2one("shopify.instance.ept", string="Instance", required=True,
+                                          ondelete="cascade", readonly=True)
+    kpi_date = fields.Date(required=True, readonly=True)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import logging
+import time
+from contextlib import contextmanager
+
+from odoo import models, api
+
+_logger = logging.getLogger("Shopify Payout")
+
+ORDER_TRANSACTION_TYPES = ["charge", "refund", "payment_refund"]
+
+
+@contextmanager
+def stage_timer(timings, stage):
+    """
+    Adds the wall time spent in the block to timings[stage], in seconds.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.time() - start
+
+
+class ShopifyPayoutReconcileEngineEpt(models.AbstractModel):
+    _name = "shopify.payout.reconcile.engine.ept"
+    _description = "Shopify Payout Reconciliation Engine"
+
+    @api.model
+    def create_payout_statement_lines(self, payout):
+        """
+        This method is used to create the bank statement lines of all the remaining transactions of a payout. The
+        orders, invoices and payments of the transactions are read with a few queries for the whole payout and the
+        statement lines are created at once.
+        :param payout: Record of the payout report.
+        @return: Log lines of the transactions which will not reconcile automatically.
+        """
+        partner_obj = self.env["res.partner"]
+        log_lines = []
+        timings = {}
+        journal = payout.instance_id.shopify_settlement_report_journal_id
+
+        with stage_timer(timings, "resolve_orders"):
+            transactions = payout.payout_transaction_ids.filtered(lambda line: line.is_remaining_statement)
+            self.resolve_transaction_orders(payout, transactions)
+
+        with stage_timer(timings, "resolve_invoices"):
+            # Reads the invoices of all the orders at once, the matching below is done in memory.
+            transactions.order_id.invoice_ids.mapped("amount_total")
+            invoice_data = {}
+            for transaction in transactions.filtered("order_id"):
+                invoice_data[transaction.id] = payout.check_for_invoice_refund(transaction, log_lines)[:2]
+
+        with stage_timer(timings, "resolve_payments"):
+            payments = self.get_transaction_payments(invoice_data)
+
+        with stage_timer(timings, "prepare_statement_lines"):
+            counterpart_accounts = {}
+            for transaction_line in payout.instance_id.transaction_line_ids:
+                counterpart_accounts.setdefault(transaction_line.transaction_type, transaction_line.account_id)
+            vals_list = []
+            processed_transactions = transactions.browse()
+            for transaction in transactions:
+                order = transaction.order_id
+                if transaction.transaction_type in ORDER_TRANSACTION_TYPES and not order:
+                    message = "Transaction line {0} will not automatically reconcile due to " \
+                              "order {1} is not found in odoo.".format(transaction.transaction_id,
+                                                                       transaction.source_order_id)
+                    log_lines.append({"message": message, "shopify_payout_report_line_id": transaction.id})
+                    # The transaction id is used as reference, as the name of a journal entry must be unique.
+                    vals_list.append({"payment_ref": transaction.transaction_id,
+                                      "date": payout.payout_date,
+                                      "amount": transaction.amount,
+                                      "shopify_transaction_id": transaction.transaction_id,
+                                      "shopify_transaction_type": transaction.transaction_type,
+                                      "sequence": 1000,
+                                      "journal_id": journal.id,
+                                      "payout_id": payout.id,
+                                      "payout_line_id": transaction.id})
+                    processed_transactions |= transaction
+                    continue
+                if not transaction.amount:
+                    continue
+
+                invoice = invoice_data.get(transaction.id, (False, self.env["account.move"]))[1]
+                if transaction.transaction_type not in ORDER_TRANSACTION_TYPES:
+                    reference = transaction.transaction_type + "/" + (transaction.transaction_id or
+                                                                      payout.payout_reference_id)
+                elif order.name:
+                    reference = transaction.transaction_type + "_" + order.name + "/" + transaction.transaction_id
+                elif transaction.id in payments:
+                    reference = payments[transaction.id].name
+                elif invoice_data.get(transaction.id, [False])[0]:
+                    reference = invoice.name or ""
+                else:
+                    reference = order.name
+                partner = partner_obj._find_accounting_partner(order.partner_id)
+                vals = {"payment_ref": reference,
+                        "date": payout.payout_date,
+                        "partner_id": partner and partner.id,
+                        "amount": transaction.amount,
+                        "sale_order_id": order.id,
+                        "shopify_transaction_id": transaction.transaction_id,
+                        "shopify_transaction_type": transaction.transaction_type,
+                        "sequence": 1000,
+                        "journal_id": journal.id,
+                        "counterpart_account_id": counterpart_accounts.get(transaction.transaction_type,
+                                                                           self.env["account.account"]).id,
+                        "payout_id": payout.id,
+                        "payout_line_id": transaction.id}
+                if invoice and invoice.move_type == "out_refund":
+                    vals.update({"refund_invoice_id": invoice.id})
+                vals_list.append(vals)
+                processed_transactions |= transaction
+
+        with stage_timer(timings, "create_statement_lines"):
+            self.env["account.bank.statement.line"].create(vals_list)
+            processed_transactions.write({"is_remaining_statement": False})
+
+        self.log_stage_timings(payout, "Bank statement lines", timings, len(vals_list))
+        return log_lines
+
+    def resolve_transaction_orders(self, payout, transactions):
+        """
+        This method is used to set the order of the transactions of orders which have no order yet, with one search
+        for all of them. The first order of the search is taken, as a search with limit 1 would give it.
+        """
+        pending_transactions = transactions.filtered(
+            lambda transaction: transaction.transaction_type in ORDER_TRANSACTION_TYPES and not transaction.order_id
+            and transaction.source_order_id)
+        if not pending_transactions:
+            return True
+        orders = self.env["sale.order"].search([("shopify_order_id", "in",
+                                                 list(set(pending_transactions.mapped("source_order_id")))),
+                                                ("shopify_instance_id", "=", payout.instance_id.id)])
+        orders_by_shopify_id = {}
+        for order in orders:
+            orders_by_shopify_id.setdefault(order.shopify_order_id, order)
+        transactions_by_order = {}
+        for transaction in pending_transactions:
+            order = orders_by_shopify_id.get(transaction.source_order_id)
+            if order:
+                transactions_by_order[order] = transactions_by_order.get(order, transactions.browse()) | transaction
+        for order, order_transactions in transactions_by_order.items():
+            order_transactions.write({"order_id": order.id})
+        return True
+
+    def get_transaction_payments(self, invoice_data):
+        """
+        This method is used to find the payment of the invoices of every transaction with one search. A payment
+        matches when its memo is the payment reference of one of the invoices and it has the amount and type of the
+        domain prepared by check_for_invoice_refund.
+        :param invoice_data: dict {transaction_id: (domain, invoices)}
+        @return: dict {transaction_id: payment}
+        """
+        references = set()
+        for domain, invoices in invoice_data.values():
+            if domain and len(domain) > 1:
+                references.update(reference for reference in invoices.mapped("payment_reference") if reference)
+        if not references:
+            return {}
+        payments_by_memo = {}
+        for sequence, payment in enumerate(self.env["account.payment"].search([("memo", "in", list(references))])):
+            payments_by_memo.setdefault(payment.memo, []).append((sequence, payment))
+
+        transaction_payments = {}
+        for transaction_id, (domain, invoices) in invoice_data.items():
+            if not domain or len(domain) < 2:
+                continue
+            amount = domain[0][2]
+            payment_type = domain[1][2]
+            candidates = [candidate for reference in set(invoices.mapped("payment_reference")) if reference
+                          for candidate in payments_by_memo.get(reference, [])
+                          if candidate[1].amount == amount and candidate[1].payment_type == payment_type]
+            if candidates:
+                transaction_payments[transaction_id] = min(candidates, key=lambda candidate: candidate[0])[1]
+        return transaction_payments
+
+    @api.model
+    def prepare_reconcile_data(self, payout, statement_lines):
+        """
+        This method is used to read at once the data which get_invoices_for_reconcile needs for the statement lines
+        of a payout: the transaction lines, the orders of the transactions without order, the refunds of the orders
+        and the journal items of their invoices.
+        @return: dict used by get_invoices_for_reconcile.
+        """
+        payout_line_obj = self.env["shopify.payout.report.line.ept"]
+        transaction_ids = list(set(statement_lines.mapped("shopify_transaction_id")) - {False})
+        payout_lines = {}
+        for payout_line in payout_line_obj.search([("transaction_id", "in", transaction_ids)]):
+            payout_lines[payout_line.transaction_id] = payout_lines.get(payout_line.transaction_id,
+                                                                        payout_line_obj) | payout_line
+
+        missing_order_lines = statement_lines.filtered(
+            lambda line: not payout_lines.get(line.shopify_transaction_id, payout_line_obj).order_id)
+        orders = self.env["sale.order"]
+        if missing_order_lines:
+            source_order_ids = [source_order_id for line in missing_order_lines for source_order_id in
+                                payout_lines.get(line.shopify_transaction_id, payout_line_obj).mapped(
+                                    "source_order_id") if source_order_id]
+            orders = orders.search(["|", ("shopify_order_id", "in", source_order_ids),
+                                    ("name", "in", missing_order_lines.mapped("payment_ref")),
+                                    ("shopify_instance_id", "=", payout.instance_id.id)])
+
+        order_names = (statement_lines.sale_order_id | orders).mapped("name")
+        refunds = self.env["account.move"].search([("shopify_instance_id", "=", payout.instance_id.id),
+                                                   ("invoice_origin", "in", order_names),
+                                                   ("move_type", "=", "out_refund")]) if order_names else \
+            self.env["account.move"]
+
+        invoices = (statement_lines.sale_order_id | orders).invoice_ids | statement_lines.refund_invoice_id | refunds
+        invoices.line_ids.mapped("account_id")
+        invoices.line_ids.matched_debit_ids.debit_move_id.payment_id.invoice_ids.line_ids.mapped("debit")
+        invoices.line_ids.matched_credit_ids.credit_move_id.payment_id.invoice_ids.line_ids.mapped("credit")
+        return {"payout_lines": payout_lines, "orders": orders, "refunds": refunds}
+
+    @api.model
+    def find_reconcile_order(self, reconcile_data, source_order_ids, payment_ref):
+        """
+        Returns the first order of the prefetched orders having one of the Shopify ids or the name.
+        """
+        return next((order for order in reconcile_data["orders"] if order.shopify_order_id in source_order_ids or
+                     order.name == payment_ref), self.env["sale.order"])
+
+    @api.model
+    def log_stage_timings(self, payout, process, timings, count):
+        """
+        This method is used to log the time spent in every stage of a payout process.
+        """
+        _logger.info("%s of payout %s: %s records in %.2fs (%s).", process, payout.name, count,
+                     sum(timings.values()), ", ".join("%s %.2fs" % (stage, seconds) for stage, seconds in
+                                                      timings.items()))
+        return True
@@ -1,13 +1,12 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 import logging
-import time
 
 from datetime import datetime, timedelta
 from odoo import models, fields,api, _
 from odoo.exceptions import UserError
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
+from .shopify_payout_reconcile_engine_ept import stage_timer
 import ast
 
 _logger = logging.getLogger('Shopify Payout')
@@ -160,11 +159,6 @@ class ShopifyPaymentReportEpt(models.Model):
                     page_info = page_link.split(";")[0].strip("<>").split("page_info=")[1]
                     try:
                         result = shopify.Transactions().find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                                result = shopify.Transactions().find(page_info=page_info, limit=250)
                     except Exception as error:
                         raise UserError(error)
             if catch == page_info:
@@ -291,96 +285,10 @@ class ShopifyPaymentReportEpt(models.Model):
     def create_bank_statement_lines_for_payout_report(self):
         """
         This method creates bank statement lines from the transaction lines of Payout report.
+        All the remaining transactions are processed at once by the payout reconcile engine.
         @author: Maulik Barad on Date 02-Dec-2020.
         """
-        partner_obj = self.env['res.partner']
-        bank_statement_line_obj = self.env['account.bank.statement.line']
-        log_lines = []
-        account_payment_obj = self.env['account.payment']
-        sale_order_obj = self.env["sale.order"]
-
-        transaction_ids = self.payout_transaction_ids.filtered(lambda line: line.is_remaining_statement)
-        for transaction in transaction_ids:
-            order_id = transaction.order_id
-            if transaction.transaction_type in ['charge', 'refund', 'payment_refund'] and not order_id:
-                source_order_id = transaction.source_order_id
-                order_id = sale_order_obj.search([('shopify_order_id', '=', source_order_id),
-                                                  ('shopify_instance_id', '=', self.instance_id.id)],
-                                                 limit=1)
-                if order_id:
-                    transaction.order_id = order_id
-                else:
-                    message = "Transaction line {0} will not automatically reconcile due to " \
-                              "order {1} is not found in odoo.".format(
-                        transaction.transaction_id, transaction.source_order_id)
-                    log_lines.append({'message': message,
-                                      'shopify_payout_report_line_id': transaction.id})
-                    # We can not use shopify order reference here because it may create duplicate name,
-                    # and name of journal entry should be unique per company. So here I have used transaction Id
-                    bank_line_vals = {
-                        # 'name': transaction.transaction_id,
-                        'payment_ref': transaction.transaction_id,
-                        'date': self.payout_date,
-                        'amount': transaction.amount,
-                        # 'statement_id': bank_statement_id.id,
-                        'shopify_transaction_id': transaction.transaction_id,
-                        "shopify_transaction_type": transaction.transaction_type,
-                        'sequence': 1000,
-                        'journal_id': self.instance_id.shopify_settlement_report_journal_id.id,
-                        'payout_id': self.id,
-                        'payout_line_id': transaction.id
-                    }
-                    bank_statement_line_obj.create(bank_line_vals)
-                    transaction.is_remaining_statement = False
-                    continue
-
-            partner = partner_obj._find_accounting_partner(order_id.partner_id)
-            domain, invoice, log_line = self.check_for_invoice_refund(transaction, log_lines)
-
-            if domain:
-                payment_reference = account_payment_obj.search(domain, limit=1)
-
-                if payment_reference:
-                    reference = payment_reference.name
-                else:
-                    reference = invoice.name or ''
-            else:
-                reference = transaction.order_id.name
-
-            if transaction.amount:
-                name = False
-                if transaction.transaction_type not in ['charge', 'refund', 'payment_refund']:
-                    reference = transaction.transaction_type + "/"
-                    if transaction.transaction_id:
-                        reference += transaction.transaction_id
-                    else:
-                        reference += self.payout_reference_id
-                else:
-                    if order_id.name:
-                        name = transaction.transaction_type + "_" + order_id.name + "/" + transaction.transaction_id
-                counter_part_account_id = self.instance_id.transaction_line_ids.filtered(lambda l: l.transaction_type
-                                                                                                   ==
-                                                                                                   transaction.transaction_type).account_id
-                bank_line_vals = {
-                    # 'name': name or reference,
-                    'payment_ref': name or reference,
-                    'date': self.payout_date,
-                    'partner_id': partner and partner.id,
-                    'amount': transaction.amount,
-                    # 'statement_id': bank_statement_id.id,
-                    'sale_order_id': order_id.id,
-                    'shopify_transaction_id': transaction.transaction_id,
-                    "shopify_transaction_type": transaction.transaction_type,
-                    'sequence': 1000,
-                    'journal_id': self.instance_id.shopify_settlement_report_journal_id.id,
-                    'counterpart_account_id': counter_part_account_id.id,
-                    'payout_id': self.id,
-                    'payout_line_id': transaction.id
-                }
-                if invoice and invoice.move_type == "out_refund":
-                    bank_line_vals.update({"refund_invoice_id": invoice.id})
-                bank_statement_line_obj.create(bank_line_vals)
-                transaction.is_remaining_statement = False
+        log_lines = self.env["shopify.payout.reconcile.engine.ept"].create_payout_statement_lines(self)
 
         if log_lines:
             self.set_payout_log_line(log_lines)
@@ -502,21 +410,32 @@ class ShopifyPaymentReportEpt(models.Model):
         currency = moveline.currency_id.id
         return currency, amount_currency
 
-    def get_invoices_for_reconcile(self, statement_line):
+    def get_invoices_for_reconcile(self, statement_line, reconcile_data=None):
         """
         This method gets invoices for reconciling the bank statement.
         @param statement_line: Record of bank statement line.
+        @param reconcile_data: Data of the payout read at once by prepare_reconcile_data of the reconcile engine.
         @author: Maulik Barad on Date 07-Dec-2020.
         """
         log_line = []
         shopify_payout_report_line_obj = self.env['shopify.payout.report.line.ept']
         sale_order_obj = self.env['sale.order']
-        shopify_payout_report_line_id = shopify_payout_report_line_obj.search(
-            [('transaction_id', '=', statement_line.shopify_transaction_id)])
+        if reconcile_data is not None:
+            shopify_payout_report_line_id = reconcile_data["payout_lines"].get(statement_line.shopify_transaction_id,
+                                                                               shopify_payout_report_line_obj)
+        else:
+            shopify_payout_report_line_id = shopify_payout_report_line_obj.search(
+                [('transaction_id', '=', statement_line.shopify_transaction_id)])
         if not shopify_payout_report_line_id.order_id:
-            sale_order_id = sale_order_obj.search(
-                ['|', ('shopify_order_id', '=', shopify_payout_report_line_id.source_order_id),
-                 ('name', '=', statement_line.payment_ref), ('shopify_instance_id', '=', self.instance_id.id)], limit=1)
+            if reconcile_data is not None:
+                sale_order_id = self.env["shopify.payout.reconcile.engine.ept"].find_reconcile_order(
+                    reconcile_data, shopify_payout_report_line_id.mapped("source_order_id"),
+                    statement_line.payment_ref)
+            else:
+                sale_order_id = sale_order_obj.search(
+                    ['|', ('shopify_order_id', '=', shopify_payout_report_line_id.source_order_id),
+                     ('name', '=', statement_line.payment_ref), ('shopify_instance_id', '=', self.instance_id.id)],
+                    limit=1)
             shopify_payout_report_line_id.write({'order_id': sale_order_id.id})
             statement_line.write({'sale_order_id': sale_order_id.id})
         sale_order_id = shopify_payout_report_line_id.order_id
@@ -530,6 +449,9 @@ class ShopifyPaymentReportEpt(models.Model):
                 [('transaction_id', '=', statement_line.shopify_transaction_id)])
         if shopify_payout_report_line_id and shopify_payout_report_line_id.transaction_type == 'refund' \
                 and not statement_line.refund_invoice_id:
+            if reconcile_data is not None:
+                return reconcile_data["refunds"].filtered(
+                    lambda x: x.invoice_origin == order.name and x.amount_total == abs(statement_line.amount))
             invoices = self.env['account.move'].search(
                 [('shopify_instance_id', '=', self.instance_id.id), ('invoice_origin', '=', order.name),
                  ('move_type', '=', 'out_refund'), ('amount_total', '=', abs(statement_line.amount))])
@@ -691,11 +613,16 @@ class ShopifyPaymentReportEpt(models.Model):
         @author: Maulik Barad on Date 07-Dec-2020.
         """
         statement_line_obj = self.env['account.bank.statement.line']
+        reconcile_engine_obj = self.env["shopify.payout.reconcile.engine.ept"]
         log_lines = []
         commit_count = 0
+        timings = {}
         _logger.info("Processing Bank Statement line of payout : %s.", self.name)
         statement_lines = statement_line_obj.search([('payout_id', '=', self.id)])
-        for statement_line in statement_lines.filtered(lambda x: not x.is_reconciled):
+        unreconciled_lines = statement_lines.filtered(lambda x: not x.is_reconciled)
+        with stage_timer(timings, "prefetch"):
+            reconcile_data = reconcile_engine_obj.prepare_reconcile_data(self, unreconciled_lines)
+        for statement_line in unreconciled_lines:
             commit_count += 1
             move_line_data = []
             move_line_total_amount = 0.0
@@ -703,7 +630,8 @@ class ShopifyPaymentReportEpt(models.Model):
             paid_move_lines = []
             try:
                 if statement_line.shopify_transaction_type in ["charge", "refund", "payment_refund"]:
-                    invoices = self.get_invoices_for_reconcile(statement_line)
+                    with stage_timer(timings, "match_invoices"):
+                        invoices = self.get_invoices_for_reconcile(statement_line, reconcile_data)
                     if not invoices:
                         continue
 
@@ -718,10 +646,13 @@ class ShopifyPaymentReportEpt(models.Model):
                         move_line_total_amount, currency_ids, move_line_data = self.get_unpaid_move_line_data(
                             statement_line, unpaid_invoices)
 
-                    log_line = self.reconcile_invoice_refund(statement_line, move_line_total_amount, currency_ids,
-                                                             move_line_data, paid_move_lines, log_lines)
+                    with stage_timer(timings, "reconcile"):
+                        log_line = self.reconcile_invoice_refund(statement_line, move_line_total_amount,
+                                                                 currency_ids, move_line_data, paid_move_lines,
+                                                                 log_lines)
                 else:
-                    log_line = self.reconcile_other_transactions(statement_line, move_line_data, log_lines)
+                    with stage_timer(timings, "reconcile"):
+                        log_line = self.reconcile_other_transactions(statement_line, move_line_data, log_lines)
                 # if log_line:
                 #     log_lines.append(log_line)
             except Exception as error:
@@ -740,6 +671,8 @@ class ShopifyPaymentReportEpt(models.Model):
             if commit_count >= 20:
                 self._cr.commit()
                 commit_count = 0
+        reconcile_engine_obj.log_stage_timings(self, "Bank statement reconciliation", timings,
+                                               len(unreconciled_lines))
         if log_lines:
             self.set_payout_log_line(log_lines)
             note = ""
@@ -816,7 +749,9 @@ class ShopifyPaymentReportEpt(models.Model):
                     payout_import_date = datetime.now() - timedelta(days=30)
                 if payout_import_date:
                     _logger.info("===== Auto Import Payout Report =====")
-                    self.get_payout_report(payout_import_date, datetime.now(), instance)
+                    self.env["shopify.cron.scheduler.ept"].run_instance_job(
+                        instance, "import_payout_report", self.get_payout_report, payout_import_date,
+                        datetime.now(), instance)
         return True
 
     def auto_process_bank_statement(self, ctx=False):
@@ -831,13 +766,24 @@ class ShopifyPaymentReportEpt(models.Model):
         if isinstance(ctx, dict):
             shopify_instance_id = ctx.get("shopify_instance_id", False)
             if shopify_instance_id:
-                generated_reports = self.search([("state", "in", ["generated", "partially_processed"]),
-                                                 ("instance_id", "=", shopify_instance_id),
-                                                 ("is_skip_from_cron", "=", False)], order="payout_date asc")
-                for generated_report in generated_reports:
-                    _logger.info("===== Auto Process Bank Statement:%s =====", generated_report.name)
-                    generated_report.with_context(cron_process=True).process_bank_statement()
-                    self._cr.commit()
+                instance = self.env["shopify.instance.ept"].browse(shopify_instance_id)
+                self.env["shopify.cron.scheduler.ept"].run_instance_job(instance, "process_bank_statement",
+                                                                        self.process_generated_payout_reports,
+                                                                        instance)
+        return True
+
+    def process_generated_payout_reports(self, instance):
+        """
+        This method is used to process the bank statements of the generated payout reports of the instance.
+        :param instance: Record of the Shopify instance.
+        """
+        generated_reports = self.search([("state", "in", ["generated", "partially_processed"]),
+                                         ("instance_id", "=", instance.id),
+                                         ("is_skip_from_cron", "=", False)], order="payout_date asc")
+        for generated_report in generated_reports:
+            _logger.info("===== Auto Process Bank Statement:%s =====", generated_report.name)
+            generated_report.with_context(cron_process=True).process_bank_statement()
+            self._cr.commit()
         return True
 
     def open_log_book(self):
@@ -14,6 +14,94 @@ from ..shopify.pyactiveresource.connection import ResourceNotFound
 
 _logger = logging.getLogger("Shopify Product")
 
+SHOPIFY_INVENTORY_SET_BATCH_SIZE = 250
+SHOPIFY_INVENTORY_SET_QUANTITIES_MUTATION = """
+mutation inventorySetQuantities($input: InventorySetQuantitiesInput!) {
+  inventorySetQuantities(input: $input) {
+    userErrors {
+      code
+      field
+      message
+    }
+  }
+}
+"""
+
+
+class ShopifyVariantIndex(object):
+    """
+    Resolves the variant id, SKU and barcode of the Shopify variants of a queue batch to Shopify and Odoo products.
+    It is loaded once per batch for the keys of the batch, a key which was not loaded returns None and the caller
+    searches it as before. The index is passed in the shopify_variant_index context key, and the create, write and
+    unlink of the Shopify and Odoo products keep it current.
+    """
+
+    def __init__(self, instance_id):
+        self.instance_id = instance_id
+        self.loaded = {"variant_id": set(), "sku": set(), "barcode": set()}
+        # Key type of every map, maps of Shopify products have ids of shopify.product.product.ept as values.
+        self.maps = {"variant": "variant_id", "sku": "sku", "product_sku": "sku", "product_barcode": "barcode",
+                     "any_product_barcode": "barcode", "odoo_sku": "sku", "odoo_barcode": "barcode"}
+        self.values = {name: {} for name in self.maps}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, map_name, key):
+        """
+        Returns the id found for the key, False if the key was loaded without any match, None if it was not loaded.
+        """
+        key = str(key) if key and map_name == "variant" else key
+        if not key or key not in self.loaded[self.maps[map_name]]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.values[map_name].get(key, False)
+
+    def add_variants(self, variants):
+        """ Adds the active Shopify products of the instance, in the order of the model like a search. """
+        for variant in variants:
+            if not variant.active or variant.shopify_instance_id.id != self.instance_id:
+                continue
+            if variant.variant_id:
+                self.values["variant"].setdefault(variant.variant_id, variant.id)
+            product = variant.product_id
+            if product.barcode:
+                self.values["any_product_barcode"].setdefault(product.barcode, variant.id)
+            if variant.variant_id:
+                continue
+            if variant.default_code:
+                self.values["sku"].setdefault(variant.default_code, variant.id)
+            if product.default_code:
+                self.values["product_sku"].setdefault(product.default_code, variant.id)
+            if product.barcode:
+                self.values["product_barcode"].setdefault(product.barcode, variant.id)
+
+    def add_products(self, products):
+        """ Adds the active Odoo products. """
+        for product in products:
+            if not product.active:
+                continue
+            if product.default_code:
+                self.values["odoo_sku"].setdefault(product.default_code, product.id)
+            if product.barcode:
+                self.values["odoo_barcode"].setdefault(product.barcode, product.id)
+
+    def discard(self, map_names, record_ids):
+        """ Removes the keys which point to the records, before their keys are changed. """
+        record_ids = set(record_ids)
+        for map_name in map_names:
+            values = self.values[map_name]
+            for key in [key for key, record_id in values.items() if record_id in record_ids]:
+                del values[key]
+                # Another record may match the key, it is searched again.
+                self.loaded[self.maps[map_name]].discard(key)
+
+    def discard_variants(self, variant_ids):
+        self.discard(["variant", "sku", "product_sku", "product_barcode", "any_product_barcode"], variant_ids)
+
+    def discard_products(self, product_ids):
+        self.discard(["odoo_sku", "odoo_barcode"], product_ids)
+
 
 class ShopifyProductProductEpt(models.Model):
     _name = "shopify.product.product.ept"
@@ -33,6 +121,9 @@ class ShopifyProductProductEpt(models.Model):
     fix_stock_value = fields.Float()
     created_at = fields.Datetime()
     updated_at = fields.Datetime()
+    shopify_sync_fingerprint = fields.Char(copy=False, readonly=True,
+                                           help="Updated date and checksum of the variant response at its last "
+                                                "import, an unchanged variant is not written again.")
     inventory_item_id = fields.Char()
     check_product_stock = fields.Selection([("continue", "Allow"), ("deny", "Denied")],
                                            string="Sale out of stock products?",
@@ -49,6 +140,9 @@ class ShopifyProductProductEpt(models.Model):
     shopify_image_ids = fields.One2many("shopify.product.image.ept", "shopify_variant_id")
     taxable = fields.Boolean(default=True)
     last_stock_update_date = fields.Datetime(readonly=True, help="It is used in export stock process.")
+    stock_snapshot_ids = fields.One2many("shopify.stock.snapshot.ept", "shopify_product_id",
+                                         help="Last quantity exported per Shopify location, only the changed "
+                                              "quantities are exported.")
     fixed_stock_export = fields.Boolean()
     fixed_stock_export_value = fields.Float(digits=0)
 
@@ -57,6 +151,71 @@ class ShopifyProductProductEpt(models.Model):
         if self.fixed_stock_export_value < 0:
             raise UserError(_('There is no negative value allowed for the fixed export stock value.'))
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Inherited for adding the new Shopify products to the variant index of the batch being processed.
+        """
+        records = super(ShopifyProductProductEpt, self).create(vals_list)
+        index = self.env.context.get("shopify_variant_index")
+        if index:
+            index.add_variants(records)
+        return records
+
+    def write(self, vals):
+        """
+        Inherited for keeping the variant index of the batch being processed current, when the keys of the Shopify
+        products change.
+        """
+        index = self.env.context.get("shopify_variant_index")
+        if not index or not {"variant_id", "default_code", "product_id", "active", "shopify_instance_id"} & set(vals):
+            return super(ShopifyProductProductEpt, self).write(vals)
+        index.discard_variants(self.ids)
+        res = super(ShopifyProductProductEpt, self).write(vals)
+        index.add_variants(self)
+        return res
+
+    def unlink(self):
+        index = self.env.context.get("shopify_variant_index")
+        if index:
+            index.discard_variants(self.ids)
+        return super(ShopifyProductProductEpt, self).unlink()
+
+    @api.model
+    def prepare_shopify_variant_index_ept(self, instance, variant_ids, skus, barcodes):
+        """
+        This method is used to load the variant index of a queue batch, with one search of the Shopify products and
+        one search of the Odoo products for all the variant ids, SKUs and barcodes of the batch.
+        :param instance: Record of the Shopify instance.
+        @return: Object of ShopifyVariantIndex.
+        """
+        index = ShopifyVariantIndex(instance.id)
+        variant_ids = {str(variant_id) for variant_id in variant_ids if variant_id}
+        skus = {sku for sku in skus if sku}
+        barcodes = {barcode for barcode in barcodes if barcode}
+        index.loaded.update({"variant_id": variant_ids, "sku": skus, "barcode": barcodes})
+        if variant_ids or skus or barcodes:
+            index.add_variants(self.search([("shopify_instance_id", "=", instance.id), "|", "|", "|",
+                                            ("variant_id", "in", list(variant_ids)),
+                                            ("default_code", "in", list(skus)),
+                                            ("product_id.default_code", "in", list(skus)),
+                                            ("product_id.barcode", "in", list(barcodes))]))
+        if skus or barcodes:
+            index.add_products(self.env["product.product"].search(["|", ("default_code", "in", list(skus)),
+                                                                   ("barcode", "in", list(barcodes))]))
+        return index
+
+    @api.model
+    def get_shopify_variant_index(self, instance):
+        """
+        This method is used to get the variant index of the batch being processed for the instance.
+        @return: Object of ShopifyVariantIndex or None.
+        """
+        index = self.env.context.get("shopify_variant_index")
+        if index and index.instance_id == instance.id:
+            return index
+        return None
+
     def toggle_active(self):
         """
         This method is used to archiving related shopify product template if there is only
@@ -380,12 +539,6 @@ class ShopifyProductProductEpt(models.Model):
                         try:
                             results = shopify.Product().find(page_info=page_info, limit=250)
                             data_dict += results
-                        except ClientError as error:
-                            if hasattr(error,
-                                       "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                                results = shopify.Product().find(page_info=page_info, limit=250)
-                                data_dict += results
                         except Exception as error:
                             continue
                 if catch == page_info:
@@ -412,10 +565,6 @@ class ShopifyProductProductEpt(models.Model):
             return False
         try:
             new_product = shopify.Product().find(template.shopify_tmpl_id)
-        except ClientError as error:
-            if hasattr(error, "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                new_product = shopify.Product().find(template.shopify_tmpl_id)
         except Exception as error:
             message = "Template %s not found in shopify while updating Product.\nError: %s" % (
                 template.shopify_tmpl_id, str(error))
@@ -657,9 +806,8 @@ class ShopifyProductProductEpt(models.Model):
         try:
             shopify_images = shopify.Image().find(product_id=int(shopify_template.shopify_tmpl_id))
         except ClientError as error:
-            if hasattr(error, "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                shopify_images = shopify.Image().find(product_id=shopify_template.shopify_tmpl_id)
+            _logger.info("Images of Shopify product %s are not requested. Error: %s", shopify_template.shopify_tmpl_id,
+                         error)
 
         return shopify_images
 
@@ -710,6 +858,8 @@ class ShopifyProductProductEpt(models.Model):
             shopify_products = shopify_template_ids.filtered(
                 lambda template: template.id in shopify_templates.ids).shopify_product_ids
 
+        stock_matrix = self.check_stock_of_locations(instance, shopify_products.product_id.ids, product_obj,
+                                                     location_ids)
         for location_id in location_ids:
             shopify_location_warehouse = location_id.export_stock_warehouse_ids or False
             if not shopify_location_warehouse:
@@ -717,9 +867,7 @@ class ShopifyProductProductEpt(models.Model):
                 log_lines.append(self.shopify_create_log(instance, message, model))
                 continue
 
-            odoo_product_ids = shopify_products.product_id.ids
-            product_stock = self.check_stock(instance, odoo_product_ids, product_obj,
-                                             location_id.export_stock_warehouse_ids)
+            product_stock = stock_matrix.get(location_id.id, {})
             commit_count = 0
             for shopify_product in shopify_products:
                 if commit_count == 50:
@@ -740,14 +888,7 @@ class ShopifyProductProductEpt(models.Model):
                         shopify.InventoryLevel.set(location_id.shopify_location_id, shopify_product.inventory_item_id,
                                                    int(quantity))
                     except ClientError as error:
-                        if hasattr(error,
-                                   "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                            time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                            shopify.InventoryLevel.set(location_id.shopify_location_id,
-                                                       shopify_product.inventory_item_id,
-                                                       int(quantity))
-                            continue
-                        elif error.response.code == 422 and error.response.msg == "Unprocessable Entity":
+                        if error.response.code == 422 and error.response.msg == "Unprocessable Entity":
                             if json.loads(error.response.body.decode()).get("errors")[
                                 0] == 'Inventory item does not have inventory tracking enabled':
                                 shopify_product.write({'inventory_management': "Dont track Inventory"})
@@ -843,7 +984,14 @@ class ShopifyProductProductEpt(models.Model):
 
         shopify_products = shopify_products.filtered(
             lambda l: l.product_id.id in product_ids and l.inventory_management == 'shopify')
+        # Only the quantities which differ from the last exported one are queued, except for a manual export.
+        stock_snapshot = {}
+        if not self._context.get('is_process_from_selected_product'):
+            stock_snapshot = self.env["shopify.stock.snapshot.ept"].get_stock_snapshot(shopify_products)
+        unchanged_count = 0
         export_stock_data = []
+        stock_matrix = self.check_stock_of_locations(instance, shopify_products.product_id.ids, product_obj,
+                                                     location_ids)
         for location_id in location_ids:
             shopify_location_warehouse = location_id.export_stock_warehouse_ids or False
             if not shopify_location_warehouse:
@@ -851,9 +999,7 @@ class ShopifyProductProductEpt(models.Model):
                 self.shopify_create_log(instance, message, model)
                 continue
 
-            odoo_product_ids = shopify_products.product_id.ids
-            product_stock = self.check_stock(instance, odoo_product_ids, product_obj,
-                                             location_id.export_stock_warehouse_ids)
+            product_stock = stock_matrix.get(location_id.id, {})
             commit_count = 0
             for shopify_product in shopify_products:
                 if commit_count == 50:
@@ -872,6 +1018,9 @@ class ShopifyProductProductEpt(models.Model):
                         quantity = self.compute_qty_for_export_stock(product_stock, shopify_product, odoo_product)
                     else:
                         quantity = shopify_product.fixed_stock_export_value
+                    if stock_snapshot.get((shopify_product.id, location_id.shopify_location_id)) == int(quantity):
+                        unchanged_count += 1
+                        continue
 
                     export_stock_data.append({'product_name': shopify_product.default_code,
                                               'shopify_product_id': shopify_product,
@@ -882,11 +1031,14 @@ class ShopifyProductProductEpt(models.Model):
                     # if not self._context.get('is_process_from_selected_product'):
 
         export_stock_queue = export_stock_obj.create_export_stock_queue(instance, export_stock_data)
-        if export_stock_queue:
+        if unchanged_count:
+            _logger.info("Skipped %s unchanged stock quantities of instance %s.", unchanged_count, instance.name)
+        if export_stock_queue or unchanged_count:
             shopify_products.write({
                 'last_stock_update_date': datetime.now() - timedelta(hours=0.5)})
             instance.write({
                 'shopify_last_date_update_stock': datetime.now() - timedelta(hours=0.5)})
+        if export_stock_queue:
             queue_cron = self.env.ref("shopify_ept.process_shopify_export_stock_queue")
             if not queue_cron.active:
                 _logger.info("Active the Export stock data process queue cron job")
@@ -898,6 +1050,79 @@ class ShopifyProductProductEpt(models.Model):
             return False
         return export_stock_queue
 
+    @api.model
+    def shopify_set_inventory_quantities_in_bulk(self, instance, items):
+        """
+        This method is used to set the available quantity of many inventory items with batched GraphQL
+        inventorySetQuantities mutations, instead of one InventoryLevel.set call per item and location.
+        :param instance: Record of the Shopify instance, already connected.
+        :param items: List of dictionaries with inventory_item_id, location_id and quantity.
+        @return: Dictionary of the index of the failed items with a dictionary of their error code and message.
+        """
+        errors = {}
+        for offset in range(0, len(items), SHOPIFY_INVENTORY_SET_BATCH_SIZE):
+            batch = list(range(offset, min(offset + SHOPIFY_INVENTORY_SET_BATCH_SIZE, len(items))))
+            # The mutation is atomic, so the items which got an user error are removed and the rest is sent again.
+            for _attempt in range(3):
+                if not batch:
+                    break
+                user_errors = self.shopify_execute_inventory_set_quantities(instance, [items[index] for index in
+                                                                                       batch])
+                if not user_errors:
+                    break
+                failed_positions = {}
+                for user_error in user_errors:
+                    field = user_error.get("field") or []
+                    if len(field) > 2 and field[:2] == ["input", "quantities"] and str(field[2]).isdigit():
+                        failed_positions[int(field[2])] = user_error
+                if not failed_positions:
+                    for index in batch:
+                        errors[index] = {"code": user_errors[0].get("code"), "message": user_errors[0].get("message")}
+                    break
+                for position, user_error in failed_positions.items():
+                    if position < len(batch):
+                        errors[batch[position]] = {"code": user_error.get("code"),
+                                                   "message": user_error.get("message")}
+                batch = [index for position, index in enumerate(batch) if position not in failed_positions]
+            else:
+                for index in batch:
+                    errors.setdefault(index, {"code": False, "message": "Stock is not updated after 3 attempts."})
+        return errors
+
+    def shopify_execute_inventory_set_quantities(self, instance, items):
+        """
+        This method is used to send one inventorySetQuantities mutation and wait for the query cost to be restored
+        when Shopify throttles it.
+        :param instance: Record of the Shopify instance, already connected.
+        :param items: List of up to 250 dictionaries with inventory_item_id, location_id and quantity.
+        @return: List of the user errors of the mutation.
+        """
+        variables = {"input": {
+            "name": "available",
+            "reason": "correction",
+            "ignoreCompareQuantity": True,
+            "quantities": [{"inventoryItemId": "gid://shopify/InventoryItem/%s" % item["inventory_item_id"],
+                            "locationId": "gid://shopify/Location/%s" % item["location_id"],
+                            "quantity": int(item["quantity"])} for item in items]}}
+        for attempt in range(5):
+            result = json.loads(shopify.GraphQL().execute(SHOPIFY_INVENTORY_SET_QUANTITIES_MUTATION, variables))
+            top_errors = result.get("errors") or []
+            if any((error.get("extensions") or {}).get("code") == "THROTTLED" for error in top_errors):
+                throttle_status = (result.get("extensions") or {}).get("cost", {}).get("throttleStatus") or {}
+                restore_rate = float(throttle_status.get("restoreRate") or 50.0)
+                required = float((result.get("extensions") or {}).get("cost", {}).get("requestedQueryCost") or 10.0)
+                available = float(throttle_status.get("currentlyAvailable") or 0.0)
+                wait = min(max((required - available) / restore_rate, 1.0) * (attempt + 1), 30.0)
+                _logger.info("Inventory mutation is throttled for instance %s, waiting %s seconds.", instance.name,
+                             wait)
+                time.sleep(wait)
+                continue
+            if top_errors:
+                return [{"field": None, "code": False, "message": "; ".join(error.get("message", "")
+                                                                           for error in top_errors)}]
+            return ((result.get("data") or {}).get("inventorySetQuantities") or {}).get("userErrors") or []
+        return [{"field": None, "code": "THROTTLED", "message": "Query cost budget of the shop is exhausted."}]
+
     def compute_qty_for_export_stock(self, product_stock, shopify_product, odoo_product):
         """ This method is used to find qty base on the configuration of Shopify.
             :param product_stock: Dictionary of the odoo product with qty.
@@ -953,6 +1178,22 @@ class ShopifyProductProductEpt(models.Model):
 
         return product_stock
 
+    def check_stock_of_locations(self, instance, product_ids, prod_obj, location_ids):
+        """
+        This method is used to get the stock of the products for all the Shopify locations from one grouped query.
+        :param instance: Record of the Shopify instance.
+        :param product_ids: Ids of the Odoo products.
+        :param prod_obj: Object of the Odoo product.
+        :param location_ids: Records of the Shopify locations, with their export stock warehouses.
+        :return: Dictionary of the Shopify location id with the stock of the products.
+        """
+        stock_field = instance.shopify_stock_field.name
+        if not product_ids or stock_field not in ("free_qty", "virtual_available", "qty_available"):
+            return {}
+        location_products = [(location.id, location.export_stock_warehouse_ids, product_ids) for location in
+                             location_ids if location.export_stock_warehouse_ids]
+        return prod_obj.get_qty_matrix_ept(location_products, stock_field)
+
     def import_shopify_stock(self, instance, validate_inventory):
         """
         This method is used to import product stock from shopify store to Odoo.
@@ -1084,11 +1325,6 @@ class ShopifyProductProductEpt(models.Model):
                     page_info = page_link.split(";")[0].strip("<>").split("page_info=")[1]
                     try:
                         result = shopify.InventoryLevel.find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error,
-                                   "response") and error.response.code == 429 and error.response.msg == "Too Many Requests":
-                            time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                            result = shopify.InventoryLevel.find(page_info=page_info, limit=250)
                     except Exception as error:
                         raise UserError(error)
             if catch == page_info:
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import logging
+from odoo import models, fields
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger("Shopify Rate Limit")
+
+
+class ShopifyRateLimitEpt(models.Model):
+    _name = "shopify.rate.limit.ept"
+    _description = "Shopify API Rate Limit"
+    _log_access = False
+
+    shop_host = fields.Char(required=True, index=True, readonly=True)
+    api = fields.Selection([("rest", "REST"), ("graphql", "GraphQL")], required=True, readonly=True)
+    level = fields.Float(readonly=True, help="Calls or query points in the bucket at the update time.")
+    capacity = fields.Float(readonly=True)
+    leak_rate = fields.Float(readonly=True, help="Calls or query points leaked per second.")
+    updated_at = fields.Float(readonly=True, help="Unix time of the level.")
+    blocked_until = fields.Float(readonly=True, help="Unix time until which the calls wait after a 429.")
+
+    _sql_constraints = [("unique_shop_host", "unique(shop_host, api)",
+                         "Rate limit of the shop host must be unique per API.")]
+
+
+class ShopifyPostgresRateLimitStore(object):
+    """
+    Shared store of the Shopify rate limiter, merging the buckets of all the cron and HTTP workers of a database.
+    The limiter syncs a bucket with it periodically and after a 429 only. Every sync is one upsert returning the
+    merged bucket, in its own short transaction, so it never holds locks in the transaction of the worker doing
+    the import.
+    """
+
+    FIELDS = ("level", "capacity", "leak_rate", "updated_at", "blocked_until")
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+
+    def sync(self, key, state):
+        host, api = key
+        with Registry(self.dbname).cursor() as cr:
+            cr.execute("""
+                INSERT INTO shopify_rate_limit_ept AS bucket
+                    (shop_host, api, level, capacity, leak_rate, updated_at, blocked_until)
+                VALUES (%(host)s, %(api)s, %(level)s, %(capacity)s, %(leak_rate)s, %(updated_at)s, %(blocked_until)s)
+                ON CONFLICT (shop_host, api) DO UPDATE SET
+                    level = GREATEST(EXCLUDED.level, bucket.level - GREATEST(EXCLUDED.updated_at - bucket.updated_at, 0)
+                                                                    * bucket.leak_rate, 0),
+                    capacity = GREATEST(EXCLUDED.capacity, bucket.capacity),
+                    leak_rate = GREATEST(EXCLUDED.leak_rate, bucket.leak_rate),
+                    updated_at = GREATEST(EXCLUDED.updated_at, bucket.updated_at),
+                    blocked_until = GREATEST(EXCLUDED.blocked_until, bucket.blocked_until)
+                RETURNING level, capacity, leak_rate, updated_at, blocked_until
+            """, dict(state, host=host, api=api))
+            return dict(zip(self.FIELDS, cr.fetchone()))
@@ -94,6 +94,9 @@ class ShopifyResPartnerEpt(models.Model):
             Task_id: 167537
         """
         partner = False
+        prefetch = self.env.context.get("shopify_order_prefetch")
+        if prefetch and prefetch["customers"].get(str(shopify_customer_id)):
+            return prefetch["customers"][str(shopify_customer_id)]
         shopify_partner = self.search([("shopify_customer_id", "=", shopify_customer_id),
                                        ("shopify_instance_id", "=", shopify_instance_id)], limit=1)
         if shopify_partner:
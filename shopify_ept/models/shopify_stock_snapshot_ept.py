@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+from odoo import models, fields, api
+
+
+class ShopifyStockSnapshotEpt(models.Model):
+    _name = "shopify.stock.snapshot.ept"
+    _description = "Shopify Last Exported Stock"
+    _log_access = False
+
+    shopify_product_id = fields.Many2one("shopify.product.product.ept", string="Product", required=True,
+                                         ondelete="cascade", index=True, readonly=True)
+    shopify_location_id = fields.Char(string="Shopify Location ID", required=True, readonly=True,
+                                      help="ID of the location in Shopify, as set in the export stock queue line.")
+    quantity = fields.Integer(readonly=True, help="Last quantity successfully exported to the Shopify location.")
+    export_date = fields.Datetime(readonly=True)
+
+    _sql_constraints = [("unique_product_location", "unique(shopify_product_id, shopify_location_id)",
+                         "Only one stock snapshot is allowed per product and Shopify location.")]
+
+    @api.model
+    def get_stock_snapshot(self, shopify_products):
+        """
+        This method is used to read the last exported quantities of the products in one query.
+        :param shopify_products: Records of the Shopify products.
+        @return: Dictionary with (shopify product id, Shopify location id) keys and the quantity as value.
+        """
+        if not shopify_products:
+            return {}
+        self.flush_model()
+        self._cr.execute("""
+            SELECT shopify_product_id, shopify_location_id, quantity
+            FROM shopify_stock_snapshot_ept
+            WHERE shopify_product_id IN %s
+        """, (tuple(shopify_products.ids),))
+        return {(product_id, location_id): quantity for product_id, location_id, quantity in self._cr.fetchall()}
+
+    @api.model
+    def update_stock_snapshot(self, queue_lines):
+        """
+        This method is used to save the quantities of the exported queue lines as the last exported stock.
+        :param queue_lines: Records of the export stock queue lines successfully exported.
+        """
+        values = [(line.shopify_product_id.id, line.location_id, line.quantity) for line in queue_lines
+                  if line.shopify_product_id and line.location_id]
+        if not values:
+            return True
+        self._cr.execute("""
+            INSERT INTO shopify_stock_snapshot_ept (shopify_product_id, shopify_location_id, quantity, export_date)
+            SELECT product_id, location_id, quantity, NOW() AT TIME ZONE 'UTC'
+            FROM unnest(%s::int[], %s::varchar[], %s::int[]) AS snapshot(product_id, location_id, quantity)
+            ON CONFLICT (shopify_product_id, shopify_location_id)
+            DO UPDATE SET quantity = EXCLUDED.quantity, export_date = EXCLUDED.export_date
+        """, ([value[0] for value in values], [value[1] for value in values], [value[2] for value in values]))
+        self.invalidate_model()
+        return True
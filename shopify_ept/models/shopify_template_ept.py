@@ -1,14 +1,11 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 
-import base64
 import hashlib
 import json
 import logging
-import time
 from builtins import int
 from datetime import datetime
-import requests
 from dateutil import parser
 import pytz
 
@@ -19,6 +16,21 @@ from ..shopify.pyactiveresource.connection import ClientError
 utc = pytz.utc
 _logger = logging.getLogger("Shopify Template")
 
+# Keys of the product response which change without the product being changed, they are left out of the fingerprint.
+FINGERPRINT_VOLATILE_KEYS = ("inventory_quantity", "old_inventory_quantity", "admin_graphql_api_id")
+
+
+def strip_volatile_keys(data):
+    """
+    Returns a copy of the product response without the keys which are not imported.
+    """
+    if isinstance(data, dict):
+        return {key: strip_volatile_keys(value) for key, value in data.items() if
+                key not in FINGERPRINT_VOLATILE_KEYS}
+    if isinstance(data, list):
+        return [strip_volatile_keys(value) for value in data]
+    return data
+
 
 class ProductCategory(models.Model):
     """
@@ -57,6 +69,9 @@ class ShopifyProductTemplateEpt(models.Model):
     shopify_product_category = fields.Many2one("product.category", "Product Category")
     active = fields.Boolean(default=True)
     shopify_image_ids = fields.One2many("shopify.product.image.ept", "shopify_template_id")
+    shopify_sync_fingerprint = fields.Char(copy=False, readonly=True,
+                                           help="Updated date and checksum of the product response at its last "
+                                                "import, an unchanged product is not imported again.")
 
     @api.depends("shopify_product_ids.exported_in_shopify", "shopify_product_ids.variant_id")
     def _compute_total_sync_variants(self):
@@ -191,10 +206,6 @@ class ShopifyProductTemplateEpt(models.Model):
             result = [shopify.Product().find(template_id)]
         except ClientError as error:
             if hasattr(error, "response"):
-                if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                    time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                    result = [shopify.Product().find(template_id)]
-                    return result
                 message = "Error while importing product for order. Product ID: %s.\nError: %s\n%s" % (
                     template_id, str(error.response.code) + " " + error.response.msg,
                     json.loads(error.response.body.decode()).get("errors")[0])
@@ -225,6 +236,7 @@ class ShopifyProductTemplateEpt(models.Model):
                         "taxable": variant_data.get("taxable"),
                         "created_at": self.convert_shopify_date_into_odoo_format(variant_data.get("created_at")),
                         "updated_at": self.convert_shopify_date_into_odoo_format(variant_data.get("updated_at")),
+                        "shopify_sync_fingerprint": self.prepare_shopify_sync_fingerprint(instance, variant_data),
                         "exported_in_shopify": True,
                         "active": True}
 
@@ -315,6 +327,15 @@ class ShopifyProductTemplateEpt(models.Model):
             [("shopify_tmpl_id", "=", template_data.get("id")),
              ("shopify_instance_id", "=", instance.id)])
 
+        fingerprint = self.prepare_shopify_sync_fingerprint(instance, template_data)
+        if shopify_template and self.is_shopify_template_unchanged(shopify_template, template_data, fingerprint):
+            _logger.info("Product- %s || %s is not changed since its last import.", template_data.get("id"),
+                         template_data.get("title"))
+            if product_data_line_id:
+                product_data_line_id.write({"state": "done", "last_process_date": datetime.now(),
+                                            "shopify_image_import_state": "done", "synced_product_data": False})
+            return shopify_template
+
         if shopify_template:
             shopify_template = self.sync_product_with_existing_template(shopify_template, skip_existing_product,
                                                                         template_data, instance,
@@ -335,11 +356,41 @@ class ShopifyProductTemplateEpt(models.Model):
                 {"state": "done", "last_process_date": datetime.now()})
         if shopify_template:
             self.update_weight_product_variants(instance, shopify_template, template_data.get("variants"))
+            if not skip_existing_product:
+                shopify_template.write({"shopify_sync_fingerprint": fingerprint})
 
         _logger.info("Process completed of Product- %s || %s.", template_data.get("id"), template_data.get("title"))
 
         return shopify_template
 
+    def prepare_shopify_sync_fingerprint(self, instance, data):
+        """
+        This method is used to prepare the fingerprint of a product or variant response. It is the updated date of
+        the response and a checksum of the response and of the instance settings used by the import.
+        @param instance: Shopify Instance.
+        @param data: Product or variant response.
+        @return: Fingerprint string.
+        """
+        settings = [instance.id, instance.shopify_sync_product_with, instance.shopify_pricelist_id.id,
+                    instance.shopify_compare_pricelist_id.id, instance.shopify_product_uom_id.id,
+                    instance.auto_import_product, instance.auto_create_product_category,
+                    instance.shopify_instance_product_category.id, instance.sync_product_with_images]
+        checksum = hashlib.sha1(json.dumps([settings, strip_volatile_keys(data)], sort_keys=True,
+                                           default=str).encode("utf-8")).hexdigest()
+        return "%s|%s" % (data.get("updated_at") or "", checksum)
+
+    def is_shopify_template_unchanged(self, shopify_template, template_data, fingerprint):
+        """
+        This method is used to check that the product is imported already with the same response, so the template,
+        its variants and its images are not written again. The context key force_product_sync disables the check.
+        @return: True if the product can be skipped.
+        """
+        if self._context.get("force_product_sync") or shopify_template.shopify_sync_fingerprint != fingerprint:
+            return False
+        variant_ids = {str(variant.get("id")) for variant in template_data.get("variants", [])}
+        synced_variants = shopify_template.shopify_product_ids.filtered(lambda x: x.variant_id in variant_ids)
+        return shopify_template.active and len(synced_variants) == len(variant_ids)
+
     def update_weight_product_variants(self, instance, shopify_template, variant_data):
         for variant in variant_data:
             company_uom = instance._default_UOM_category()
@@ -502,6 +553,11 @@ class ShopifyProductTemplateEpt(models.Model):
                                                         order_data_line_id, sku)
                     continue
             else:
+                if shopify_product.shopify_sync_fingerprint == variant_vals.get("shopify_sync_fingerprint") and \
+                        shopify_product.active and not self._context.get("force_product_sync"):
+                    # The variant is not changed since its last import.
+                    variant_ids.append(variant_id)
+                    continue
                 self.create_or_update_shopify_variant(variant_vals, shopify_product)
             instance.shopify_pricelist_id.set_product_price_ept(shopify_product.product_id.id, variant.get("price"))
             if instance.shopify_compare_pricelist_id:
@@ -777,33 +833,26 @@ class ShopifyProductTemplateEpt(models.Model):
         @version: Shopify 13.0.0.23
         """
         shopify_product_image_obj = shopify_product_images = self.env["shopify.product.image.ept"]
-        existing_common_template_images = {}
         is_template_image_set = bool(self.product_tmpl_id.image_1920)
-        i = 0
-        for odoo_image in self.product_tmpl_id.ept_image_ids:
-            i += 1
-            if i % 500 == 0: self.env.cache.invalidate()
-            odoo_image.read(['image'])
-            if not odoo_image.image:
-                continue
-            key = hashlib.md5(odoo_image.image).hexdigest()
-            if not key:
-                continue
-            existing_common_template_images.update({key: odoo_image.id})
-        for image in template_data.get("images", {}):
-            if image.get("src"):
-                shopify_image_id = str(image.get("id"))
-                url = image.get("src")
-                variant_ids = image.get("variant_ids")
-
-                if not variant_ids:
-                    # below method is used to sync simple product images.
-                    shopify_product_images += self.sync_simple_product_images(shopify_image_id,
-                                                                              existing_common_template_images, url)
-                else:
-                    # The below method is used to sync variable(variation) product images.
-                    shopify_product_images += self.sync_variable_product_images(shopify_image_id, url, variant_ids,
-                                                                                is_template_image_set)
+        # The checksum of the existing images is stored, so the images are not read and hashed again.
+        existing_common_template_images = {odoo_image.image_hash: odoo_image.id for odoo_image in
+                                           self.product_tmpl_id.ept_image_ids if odoo_image.image_hash}
+        images = [image for image in template_data.get("images", {}) if image.get("src")]
+        image_data = self.prefetch_shopify_product_images(images)
+        for image in images:
+            shopify_image_id = str(image.get("id"))
+            url = image.get("src")
+            variant_ids = image.get("variant_ids")
+
+            if not variant_ids:
+                # below method is used to sync simple product images.
+                shopify_product_images += self.sync_simple_product_images(shopify_image_id,
+                                                                          existing_common_template_images, url,
+                                                                          image_data)
+            else:
+                # The below method is used to sync variable(variation) product images.
+                shopify_product_images += self.sync_variable_product_images(shopify_image_id, url, variant_ids,
+                                                                            is_template_image_set, image_data)
 
         all_shopify_product_images = shopify_product_image_obj.search([("shopify_template_id",
                                                                         "=", self.id)])
@@ -822,12 +871,40 @@ class ShopifyProductTemplateEpt(models.Model):
         _logger.info("Images Updated for shopify %s", self.name)
         return True
 
-    def sync_simple_product_images(self, shopify_image_id, existing_common_template_images, url):
+    def prefetch_shopify_product_images(self, images):
+        """
+        This method is used to download concurrently the images of the product response which are not synced yet.
+        Images already linked with their Shopify image id are not downloaded, and an URL used by many images or
+        variants is downloaded only once.
+        :param images: Images of the product response.
+        @return: dict {url: image}, the image is False when it could not be downloaded.
+        """
+        shopify_image_ids = [str(image.get("id")) for image in images]
+        synced_image_ids = set(self.env["shopify.product.image.ept"].search(
+            [("shopify_image_id", "in", shopify_image_ids), "|", ("shopify_template_id", "=", self.id),
+             ("shopify_variant_id", "in", self.shopify_product_ids.ids)]).mapped("shopify_image_id"))
+        urls = [image.get("src") for image in images if str(image.get("id")) not in synced_image_ids]
+        return self.env["common.product.image.ept"].get_images_ept(urls, verify=True)
+
+    def get_shopify_image_data(self, url, image_data):
+        """
+        This method is used to get the downloaded image of the URL, it is downloaded when it was not prefetched.
+        @return: Base64 image and its checksum, False when it could not be downloaded.
+        """
+        if url not in image_data:
+            image_data.update(self.env["common.product.image.ept"].get_images_ept([url], verify=True))
+        image = image_data.get(url)
+        if not image:
+            return False, False
+        return image, hashlib.md5(image).hexdigest()
+
+    def sync_simple_product_images(self, shopify_image_id, existing_common_template_images, url, image_data=None):
         """
         This method is used to create images in the Shopify image layer and common product image layer for the
         simple product.
         :param shopify_image_id: Id of the image as received from image response.
         :param existing_common_template_images: it is used
+        :param image_data: Images downloaded by URL.
         @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 22 October 2020 .
         Task_id: 167537
         """
@@ -835,10 +912,8 @@ class ShopifyProductTemplateEpt(models.Model):
         shopify_product_image = self.search_shopify_product_images(self.id, False, shopify_image_id, False)
         if not shopify_product_image:
             try:
-                response = requests.get(url, stream=True, verify=True, timeout=10)
-                if response.status_code == 200:
-                    image = base64.b64encode(response.content)
-                    key = hashlib.md5(image).hexdigest()
+                image, key = self.get_shopify_image_data(url, image_data if image_data is not None else {})
+                if image:
                     if key in existing_common_template_images.keys():
                         shopify_product_image = self.create_shopify_layer_image(shopify_image_id,
                                                                                 existing_common_template_images, key,
@@ -913,32 +988,27 @@ class ShopifyProductTemplateEpt(models.Model):
         })
         return common_product_image
 
-    def sync_variable_product_images(self, shopify_image_id, url, variant_ids, is_template_image_set):
+    def sync_variable_product_images(self, shopify_image_id, url, variant_ids, is_template_image_set,
+                                     image_data=None):
         """ This method is used to sync images of the variable products.
             :param variant_ids: An array of variant ids associated with the image.
             :param is_template_image_set: It is used to identify that the odoo template has already image set or not.
+            :param image_data: Images downloaded by URL.
             @author: Haresh Mori @Emipro Technologies Pvt. Ltd on date 22 October 2020 .
             Task_id: 167537
         """
         shopify_product_images = self.env["shopify.product.image.ept"]
+        image_data = image_data if image_data is not None else {}
         shopify_products = self.shopify_product_ids.filtered(lambda x: int(x.variant_id) in variant_ids)
         for shopify_product in shopify_products:
-            existing_common_variant_images = {}
-            for odoo_image in shopify_product.product_id.ept_image_ids:
-                if not odoo_image.image:
-                    continue
-                key = hashlib.md5(odoo_image.image).hexdigest()
-                if not key:
-                    continue
-                existing_common_variant_images.update({key: odoo_image.id})
+            existing_common_variant_images = {odoo_image.image_hash: odoo_image.id for odoo_image in
+                                              shopify_product.product_id.ept_image_ids if odoo_image.image_hash}
             shopify_product_image = self.search_shopify_product_images(False, shopify_product.id, shopify_image_id,
                                                                        False)
             if not shopify_product_image:
                 try:
-                    response = requests.get(url, stream=True, verify=True, timeout=10)
-                    if response.status_code == 200:
-                        image = base64.b64encode(response.content)
-                        key = hashlib.md5(image).hexdigest()
+                    image, key = self.get_shopify_image_data(url, image_data)
+                    if image:
                         if key in existing_common_variant_images.keys():
                             shopify_product_image = self.create_shopify_layer_image(shopify_image_id,
                                                                                     existing_common_variant_images,
@@ -1027,7 +1097,8 @@ class ShopifyProductTemplateEpt(models.Model):
 
     def shopify_search_odoo_product_variant(self, shopify_instance, variant_id, product_sku, barcode):
         """
-        Searches for Shopify/Odoo product with SKU and/or Barcode.
+        Searches for Shopify/Odoo product with SKU and/or Barcode. The variant index of the batch is consulted
+        first, a key which is not in the index is searched.
         @param shopify_instance: It is the browsable object of shopify instance
         @param product_sku : It is the default code of product and its type is String
         @param variant_id : It is the id of the product variant and its type is Integer
@@ -1036,55 +1107,64 @@ class ShopifyProductTemplateEpt(models.Model):
         """
         odoo_product = self.env["product.product"]
         shopify_product_obj = self.env["shopify.product.product.ept"]
+        index = shopify_product_obj.get_shopify_variant_index(shopify_instance)
+
+        def search_product(model, map_name, key, domain):
+            record_id = index.lookup(map_name, key) if index else None
+            if record_id is None:
+                return model.search(domain, limit=1)
+            return model.browse(record_id or [])
 
-        shopify_product = shopify_product_obj.search([("variant_id", "=", variant_id),
-                                                      ("shopify_instance_id", "=", shopify_instance.id)],
-                                                     limit=1)
+        shopify_product = search_product(shopify_product_obj, "variant", variant_id,
+                                         [("variant_id", "=", variant_id),
+                                          ("shopify_instance_id", "=", shopify_instance.id)])
 
         if shopify_instance.shopify_sync_product_with == "sku" and product_sku:
             if not shopify_product:
-                shopify_product = shopify_product_obj.search([("default_code", "=", product_sku),
-                                                              ("variant_id", "=", False),
-                                                              ("shopify_instance_id", "=", shopify_instance.id)],
-                                                             limit=1)
+                shopify_product = search_product(shopify_product_obj, "sku", product_sku,
+                                                 [("default_code", "=", product_sku),
+                                                  ("variant_id", "=", False),
+                                                  ("shopify_instance_id", "=", shopify_instance.id)])
             if not shopify_product:
-                shopify_product = shopify_product_obj.search(
-                    [("product_id.default_code", "=", product_sku),
-                     ("variant_id", "=", False),
-                     ("shopify_instance_id", "=", shopify_instance.id)], limit=1)
+                shopify_product = search_product(shopify_product_obj, "product_sku", product_sku,
+                                                 [("product_id.default_code", "=", product_sku),
+                                                  ("variant_id", "=", False),
+                                                  ("shopify_instance_id", "=", shopify_instance.id)])
             if not shopify_product:
-                odoo_product = odoo_product.search([("default_code", "=", product_sku)], limit=1)
+                odoo_product = search_product(odoo_product, "odoo_sku", product_sku,
+                                              [("default_code", "=", product_sku)])
 
         elif shopify_instance.shopify_sync_product_with == "barcode" and barcode:
             if not shopify_product:
-                shopify_product = shopify_product_obj.search(
-                    [("product_id.barcode", "=", barcode),
-                     ("variant_id", "=", False),
-                     ("shopify_instance_id", "=", shopify_instance.id)], limit=1)
+                shopify_product = search_product(shopify_product_obj, "product_barcode", barcode,
+                                                 [("product_id.barcode", "=", barcode),
+                                                  ("variant_id", "=", False),
+                                                  ("shopify_instance_id", "=", shopify_instance.id)])
             if not shopify_product:
-                odoo_product = odoo_product.search([("barcode", "=", barcode)], limit=1)
+                odoo_product = search_product(odoo_product, "odoo_barcode", barcode, [("barcode", "=", barcode)])
 
         elif shopify_instance.shopify_sync_product_with == "sku_or_barcode":
             if product_sku:
                 if not shopify_product:
-                    shopify_product = shopify_product_obj.search([("default_code", "=", product_sku),
-                                                                  ("variant_id", "=", False),
-                                                                  ("shopify_instance_id", "=", shopify_instance.id)],
-                                                                 limit=1)
+                    shopify_product = search_product(shopify_product_obj, "sku", product_sku,
+                                                     [("default_code", "=", product_sku),
+                                                      ("variant_id", "=", False),
+                                                      ("shopify_instance_id", "=", shopify_instance.id)])
                 if not shopify_product:
-                    shopify_product = shopify_product_obj.search([("product_id.default_code", "=", product_sku),
-                                                                  ("variant_id", "=", False),
-                                                                  ("shopify_instance_id", "=", shopify_instance.id)],
-                                                                 limit=1)
+                    shopify_product = search_product(shopify_product_obj, "product_sku", product_sku,
+                                                     [("product_id.default_code", "=", product_sku),
+                                                      ("variant_id", "=", False),
+                                                      ("shopify_instance_id", "=", shopify_instance.id)])
                 if not shopify_product:
-                    odoo_product = odoo_product.search([("default_code", "=", product_sku)], limit=1)
+                    odoo_product = search_product(odoo_product, "odoo_sku", product_sku,
+                                                  [("default_code", "=", product_sku)])
 
             if not odoo_product and not shopify_product and barcode:
-                shopify_product = shopify_product_obj.search(
-                    [("product_id.barcode", "=", barcode),
-                     ("shopify_instance_id", "=", shopify_instance.id)], limit=1)
+                shopify_product = search_product(shopify_product_obj, "any_product_barcode", barcode,
+                                                 [("product_id.barcode", "=", barcode),
+                                                  ("shopify_instance_id", "=", shopify_instance.id)])
                 if not shopify_product:
-                    odoo_product = odoo_product.search([("barcode", "=", barcode)], limit=1)
+                    odoo_product = search_product(odoo_product, "odoo_barcode", barcode, [("barcode", "=", barcode)])
 
         if shopify_product and not odoo_product:
             odoo_product = shopify_product.product_id
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger("Shopify Webhook Inbox")
+
+
+class ShopifyWebhookInboxEpt(models.Model):
+    _name = "shopify.webhook.inbox.ept"
+    _description = "Shopify Webhook Inbox"
+    _order = "id"
+    _log_access = False
+
+    instance_id = fields.Many2one("shopify.instance.ept", string="Instance", ondelete="cascade", readonly=True)
+    webhook_id = fields.Char(string="Webhook Event ID", readonly=True,
+                             help="X-Shopify-Webhook-Id of the event, the retries of Shopify have the same ID.")
+    topic = fields.Char(readonly=True, help="X-Shopify-Topic of the event, e.g. orders/updated.")
+    route = fields.Char(readonly=True, help="Odoo route which has received the event.")
+    payload = fields.Text(readonly=True)
+    state = fields.Selection([("pending", "Pending"), ("processing", "Processing"), ("done", "Done"),
+                              ("failed", "Failed")], default="pending", index=True, readonly=True)
+    received_at = fields.Datetime(readonly=True)
+    claimed_at = fields.Datetime(readonly=True)
+    processed_at = fields.Datetime(readonly=True)
+    error = fields.Text(readonly=True)
+    attempts = fields.Integer(readonly=True, help="Number of times the event has been claimed to be processed.")
+    next_attempt_at = fields.Datetime(readonly=True, help="The failed event is retried after this time.")
+
+    _sql_constraints = [("unique_webhook_event", "unique(instance_id, webhook_id)",
+                         "Webhook event is already received for this instance.")]
+
+    @api.model
+    def store_webhook_event_ept(self, instance, route, webhook_id, topic, payload):
+        """
+        This method is used to save the raw webhook event with a single insert, so the controller can answer Shopify
+        immediately. Retries of an event already received are ignored.
+        :param instance: Record of the Shopify instance.
+        :param route: Route of the webhook controller.
+        :param webhook_id: Value of the X-Shopify-Webhook-Id header.
+        :param topic: Value of the X-Shopify-Topic header.
+        :param payload: Raw body of the request.
+        @return: True if the event is new.
+        """
+        self._cr.execute("""
+            INSERT INTO shopify_webhook_inbox_ept (instance_id, webhook_id, topic, route, payload, state, received_at)
+            VALUES (%s, %s, %s, %s, %s, 'pending', NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (instance_id, webhook_id) DO NOTHING
+        """, (instance.id, webhook_id, topic, route, payload))
+        return bool(self._cr.rowcount)
+
+    @api.model
+    def get_webhook_retry_params(self):
+        """
+        This method is used to get the number of attempts of an event and the delay before its first retry, in
+        seconds, the delay doubles after every failed attempt, up to one hour.
+        @return: tuple (max attempts, retry delay)
+        """
+        ir_config_parameter_obj = self.env["ir.config_parameter"].sudo()
+        max_attempts = int(ir_config_parameter_obj.get_param("shopify_ept.webhook_inbox_max_attempts", 5) or 5)
+        retry_delay = int(ir_config_parameter_obj.get_param("shopify_ept.webhook_inbox_retry_delay", 60) or 60)
+        return max(max_attempts, 1), max(retry_delay, 1)
+
+    @api.model
+    def claim_webhook_events(self, limit):
+        """
+        This method is used to claim a batch of pending events, whose retry time is reached, in a committed
+        transaction. Events claimed by a drainer which has crashed are claimed again after 15 minutes, unless they
+        have used all their attempts, then they are failed.
+        :param limit: Number of events to claim.
+        @return: Records of the claimed events.
+        """
+        lease = datetime.now() - timedelta(minutes=15)
+        max_attempts = self.get_webhook_retry_params()[0]
+        self._cr.execute("""
+            UPDATE shopify_webhook_inbox_ept
+            SET state = 'failed', processed_at = NOW() AT TIME ZONE 'UTC', next_attempt_at = NULL, error = %s
+            WHERE state = 'processing' AND claimed_at < %s AND attempts >= %s
+        """, ("The event is not processed after %s attempts, the last one did not finish." % max_attempts, lease,
+              max_attempts))
+        self._cr.execute("""
+            UPDATE shopify_webhook_inbox_ept
+            SET state = 'processing', claimed_at = NOW() AT TIME ZONE 'UTC', attempts = COALESCE(attempts, 0) + 1
+            WHERE id IN (
+                SELECT id FROM shopify_webhook_inbox_ept
+                WHERE (state = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= NOW() AT TIME ZONE 'UTC'))
+                OR (state = 'processing' AND claimed_at < %s)
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, (lease, limit))
+        event_ids = sorted(row[0] for row in self._cr.fetchall())
+        self._cr.commit()
+        return self.browse(event_ids)
+
+    def auto_process_shopify_webhook_inbox(self):
+        """
+        This method is used to drain the webhook inbox in batches, off the HTTP workers. It will be called from the
+        scheduled action.
+        """
+        ir_config_parameter_obj = self.env["ir.config_parameter"].sudo()
+        batch_size = int(ir_config_parameter_obj.get_param("shopify_ept.webhook_inbox_batch_size", 100) or 100)
+        cron_time = self.env["shopify.instance.ept"].get_shopify_cron_execution_time(
+            "shopify_ept.process_shopify_webhook_inbox")
+        start = time.time()
+        while time.time() - start < cron_time - 60:
+            events = self.claim_webhook_events(batch_size)
+            if not events:
+                break
+            events.process_webhook_events()
+        return True
+
+    def process_webhook_events(self):
+        """
+        This method is used to process the claimed events, in the order Shopify has sent them. A failed event is
+        retried after a delay doubling at every attempt, it stays failed once it has used all its attempts.
+        """
+        max_attempts, retry_delay = self.get_webhook_retry_params()
+        for event in self:
+            try:
+                event.process_webhook_event()
+                event.write({"state": "done", "processed_at": datetime.now(), "payload": False, "error": False,
+                             "next_attempt_at": False})
+            except Exception as error:
+                self._cr.rollback()
+                _logger.exception("Webhook event %s of topic %s is not processed, attempt %s of %s.",
+                                  event.webhook_id, event.topic, event.attempts, max_attempts)
+                values = {"processed_at": datetime.now(), "error": str(error)}
+                if event.attempts < max_attempts:
+                    delay = min(retry_delay * 2 ** (max(event.attempts, 1) - 1), 3600)
+                    values.update({"state": "pending", "next_attempt_at": datetime.now() + timedelta(seconds=delay)})
+                else:
+                    values.update({"state": "failed", "next_attempt_at": False})
+                event.write(values)
+            self._cr.commit()
+        return True
+
+    def process_webhook_event(self):
+        """
+        This method is used to process one event, with the same processes as the synchronous webhook controller.
+        """
+        instance = self.instance_id
+        if not instance.active:
+            return True
+        res = json.loads(self.payload or "{}")
+        if self.route in ("shopify_odoo_webhook_for_product_create", "shopify_odoo_webhook_for_product_update",
+                          "shopify_odoo_webhook_for_product_delete"):
+            self.env["shopify.product.data.queue.ept"].process_product_webhook_ept(res, instance, self.route)
+        elif self.route in ("shopify_odoo_webhook_for_customer_create", "shopify_odoo_webhook_for_customer_update"):
+            if res.get("first_name") or res.get("last_name"):
+                self.env["shopify.process.import.export"].webhook_customer_create_process(res, instance)
+        elif self.route == "shopify_odoo_webhook_for_orders_partially_updated":
+            self.env["sale.order"].process_order_webhook_ept(res, instance)
+        return True
+
+    @api.autovacuum
+    def _gc_processed_webhook_events(self):
+        """
+        Deletes the processed events after 7 days, their ID is kept until then to ignore the retries of Shopify.
+        """
+        self._cr.execute("""
+            DELETE FROM shopify_webhook_inbox_ept
+            WHERE state = 'done' AND processed_at < NOW() AT TIME ZONE 'UTC' - INTERVAL '7 days'
+        """)
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # See LICENSE file for full copyright and licensing details.
 
-from odoo import models, fields
+from odoo import models, fields, api
 
 
 class StockPicking(models.Model):
@@ -19,6 +19,30 @@ class StockPicking(models.Model):
                                                                  "necessary actions")
     shopify_fulfillment_id = fields.Char(string='Shopify Fulfillment Id')
 
+    ORDER_KPI_FIELDS = {"updated_in_shopify", "state", "location_dest_id", "group_id"}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        Inherited method for marking the KPI days of the orders of the created pickings to refresh.
+        """
+        pickings = super(StockPicking, self).create(vals_list)
+        self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(pickings.sale_id)
+        return pickings
+
+    def write(self, vals):
+        """
+        Inherited method for marking the KPI days of the orders of the pickings to refresh when their shipment in
+        Shopify can change.
+        """
+        kpi_changed = self.ORDER_KPI_FIELDS.intersection(vals)
+        if kpi_changed:
+            self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(self.sale_id)
+        res = super(StockPicking, self).write(vals)
+        if kpi_changed:
+            self.env["shopify.order.kpi.ept"].mark_orders_kpi_dirty_ept(self.sale_id)
+        return res
+
     def manually_update_shipment(self):
         """
         This is used to manually update order fulfillment and tracking reference details to Shopify store.
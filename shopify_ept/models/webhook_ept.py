@@ -2,13 +2,23 @@
 # See LICENSE file for full copyright and licensing details.
 
 import logging
+import threading
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError
 from .. import shopify
 
 _logger = logging.getLogger("Shopify Webhook")
 
+# Lookups and misses of the webhook route cache in this process, a hit is a lookup which is not a miss.
+_route_cache_lock = threading.Lock()
+_route_cache_stats = {"lookups": 0, "misses": 0}
+
+
+def _count_route_cache(key):
+    with _route_cache_lock:
+        _route_cache_stats[key] += 1
+
 class ShopifyWebhookEpt(models.Model):
     _name = "shopify.webhook.ept"
     _description = 'Shopify Webhook'
@@ -19,6 +29,10 @@ class ShopifyWebhookEpt(models.Model):
                                        ('products/update', 'When Product is Updated'),
                                        ('products/delete', 'When Product is Delete'),
                                        ('orders/updated', 'When Order is Created/Updated'),
+                                       ('fulfillment_orders/moved', 'When Fulfillment Order is Moved'),
+                                       ('fulfillment_orders/split', 'When Fulfillment Order is Split'),
+                                       ('fulfillment_orders/merged', 'When Fulfillment Orders are Merged'),
+                                       ('fulfillment_orders/cancelled', 'When Fulfillment Order is Cancelled'),
                                        ('customers/create', 'When Customer is Created'),
                                        ('customers/update', 'When Customer is Updated'),
                                        ])
@@ -26,6 +40,81 @@ class ShopifyWebhookEpt(models.Model):
     delivery_url = fields.Text("Delivery URL")
     instance_id = fields.Many2one("shopify.instance.ept", string="Webhook created by this Shopify Instance.",
                                   ondelete="cascade")
+    webhook_route = fields.Char(compute="_compute_webhook_route", store=True, index=True,
+                                help="Odoo route which receives the events of this webhook.")
+
+    def init(self):
+        """
+        Creates the sequence whose value is the version of the webhook route cache.
+        """
+        self._cr.execute("CREATE SEQUENCE IF NOT EXISTS shopify_webhook_route_cache_seq")
+
+    @api.depends("webhook_action")
+    def _compute_webhook_route(self):
+        for webhook in self:
+            webhook.webhook_route = webhook.webhook_action and webhook.get_route().lstrip("/") or False
+
+    @api.model
+    def resolve_webhook_instance(self, shop_domain, route):
+        """
+        This method is used to find the instance of a received webhook, with the cache of the webhook routes.
+        :param shop_domain: Value of the X-Shopify-Shop-Domain header.
+        :param route: Route which has received the webhook.
+        @return: Tuple of the instance id and True if the instance and its webhook are active.
+        """
+        _count_route_cache("lookups")
+        self._cr.execute("SELECT last_value FROM shopify_webhook_route_cache_seq")
+        version = self._cr.fetchone()[0]
+        return self._get_webhook_route_info((shop_domain or "").lower(), route, version)
+
+    @api.model
+    @tools.ormcache("shop_domain", "route", "version")
+    def _get_webhook_route_info(self, shop_domain, route, version):
+        _count_route_cache("misses")
+        instance = self.env["shopify.instance.ept"].sudo().with_context(active_test=False).search(
+            [("shopify_shop_domain", "=", shop_domain)], limit=1)
+        if not instance:
+            return False, False
+        # Several topics share a route, e.g. fulfillment_orders/*, the route is active when any of them is active.
+        webhook = self.sudo().search([("webhook_route", "=", route), ("instance_id", "=", instance.id),
+                                      ("state", "=", "active")], limit=1)
+        return instance.id, bool(instance.active and webhook)
+
+    @api.model
+    def clear_webhook_route_cache(self):
+        """
+        This method is used to clear the cache of the webhook routes in every worker, when an instance or a webhook
+        is changed. The version of the cache, which is part of its key, is increased once the change is committed,
+        so the other caches of the registry are kept and no worker caches the data of before the change with the
+        new version.
+        """
+        registry = self.env.registry
+
+        def _increase_route_cache_version():
+            with registry.cursor() as cr:
+                cr.execute("SELECT nextval('shopify_webhook_route_cache_seq')")
+
+        self.env.cr.postcommit.add(_increase_route_cache_version)
+
+    @api.model
+    def get_webhook_route_cache_stats(self):
+        """
+        This method is used to read the counters of the webhook route cache of this process.
+        @return: Dictionary with the lookups, hits and misses.
+        """
+        with _route_cache_lock:
+            stats = dict(_route_cache_stats)
+        stats["hits"] = stats["lookups"] - stats["misses"]
+        return stats
+
+    def write(self, vals):
+        """
+        Inherited for clearing the cache of the webhook routes, when the state, action or instance changes.
+        """
+        res = super(ShopifyWebhookEpt, self).write(vals)
+        if {"state", "webhook_action", "instance_id"} & set(vals):
+            self.clear_webhook_route_cache()
+        return res
 
     @api.model
     def unlink(self):
@@ -52,6 +141,7 @@ class ShopifyWebhookEpt(models.Model):
                     raise UserError(_("Something went wrong while deleting the webhook."))
             _logger.info("Deleted %s webhook from Odoo.", record.webhook_action)
         unlink_main = super(ShopifyWebhookEpt, self).unlink()
+        self.clear_webhook_route_cache()
         self.deactivate_auto_create_webhook(instance)
         return unlink_main
 
@@ -96,6 +186,7 @@ class ShopifyWebhookEpt(models.Model):
 
             result = super(ShopifyWebhookEpt, self).create(val)
             result.get_webhook()
+        self.clear_webhook_route_cache()
         return result
 
     def get_route(self):
@@ -112,6 +203,8 @@ class ShopifyWebhookEpt(models.Model):
             route = "/shopify_odoo_webhook_for_product_delete"
         elif webhook_action == 'orders/updated':
             route = "/shopify_odoo_webhook_for_orders_partially_updated"
+        elif webhook_action and webhook_action.startswith('fulfillment_orders/'):
+            route = "/shopify_odoo_webhook_for_fulfillment_orders"
         elif webhook_action == 'customers/create':
             route = "/shopify_odoo_webhook_for_customer_create"
         elif webhook_action == 'customers/update':
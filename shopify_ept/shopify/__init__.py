@@ -4,4 +4,6 @@ from .resources import *
 from .limits import Limits
 from .api_version import *
 from .api_access import *
-from .collection import PaginatedIterator
+from .collection import PaginatedIterator, RawPageCursor
+from . import transport
+from . import rate_limit
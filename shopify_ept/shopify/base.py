@@ -5,11 +5,14 @@ from . import mixins as mixins
 from .. import shopify
 import threading
 import sys
+import time
 from six.moves import urllib
 import six
 
 from .collection import PaginatedCollection
 from . pyactiveresource.collection import Collection
+from . import transport as shopify_transport
+from . import rate_limit
 
 # Store the response from the last request in the connection object
 
@@ -17,14 +20,37 @@ from . pyactiveresource.collection import Collection
 class ShopifyConnection(pyactiveresource.connection.Connection):
     response = None
 
-    def _open(self, *args, **kwargs):
-        self.response = None
-        try:
-            self.response = super(ShopifyConnection, self)._open(*args, **kwargs)
-        except pyactiveresource.connection.ConnectionError as err:
-            self.response = err.response
-            raise
-        return self.response
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("transport", shopify_transport.get_default_transport())
+        # The limiter is chosen by the database of the thread creating the connection, Odoo sets it on its threads.
+        self.rate_limit_key = kwargs.pop("rate_limit_key", None) or getattr(threading.current_thread(), "dbname",
+                                                                            None)
+        super(ShopifyConnection, self).__init__(*args, **kwargs)
+
+    def _open(self, method, path, headers=None, data=None):
+        # Every call is paced by the leaky bucket of its API for the shop, throttled calls are retried with
+        # backoff here only.
+        limiter = rate_limit.get_limiter(self.rate_limit_key)
+        host = urllib.parse.urlparse(self.site).netloc
+        api, query_key = rate_limit.request_api(path, data)
+        cost = limiter.estimate_cost(api, query_key)
+        attempt = 0
+        while True:
+            limiter.acquire(host, cost, api)
+            self.response = None
+            try:
+                self.response = super(ShopifyConnection, self)._open(method, path, headers=headers, data=data)
+            except pyactiveresource.connection.ConnectionError as err:
+                self.response = err.response
+                if err.response.code == 429 and attempt < limiter.max_retries:
+                    delay = limiter.backoff(host, attempt, err.response, api)
+                    attempt += 1
+                    self.log.info("Shopify API call limit reached, retry %s in %s seconds.", attempt, delay)
+                    time.sleep(delay)
+                    continue
+                raise
+            limiter.update_from_response(host, self.response, api, query_key)
+            return self.response
 
 
 # Inherit from pyactiveresource's metaclass in order to use ShopifyConnection
@@ -1,8 +1,20 @@
 from . pyactiveresource.collection import Collection
 from six.moves.urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
 import cgi
 
 
+def parse_link_header(values):
+    """Parse a Link header into a dict of urls keyed by their rel (next, previous)."""
+    result = {}
+    if not values:
+        return result
+    for value in values.split(", "):
+        link, rel = value.split("; ")
+        result[rel.split('"')[1]] = link[1:-1]
+    return result
+
+
 class PaginatedCollection(Collection):
     """
     A subclass of Collection which allows cycling through pages of
@@ -46,14 +58,7 @@ class PaginatedCollection(Collection):
             return {}
 
         values = self.metadata["headers"].get("Link", self.metadata["headers"].get("link", None))
-        if values is None:
-            return {}
-
-        result = {}
-        for value in values.split(", "):
-            link, rel = value.split("; ")
-            result[rel.split('"')[1]] = link[1:-1]
-        return result
+        return parse_link_header(values)
 
     def has_previous_page(self):
         """Returns true if the current page has any previous pages before it."""
@@ -156,3 +161,62 @@ class PaginatedIterator(object):
                 current_page = current_page.next_page(no_cache=True)
             except IndexError:
                 return
+
+
+class RawPageCursor(object):
+    """
+    This class iterates over a REST collection as plain dicts, one page at a
+    time, without building ActiveResource objects. Every page body is decoded
+    once and only the current and the next page are kept in memory. While the
+    current page is consumed, the next one is fetched on a background thread.
+
+    >>> from shopify import Order, RawPageCursor
+    >>> for order in RawPageCursor(Order, status="any", limit=250):
+    ...     do_something(order["id"])
+    ...
+    # every order of every page is a dict
+    """
+
+    def __init__(self, resource_class, prefetch=True, **kwargs):
+        self.resource_class = resource_class
+        self.prefetch = prefetch
+        prefix_options, query_options = resource_class._split_options(kwargs)
+        self.path = resource_class._collection_path(prefix_options, query_options)
+        self.headers = dict(resource_class.headers)
+
+    def _fetch(self, connection, path):
+        response = connection.get(path, self.headers)
+        elements = self.resource_class.format.decode(response.body)
+        if isinstance(elements, dict):
+            elements = [elements]
+        links = parse_link_header(response.headers.get("Link") or response.headers.get("link"))
+        return elements, links.get("next")
+
+    def pages(self):
+        """Iterate over pages, returning the list of dicts of one page at a time."""
+        connection = self.resource_class.connection
+        page, next_url = self._fetch(connection, self.path)
+        if not self.prefetch:
+            while True:
+                yield page
+                if not next_url:
+                    return
+                page, next_url = self._fetch(connection, next_url)
+
+        # Connections hold the last response, so the background thread gets its own one for the same shop.
+        prefetch_connection = connection.__class__(connection.site, connection.user, connection.password,
+                                                   connection.timeout, connection.format,
+                                                   transport=connection.transport,
+                                                   rate_limit_key=connection.rate_limit_key)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while True:
+                future = executor.submit(self._fetch, prefetch_connection, next_url) if next_url else None
+                yield page
+                if future is None:
+                    return
+                page, next_url = future.result()
+
+    def __iter__(self):
+        for page in self.pages():
+            for element in page:
+                yield element
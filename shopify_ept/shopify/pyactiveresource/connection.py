@@ -189,7 +189,7 @@ class Connection(object):
     """A connection object to interface with REST services."""
 
     def __init__(self, site, user=None, password=None, timeout=None,
-                 format=formats.JSONFormat):
+                 format=formats.JSONFormat, transport=None):
 
         """Initialize a new Connection object.
 
@@ -199,6 +199,8 @@ class Connection(object):
             password: password for basic authentication.
             timeout: socket timeout.
             format: format object for en/decoding resource data.
+            transport: object with an open(request, timeout) method used
+                instead of urllib.request.urlopen.
         """
 
         if site is None:
@@ -214,6 +216,7 @@ class Connection(object):
         self.timeout = timeout
         self.log = logging.getLogger('pyactiveresource.connection')
         self.format = format
+        self.transport = transport
 
     def _parse_site(self, site):
         """Retrieve the auth information and base url for a site.
@@ -312,6 +315,8 @@ class Connection(object):
             urllib.error.HTTPError on server errors.
             urllib.error.URLError on IO errors.
         """
+        if self.transport is not None:
+          return self.transport.open(request, timeout=self.timeout)
         if _urllib_has_timeout():
           return urllib.request.urlopen(request, timeout=self.timeout)
         else:
@@ -0,0 +1,278 @@
+"""Leaky bucket rate limiting of the Shopify API calls.
+
+Shopify meters REST calls with a leaky bucket per shop, reported in the
+X-Shopify-Shop-Api-Call-Limit header (e.g. "32/40"), and GraphQL queries
+with a separate cost budget reported in extensions.cost.throttleStatus of
+the body. The limiter keeps an estimate of both buckets per shop host in
+process memory, waits before a call would overflow them and retries 429
+responses with a bounded exponential backoff. A REST call reserves one
+call, a GraphQL query the cost Shopify requested for its last run.
+
+The buckets can be synchronised with a shared store (see MemoryStore for
+its interface), so the processes of a database pace each other. They are
+synchronised every sync_interval seconds and after every 429 only, the
+calls in between use the bucket of the process.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+_logger = logging.getLogger("Shopify Rate Limit")
+
+CALL_LIMIT_HEADER = "X-Shopify-Shop-Api-Call-Limit"
+RETRY_AFTER_HEADER = "Retry-After"
+
+REST = "rest"
+GRAPHQL = "graphql"
+
+
+def _get_header(headers, name):
+    if not headers:
+        return None
+    return headers.get(name) or headers.get(name.lower())
+
+
+def request_api(path, data=None):
+    """Return the API of a request and the key of its GraphQL query: (api, query key or None)."""
+    if not str(path).split("?", 1)[0].endswith("/graphql.json"):
+        return REST, None
+    try:
+        query = json.loads(data.decode("utf-8") if isinstance(data, bytes) else data).get("query") or ""
+    except (ValueError, TypeError, AttributeError):
+        query = ""
+    return GRAPHQL, hashlib.sha1(query.encode("utf-8")).hexdigest()
+
+
+class MemoryStore(object):
+    """Keeps the bucket state of every host and API in this process.
+
+    A shared store has the same interface and is given to the limiter as
+    its shared_store, e.g. a store backed by a database table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def transact(self, key, func):
+        """Run func(state) atomically and save the new state it returns.
+
+        Args:
+            key: Tuple (shop host, API) the bucket belongs to.
+            func: Callable taking the state dict (or None) and returning a
+                tuple (result, new_state).
+        Returns:
+            The result of func.
+        """
+        with self._lock:
+            result, state = func(self._states.get(key))
+            self._states[key] = state
+            return result
+
+    def sync(self, key, state):
+        """Merge the state into the stored one and return the merged state."""
+        return self.transact(key, lambda stored: (merge_states(stored, state),) * 2)
+
+
+def leak_state(state, now):
+    """Return a copy of the state with the calls leaked until now."""
+    state = dict(state)
+    elapsed = max(now - state["updated_at"], 0.0)
+    state["level"] = max(state["level"] - elapsed * state["leak_rate"], 0.0)
+    state["updated_at"] = max(now, state["updated_at"])
+    return state
+
+
+def merge_states(state, other):
+    """Merge two states of the same bucket, keeping the fullest level and the longest block."""
+    if not state or not other:
+        return dict(state or other)
+    now = max(state["updated_at"], other["updated_at"])
+    state, other = leak_state(state, now), leak_state(other, now)
+    state["level"] = max(state["level"], other["level"])
+    state["blocked_until"] = max(state["blocked_until"], other["blocked_until"])
+    state["capacity"] = max(state["capacity"], other["capacity"])
+    state["leak_rate"] = max(state["leak_rate"], other["leak_rate"])
+    return state
+
+
+class LeakyBucketLimiter(object):
+    """Paces the REST calls and GraphQL queries of every shop host below their limits."""
+
+    # Standard shops: 40 calls leaking 2/s for REST, 1000 points restoring 50/s for GraphQL.
+    DEFAULT_BUCKETS = {REST: (40, 2.0), GRAPHQL: (1000, 50.0)}
+
+    def __init__(self, store=None, capacity=40, leak_rate=2.0, threshold=0.8, max_retries=5,
+                 base_delay=1.0, max_delay=30.0, shared_store=None, sync_interval=5.0, graphql_cost=50.0):
+        """Initialize the limiter.
+
+        Args:
+            store: Object with a transact(key, func) method holding the state
+                of the buckets of the process.
+            capacity: Default REST bucket size, until the shop reports its own.
+            leak_rate: Default REST calls leaked per second.
+            threshold: Part of the bucket which may be used before waiting.
+            max_retries: Number of retries of a throttled (429) call.
+            base_delay: First backoff delay in seconds.
+            max_delay: Longest backoff delay in seconds.
+            shared_store: Optional object with a sync(key, state) method
+                merging the state with the one of the other processes.
+            sync_interval: Seconds between two synchronisations of a bucket
+                with the shared store.
+            graphql_cost: Points reserved for a GraphQL query which was
+                never sent yet.
+        """
+        self.store = store or MemoryStore()
+        self.shared_store = shared_store
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.threshold = threshold
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sync_interval = sync_interval
+        self.graphql_cost = graphql_cost
+        self._synced_at = {}
+        self._query_costs = {}
+
+    def _new_state(self, api):
+        capacity, leak_rate = (self.capacity, self.leak_rate) if api == REST else self.DEFAULT_BUCKETS[api]
+        return {"level": 0.0, "capacity": float(capacity), "leak_rate": float(leak_rate),
+                "updated_at": time.time(), "blocked_until": 0.0}
+
+    def _leak(self, state, now, api=REST):
+        return leak_state(state or self._new_state(api), now)
+
+    def estimate_cost(self, api=REST, query_key=None):
+        """Return the cost to reserve for a call: 1 for REST, the last requested cost of the query for GraphQL."""
+        if api == REST:
+            return 1.0
+        return self._query_costs.get(query_key, self.graphql_cost)
+
+    def reserve(self, host, cost=1.0, api=REST):
+        """Reserve room for a call and return the seconds to wait before retrying, 0 when reserved."""
+
+        def _reserve(state):
+            now = time.time()
+            state = self._leak(state, now, api)
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now, state
+            allowed = state["capacity"] * self.threshold
+            if state["level"] + cost <= allowed or state["level"] == 0.0:
+                state["level"] += cost
+                return 0.0, state
+            return (state["level"] + cost - allowed) / state["leak_rate"], state
+
+        self._sync(host, api)
+        return self.store.transact((host, api), _reserve)
+
+    def acquire(self, host, cost=1.0, api=REST):
+        """Block until the bucket of the host has room for a call of the given cost."""
+        waited = 0.0
+        while True:
+            wait = self.reserve(host, cost, api)
+            if not wait:
+                return waited
+            wait = min(wait, self.max_delay)
+            waited += wait
+            time.sleep(wait)
+
+    def update_from_response(self, host, response, api=REST, query_key=None):
+        """Synchronise the bucket of the API with the limit reported by Shopify."""
+        if api == REST:
+            call_limit = _get_header(getattr(response, "headers", None), CALL_LIMIT_HEADER)
+            if not call_limit:
+                return
+            used, size = call_limit.split("/")
+            # Standard shops leak 2 calls/s from a 40 bucket, Plus shops 20 calls/s from 400.
+            values = {"level": float(used), "capacity": float(size),
+                      "leak_rate": max(float(size) / 20.0, self.leak_rate)}
+        else:
+            cost = self._graphql_cost(response)
+            throttle_status = cost.get("throttleStatus") or {}
+            maximum = float(throttle_status.get("maximumAvailable") or 0.0)
+            restore_rate = float(throttle_status.get("restoreRate") or 0.0)
+            if cost.get("requestedQueryCost") is not None and query_key:
+                if len(self._query_costs) >= 1000:
+                    self._query_costs.clear()
+                self._query_costs[query_key] = float(cost["requestedQueryCost"])
+            if not maximum or not restore_rate:
+                return
+            values = {"level": maximum - float(throttle_status.get("currentlyAvailable") or 0.0),
+                      "capacity": maximum, "leak_rate": restore_rate}
+
+        def _update(state):
+            state = self._leak(state, time.time(), api)
+            state.update(values)
+            return None, state
+
+        self.store.transact((host, api), _update)
+
+    def _graphql_cost(self, response):
+        body = getattr(response, "body", None)
+        if not body or b'"cost"' not in body:
+            return {}
+        try:
+            return json.loads(body.decode("utf-8")).get("extensions", {}).get("cost") or {}
+        except (ValueError, AttributeError):
+            return {}
+
+    def backoff(self, host, attempt, response=None, api=REST):
+        """Block the bucket of the host after a 429 and return the seconds to sleep."""
+        retry_after = _get_header(getattr(response, "headers", None), RETRY_AFTER_HEADER)
+        delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+        if retry_after:
+            delay = min(max(float(retry_after), delay), self.max_delay)
+
+        def _block(state):
+            now = time.time()
+            state = self._leak(state, now, api)
+            state["level"] = state["capacity"]
+            state["blocked_until"] = max(state["blocked_until"], now + delay)
+            return None, state
+
+        self.store.transact((host, api), _block)
+        self._sync(host, api, force=True)
+        return delay
+
+    def _sync(self, host, api, force=False):
+        """Merge the bucket with the shared store, at most once per sync_interval unless forced."""
+        if not self.shared_store:
+            return
+        key = (host, api)
+        now = time.time()
+        if not force and now - self._synced_at.get(key, 0.0) < self.sync_interval:
+            return
+        self._synced_at[key] = now
+        state = self.store.transact(key, lambda state: (self._leak(state, now, api),) * 2)
+        try:
+            shared = self.shared_store.sync(key, state)
+        except Exception as error:
+            _logger.info("Shopify rate limit of %s is not synchronised. Error: %s", host, error)
+            return
+        if shared:
+            self.store.transact(key, lambda state: (None, merge_states(self._leak(state, time.time(), api),
+                                                                        shared)))
+
+
+_limiter = LeakyBucketLimiter()
+# Limiters set for a key, e.g. the database the connections work for, so their stores never mix.
+_limiters = {}
+
+
+def get_limiter(key=None):
+    """Return the limiter set for the key, or the default one of the process."""
+    return _limiters.get(key, _limiter) if key is not None else _limiter
+
+
+def set_limiter(limiter, key=None):
+    """Set the limiter used by the ShopifyConnections of the key, e.g. with a store shared between workers.
+    Without a key, it replaces the default limiter of the process."""
+    global _limiter
+    if key is None:
+        _limiter = limiter
+    else:
+        _limiters[key] = limiter
@@ -1,6 +1,5 @@
 from ... import shopify
 from ..base import ShopifyResource
-from six.moves import urllib
 import json
 
 
@@ -15,18 +14,15 @@ class GraphQL:
             merged_headers.update(header)
         return merged_headers
 
-    def execute(self, query, variables=None, operation_name=None):
+    def execute(self, query, variables=None, operation_name=None, connection=None):
+        """Send the query, through the given connection or the one of the current thread. A thread which has no
+        active session must be given a connection, e.g. a copy of the connection of the thread which started it."""
         endpoint = self.endpoint
         default_headers = {"Accept": "application/json", "Content-Type": "application/json"}
         headers = self.merge_headers(default_headers, self.headers)
         data = {"query": query, "variables": variables, "operationName": operation_name}
 
-        req = urllib.request.Request(self.endpoint, json.dumps(data).encode("utf-8"), headers)
-
-        try:
-            response = urllib.request.urlopen(req)
-            return response.read().decode("utf-8")
-        except urllib.error.HTTPError as e:
-            print((e.read()))
-            print("")
-            raise e
+        # Sent through the ShopifyConnection, so the request shares its transport, authentication and pool.
+        connection = connection or ShopifyResource.connection
+        response = connection.post(endpoint, headers, json.dumps(data).encode("utf-8"))
+        return response.body.decode("utf-8")
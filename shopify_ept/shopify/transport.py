@@ -0,0 +1,234 @@
+"""Pluggable HTTP transports used by ShopifyConnection.
+
+The default pyactiveresource connection opens every request through
+urllib.request.urlopen, which costs a new TCP and TLS handshake per call.
+PooledTransport keeps one keep-alive connection per shop host and thread,
+decodes gzip responses and records the latency of every request.
+"""
+
+import gzip
+import socket
+import threading
+import time
+from six.moves import http_client
+from six.moves import urllib
+
+
+class TransportMetrics(object):
+    """Thread safe latency counters of the requests made per shop host."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._local = threading.local()
+
+    def record(self, host, seconds, status=None, error=False):
+        self._local.requests = getattr(self._local, "requests", 0) + 1
+        with self._lock:
+            stats = self._hosts.setdefault(host, {"requests": 0, "errors": 0, "seconds": 0.0,
+                                                  "max_seconds": 0.0, "connections": 0, "status": {}})
+            stats["requests"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            if error:
+                stats["errors"] += 1
+            if status is not None:
+                stats["status"][status] = stats["status"].get(status, 0) + 1
+
+    def record_connection(self, host):
+        with self._lock:
+            stats = self._hosts.setdefault(host, {"requests": 0, "errors": 0, "seconds": 0.0,
+                                                  "max_seconds": 0.0, "connections": 0, "status": {}})
+            stats["connections"] += 1
+
+    def thread_requests(self):
+        """Return the number of requests made by the current thread, to count the calls of a block of code."""
+        return getattr(self._local, "requests", 0)
+
+    def snapshot(self, host=None):
+        """Return a copy of the counters, for one host or for all of them."""
+        with self._lock:
+            result = {}
+            for name, stats in self._hosts.items():
+                if host and name != host:
+                    continue
+                stats = dict(stats, status=dict(stats["status"]))
+                stats["avg_seconds"] = stats["seconds"] / stats["requests"] if stats["requests"] else 0.0
+                result[name] = stats
+            return result
+
+    def reset(self, host=None):
+        with self._lock:
+            if host:
+                self._hosts.pop(host, None)
+            else:
+                self._hosts.clear()
+
+
+metrics = TransportMetrics()
+
+
+class TransportResponse(object):
+    """A fully read HTTP response, compatible with what Connection expects from urlopen."""
+
+    def __init__(self, url, code, msg, headers, body):
+        self.url = url
+        self.code = code
+        self.msg = msg
+        self.headers = headers
+        self._body = body
+
+    def getcode(self):
+        return self.code
+
+    def read(self):
+        return self._body
+
+    def close(self):
+        pass
+
+
+class UrllibTransport(object):
+    """The original transport: one urllib.request.urlopen call per request."""
+
+    def __init__(self, metrics=metrics):
+        self.metrics = metrics
+
+    def open(self, request, timeout=None):
+        host = urllib.parse.urlparse(request.full_url).netloc
+        start = time.time()
+        try:
+            if timeout:
+                response = urllib.request.urlopen(request, timeout=timeout)
+            else:
+                response = urllib.request.urlopen(request)
+        except urllib.error.HTTPError as err:
+            self.metrics.record(host, time.time() - start, err.code)
+            raise
+        except Exception:
+            self.metrics.record(host, time.time() - start, error=True)
+            raise
+        self.metrics.record(host, time.time() - start, response.code)
+        return response
+
+
+class PooledTransport(object):
+    """Keep-alive transport with one persistent connection per shop host and thread.
+
+    Connections are not shared between threads, because http.client
+    connections are not thread safe. A connection which has been idle longer
+    than idle_timeout, or which the server closed, is replaced transparently.
+    """
+
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+    def __init__(self, timeout=None, connect_timeout=None, idle_timeout=50, metrics=metrics):
+        """Initialize the transport.
+
+        Args:
+            timeout: Read timeout in seconds, used when the connection has none.
+            connect_timeout: Timeout in seconds for opening a new connection.
+            idle_timeout: Seconds after which an idle connection is reopened.
+            metrics: TransportMetrics object which records the latency.
+        """
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.metrics = metrics
+        self._local = threading.local()
+
+    def _pool(self):
+        if not hasattr(self._local, "pool"):
+            self._local.pool = {}
+        return self._local.pool
+
+    def _get_connection(self, scheme, netloc, timeout):
+        pool = self._pool()
+        key = (scheme, netloc)
+        connection, last_used = pool.get(key, (None, 0))
+        if connection is not None and time.time() - last_used > self.idle_timeout:
+            connection.close()
+            connection = None
+        if connection is None:
+            connection_class = http_client.HTTPSConnection if scheme == "https" else http_client.HTTPConnection
+            connection = connection_class(netloc, timeout=self.connect_timeout or timeout)
+            self.metrics.record_connection(netloc)
+            reused = False
+        else:
+            reused = True
+        pool[key] = (connection, time.time())
+        return connection, reused
+
+    def _discard_connection(self, scheme, netloc):
+        connection, _last_used = self._pool().pop((scheme, netloc), (None, 0))
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        """Close all the connections of the current thread."""
+        for connection, _last_used in self._pool().values():
+            connection.close()
+        self._pool().clear()
+
+    def open(self, request, timeout=None):
+        """Send a urllib Request over a pooled connection.
+
+        Args:
+            request: A urllib.request.Request object.
+            timeout: Read timeout in seconds.
+        Returns:
+            A TransportResponse object.
+        Raises:
+            urllib.error.URLError on IO errors.
+        """
+        url = request.full_url
+        parts = urllib.parse.urlparse(url)
+        path = urllib.parse.urlunparse(("", "", parts.path or "/", parts.params, parts.query, ""))
+        method = request.get_method()
+        headers = dict(request.header_items())
+        headers.setdefault("Accept-Encoding", "gzip")
+        headers.setdefault("Connection", "keep-alive")
+        timeout = timeout or self.timeout
+
+        start = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            connection, reused = self._get_connection(parts.scheme, parts.netloc, timeout)
+            sent = False
+            try:
+                connection.request(method, path, body=request.data, headers=headers)
+                sent = True
+                if connection.sock is not None and timeout:
+                    connection.sock.settimeout(timeout)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http_client.HTTPException, socket.error) as err:
+                self._discard_connection(parts.scheme, parts.netloc)
+                # A reused keep-alive connection may have been closed by the server meanwhile.
+                retry = reused and attempt == 1 and (not sent or method in self.IDEMPOTENT_METHODS)
+                if retry and not isinstance(err, socket.timeout):
+                    continue
+                self.metrics.record(parts.netloc, time.time() - start, error=True)
+                raise urllib.error.URLError(err)
+
+        if response.getheader("Content-Encoding", "").lower() == "gzip" and body:
+            body = gzip.decompress(body)
+        if response.will_close:
+            self._discard_connection(parts.scheme, parts.netloc)
+        self.metrics.record(parts.netloc, time.time() - start, response.status)
+        return TransportResponse(url, response.status, response.reason, response.msg, body)
+
+
+_default_transport = UrllibTransport()
+
+
+def get_default_transport():
+    return _default_transport
+
+
+def set_default_transport(transport):
+    """Set the transport used by every ShopifyConnection created afterwards."""
+    global _default_transport
+    _default_transport = transport
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# See LICENSE file for full copyright and licensing details.
+import json
+import os
+
+from odoo.tests import TransactionCase, tagged
+
+from ..benchmark.fake_shopify import FakeShopifyServer, FakeShopifyStore
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "bulk_orders.jsonl")
+
+
+@tagged("post_install", "-at_install")
+class TestShopifyBulkOperation(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(FIXTURE) as fixture:
+            bulk_result = [json.loads(line) for line in fixture if line.strip()]
+        cls.server = FakeShopifyServer(FakeShopifyStore(orders=0, products=0, payouts=0),
+                                       bulk_result=bulk_result).start()
+        cls.addClassCleanup(cls.server.stop)
+        cls.instance = cls.env["shopify.instance.ept"].create({
+            "name": "Bulk Operation Test",
+            "shopify_api_key": "key",
+            "shopify_password": "password",
+            "shopify_shared_secret": "secret",
+            "shopify_host": cls.server.url,
+        })
+
+    def setUp(self):
+        super().setUp()
+        # The bulk import commits after every batch, like the scheduled action.
+        self.patch(type(self.env.cr), "commit", lambda cr: None)
+
+    def test_order_queue_lines_from_bulk_result(self):
+        """The queue lines of a bulk order import carry the whole order data, read from the result file only."""
+        bulk_operation = self.env["shopify.bulk.operation.ept"].shopify_submit_bulk_operation(
+            self.instance, "order", "updated_at:>='2024-03-01T00:00:00Z'", queue_type="unshipped")
+        bulk_operation.update_bulk_operation_status()
+        self.assertEqual(bulk_operation.state, "completed")
+
+        self.server.reset()
+        bulk_operation.import_bulk_operation_result()
+        self.assertEqual(bulk_operation.state, "imported")
+        self.assertEqual(bulk_operation.imported_count, 2)
+        self.assertEqual(self.server.snapshot()["endpoints"], {"GET /bulk/:id.jsonl": 1},
+                         "The orders must not be fetched again through the REST API.")
+
+        queue_lines = self.env["shopify.order.data.queue.line.ept"].search(
+            [("shopify_instance_id", "=", self.instance.id)], order="shopify_order_id")
+        self.assertEqual(queue_lines.mapped("shopify_order_id"), ["5100000000001", "5100000000002"])
+        self.assertEqual(queue_lines[0].customer_name, "Jane Doe")
+        self.assertEqual(queue_lines[0].customer_email, "jane@example.com")
+
+        order_data = json.loads(queue_lines[0].order_data)
+        self.assertEqual((order_data["id"], order_data["order_number"]), (5100000000001, 1001))
+        self.assertEqual(order_data["financial_status"], "paid")
+        self.assertIsNone(order_data["fulfillment_status"])
+        self.assertEqual(order_data["customer"]["default_address"]["id"], 7700000000001)
+        self.assertEqual(order_data["shipping_address"]["country_code"], "US")
+
+        first_line, second_line = order_data["line_items"]
+        self.assertEqual((first_line["id"], first_line["product_id"], first_line["variant_id"]),
+                         (1310000000001, 7100000000001, 4100000000001))
+        self.assertEqual((first_line["quantity"], first_line["price"]), (2, "40.00"))
+        self.assertEqual(first_line["discount_allocations"][0]["amount"], "5.00")
+        self.assertEqual(first_line["tax_lines"][0], {
+            "title": "NY State Tax", "rate": 0.04, "price": "3.00",
+            "price_set": {"shop_money": {"amount": "3.00", "currency_code": "USD"},
+                          "presentment_money": {"amount": "3.00", "currency_code": "USD"}}})
+        self.assertEqual(first_line["properties"], [{"name": "Gift wrap", "value": "yes"}])
+        self.assertEqual(second_line["sku"], "CAP")
+        self.assertEqual(order_data["shipping_lines"][0]["price"], "5.00")
+
+        self.assertEqual([(transaction["id"], transaction["kind"], transaction["parent_id"])
+                          for transaction in order_data["transaction"]],
+                         [(8100000000001, "authorization", None), (8100000000002, "capture", 8100000000001)])
+
+        fulfillment_order, = order_data["fulfillment_data"]
+        self.assertEqual((fulfillment_order["id"], fulfillment_order["status"],
+                          fulfillment_order["assigned_location_id"]), (6100000000001, "open", 61000000001))
+        self.assertEqual([(line["line_item_id"], line["quantity"]) for line in fulfillment_order["line_items"]],
+                         [(1310000000001, 2), (1310000000002, 1)])
+
+        gift_card_data = json.loads(queue_lines[1].order_data)
+        self.assertIsNone(gift_card_data["customer"])
+        self.assertTrue(gift_card_data["line_items"][0]["gift_card"])
+        self.assertEqual(gift_card_data["line_items"][0]["fulfillment_status"], "fulfilled")
+        self.assertEqual(gift_card_data["transaction"][0]["gateway"], "gift_card")
+        self.assertEqual(gift_card_data["fulfillment_data"], [])
@@ -16,7 +16,6 @@ from odoo.tools.misc import split_every
 from odoo import models, fields, api, _
 from odoo.addons.web_editor.tools import get_video_embed_code
 from .. import shopify
-from ..shopify.pyactiveresource.connection import ClientError
 
 _logger = logging.getLogger("Shopify Operations")
 
@@ -95,6 +94,10 @@ class ShopifyProcessImportExport(models.TransientModel):
     shopify_video_embed_code = fields.Html(compute="_compute_shopify_video_embed_code", sanitize=False)
     is_import_draft_product = fields.Boolean(default=False, string='Import Draft products',
                                              help="If you mark it, It will be import draft products")
+    use_bulk_operation = fields.Boolean(string="Import via Bulk Operation", default=False,
+                                        help="If you mark it, the records are exported by a Shopify bulk operation "
+                                             "and the queues are created in the background once it is completed. "
+                                             "Recommended for the initial import of a large store.")
 
     @api.depends('shopify_video_url')
     def _compute_shopify_video_embed_code(self):
@@ -120,6 +123,9 @@ class ShopifyProcessImportExport(models.TransientModel):
         queue_ids = False
 
         instance = self.shopify_instance_id
+        if self.use_bulk_operation and self.shopify_operation in ["sync_product", "import_unshipped_orders",
+                                                                  "import_shipped_orders"]:
+            return self.shopify_submit_bulk_import(instance)
         if self.shopify_operation == "sync_product":
             product_queue_ids = product_data_queue_obj.with_context(queue_created_by="manual").shopify_create_product_data_queue(
                 instance, self.import_products_based_on_date, self.orders_from_date, self.orders_to_date,
@@ -448,11 +454,6 @@ class ShopifyProcessImportExport(models.TransientModel):
                     page_info = page_link.split(';')[0].strip('<>').split('page_info=')[1]
                     try:
                         result = shopify.Customer().find(page_info=page_info, limit=250)
-                    except ClientError as error:
-                        if hasattr(error, "response"):
-                            if error.response.code == 429 and error.response.msg == "Too Many Requests":
-                                time.sleep(int(float(error.response.headers.get('Retry-After', 5))))
-                                result = shopify.Customer().find(page_info=page_info, limit=250)
                     except Exception as error:
                         raise UserError(error)
                     if result:
@@ -473,9 +474,45 @@ class ShopifyProcessImportExport(models.TransientModel):
         to_date = datetime.now()
         if not from_date:
             from_date = to_date - timedelta(3)
-        sale_order_obj.import_shopify_cancel_order(instance, from_date, to_date)
+        self.env["shopify.cron.scheduler.ept"].run_instance_job(instance, "import_cancel_order",
+                                                                sale_order_obj.import_shopify_cancel_order, instance,
+                                                                from_date, to_date)
         return True
 
+    def shopify_submit_bulk_import(self, instance):
+        """
+        This method is used to start a Shopify bulk operation for the selected import operation, the queues are
+        created by the scheduled action once Shopify has exported the records.
+        """
+        bulk_operation_obj = self.env["shopify.bulk.operation.ept"]
+        from_date = self.orders_from_date.strftime('%Y-%m-%dT%H:%M:%SZ')
+        to_date = (self.orders_to_date or datetime.now()).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if self.shopify_operation == "sync_product":
+            date_field = "created_at" if self.import_products_based_on_date == "create_date" else "updated_at"
+            statuses = "status:active OR status:draft" if self.is_import_draft_product else "status:active"
+            search_query = "%s:>='%s' AND %s:<='%s' AND (%s)" % (date_field, from_date, date_field, to_date,
+                                                                 statuses)
+            bulk_operation_obj.shopify_submit_bulk_operation(instance, "product", search_query,
+                                                             skip_existing_product=self.skip_existing_product)
+        else:
+            queue_type = "shipped" if self.shopify_operation == "import_shipped_orders" else "unshipped"
+            if queue_type == "shipped":
+                fulfillment_statuses = ["shipped"]
+            else:
+                fulfillment_statuses = instance.shopify_order_status_ids.mapped("status") or ["unshipped"]
+            search_query = "updated_at:>='%s' AND updated_at:<='%s' AND (%s)" % (
+                from_date, to_date, " OR ".join("fulfillment_status:%s" % status for status in fulfillment_statuses))
+            bulk_operation_obj.shopify_submit_bulk_operation(instance, "order", search_query, queue_type=queue_type)
+        return {
+            'effect': {
+                'fadeout': 'slow',
+                'message': _("Bulk operation is started, the queues will be created once Shopify has exported "
+                             "the records."),
+                'img_url': '/web/static/img/smile.svg',
+                'type': 'rainbow_man',
+            }
+        }
+
     @api.model
     def update_stock_in_shopify(self, ctx=False):
         """
@@ -529,6 +566,10 @@ class ShopifyProcessImportExport(models.TransientModel):
         if not instance and ctx.get('shopify_instance_id'):
             instance_id = ctx.get('shopify_instance_id')
             instance = shopify_instance_obj.browse(instance_id)
+            if not self._context.get("shopify_instance_job"):
+                return self.env["shopify.cron.scheduler.ept"].run_instance_job(
+                    instance, "export_stock", self.with_context(shopify_instance_job=True).shopify_export_stock_queue,
+                    ctx)
 
         if not instance:
             raise UserError(_("Shopify instance not found.\nPlease select one, if you are processing from Operations"
@@ -541,8 +582,19 @@ class ShopifyProcessImportExport(models.TransientModel):
             last_update_date = instance.shopify_last_date_update_stock or datetime.now() - timedelta(30)
             _logger.info("Exporting Stock by Cron for instance - %s", instance.name)
 
-        products = product_obj.get_products_based_on_movement_date_ept(last_update_date,
-                                                                       instance.shopify_company_id)
+        journal_obj = self.env['stock.change.journal.ept']
+        journal_cursor = instance.shopify_stock_journal_cursor
+        if not self.export_stock_from and journal_cursor:
+            # The cron consumes only the stock changes journaled since its last run, instead of scanning the moves.
+            warehouses = self.env['shopify.location.ept'].search(
+                [('instance_id', '=', instance.id), ('legacy', '=', False)]).export_stock_warehouse_ids
+            products, journal_cursor = journal_obj.get_changed_products_ept(journal_cursor, warehouses)
+        else:
+            journal_cursor = journal_obj.get_last_journal_cursor_ept()
+            products = product_obj.get_products_based_on_movement_date_ept(last_update_date,
+                                                                           instance.shopify_company_id)
+        if not self.export_stock_from:
+            instance.shopify_stock_journal_cursor = journal_cursor
 
         # find shopify product which has Fixed Stock Export boolean is true
         fixed_stock_products = self.search_product_for_fixed_stock_export(instance)
@@ -652,7 +704,8 @@ class ShopifyProcessImportExport(models.TransientModel):
         instance = self.env['shopify.instance.ept'].browse(instance_id)
         _logger.info(
             _("Auto cron update order status process start with instance: '%s'"), instance.name)
-        self.update_order_status(instance)
+        self.env["shopify.cron.scheduler.ept"].run_instance_job(instance, "update_order_status",
+                                                                self.update_order_status, instance)
         return True
 
     @api.onchange("shopify_instance_id", "shopify_operation")
@@ -936,3 +989,6 @@ class ShopifyProcessImportExport(models.TransientModel):
                                                  "schedule for this process will run in %s minutes." % res.get('result')
             elif res and res.get('reason'):
                 self.cron_process_notification = res.get('reason')
+            if self.env["shopify.cron.scheduler.ept"].is_instance_job_running(self.shopify_instance_id):
+                self.cron_process_notification = "A scheduled job of this instance is running, this process may " \
+                                                 "wait for it or import the same records."
@@ -397,6 +397,17 @@ class ResConfigSettings(models.TransientModel):
                                          "that shows the Colorado delivery fees applied.")
 
     show_net_profit_report = fields.Boolean(config_parameter="shopify_ept.show_net_profit_report")
+    shopify_parallel_order_queue = fields.Boolean("Process Order Queue in Parallel",
+                                                  config_parameter="shopify_ept.parallel_order_queue",
+                                                  help="If checked, the order queue cron claims small batches of "
+                                                       "queue lines with row locks, so several workers can process "
+                                                       "the same queue at the same time.")
+    shopify_order_queue_workers = fields.Integer("Order Queue Workers", default=1,
+                                                 config_parameter="shopify_ept.order_queue_workers",
+                                                 help="Number of workers started by one run of the order queue cron.")
+    shopify_order_queue_claim_size = fields.Integer("Order Queue Claim Size", default=5,
+                                                    config_parameter="shopify_ept.order_queue_claim_size",
+                                                    help="Number of order queue lines claimed by a worker at once.")
     is_shopify_digest = fields.Boolean(help="If checked, Then it will send periodic digest per KPI.")
     is_delivery_multi_warehouse = fields.Boolean(string="Is Delivery from Multiple warehouse?",
                                                  help="If checked, It will update order status based on "
@@ -447,6 +458,10 @@ class ResConfigSettings(models.TransientModel):
 
     shopify_instance_product_category = fields.Many2one("product.category", string="Default product category",
                                                         help="Select product category")
+    shopify_bulk_export_stock = fields.Boolean("Export Stock in Bulk",
+                                               help="If checked, stock is exported with batched GraphQL "
+                                                    "inventorySetQuantities mutations of up to 250 items, instead of "
+                                                    "one REST call per variant and location.")
 
     @api.onchange("shopify_instance_id")
     def onchange_shopify_instance_id(self):
@@ -510,6 +525,7 @@ class ResConfigSettings(models.TransientModel):
             self.credit_note_payment_journal = instance.credit_note_payment_journal or False
             self.auto_create_product_category = instance.auto_create_product_category or False
             self.shopify_instance_product_category = instance.shopify_instance_product_category or False
+            self.shopify_bulk_export_stock = instance.shopify_bulk_export_stock
 
     def execute(self):
         """This method used to set value in an instance of configuration.
@@ -583,6 +599,7 @@ class ResConfigSettings(models.TransientModel):
             values['credit_note_payment_journal'] = self.credit_note_payment_journal or False
             values['auto_create_product_category'] = self.auto_create_product_category or False
             values['shopify_instance_product_category'] = self.shopify_instance_product_category or False
+            values['shopify_bulk_export_stock'] = self.shopify_bulk_export_stock
 
 
             product_webhook_changed = customer_webhook_changed = order_webhook_changed = False